@@ -3,13 +3,22 @@
 
 from components import TransformComponent, PhysicsComponent
 from vec2 import Vec2
-import pygame
 
 class Agar:
-    def __init__(self, position=Vec2(), initialRadius=25, color=(255, 255, 0)):
-        self.transform = TransformComponent(position, scale=initialRadius)
+    def __init__(self, position=None, initialRadius=25, color=(255, 255, 0)):
+        self.transform = TransformComponent(position if position is not None else Vec2(), scale=initialRadius)
         self.physics = PhysicsComponent()
         self.color = color
+        self.entityId = None
+        # Where the agar started this tick, so fast movers can be swept instead of tested only where they land
+        self.previousPosition = self.transform.position.Copy()
+
+    def Reset(self, position, radius, color):
+        self.physics.Reset()
+        self.transform.Reset(position, scale=radius)
+        self.color = color
+        self.previousPosition = self.previousPosition.Set(self.transform.position.x, self.transform.position.y)
+        return self
     
     def CollidesWith(self, targetCenter, targetRadius):
         dx = targetCenter.x - self.transform.position.x
@@ -18,13 +27,4 @@ class Agar:
         dist2 = dx*dx + dy*dy
         
         radiusSum = self.transform.scale + targetRadius
-        return dist2 <= radiusSum * radiusSum
-
-    def Draw(self, surface: pygame.Surface, deltaTime=0.016, offset=Vec2()):
-        self.transform.position += offset
-        self.physics.Update(self.transform, deltaTime)
-
-        pygame.draw.circle(surface, self.color, 
-                           self.transform.position.AsTuple(),
-                           self.transform.scale, 3)
-        self.transform.position -= offset
\ No newline at end of file
+        return dist2 <= radiusSum * radiusSum
\ No newline at end of file
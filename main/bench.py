@@ -0,0 +1,892 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from math import cos, sin, pi
+from random import Random
+from broadphase import BruteForce, SpatialHash, SweepAndPrune
+from components import TransformComponent, PhysicsComponent
+from physicsworld import PhysicsWorld
+from partition import PartitionedWorld
+from contact import ContactManager
+from collisions import (AABBCollision, SATCollision, PolygonCollision, PolygonCircleCollision, PackPolygons,
+                        BatchSATCollision, SweptCircleTOI, ClosestPointOnPolygon)
+from shape import Shape, CacheHitRate, ResetCacheStats
+from agar import Agar
+from vec2 import Vec2, CountAllocations
+from world import World, PlayerInput
+from server import Server
+from net import Client, PlayerPredictor, DequantizeEntity
+from profiling import PhaseTimer, Percentile
+from replay import Recorder, Replay, WorldChecksum
+from snapshot import SaveWorld, LoadWorld, SaveFile, LoadFile
+from chunks import SHAPE_FIELDS
+from reference import PartitionReference
+
+# Checks print inline with their timings, failures are also collected so the run exits nonzero
+failures = []
+
+def Verdict(ok, name, bad="MISMATCH"):
+    if not ok:
+        failures.append(name)
+    return "ok" if ok else bad
+
+def MakeShapes(count, seed=0, density=0.00005):
+    rng = Random(seed)
+    half = (count / density) ** 0.5 / 2
+    shapes = []
+    for _ in range(count):
+        position = Vec2(rng.uniform(-half, half), rng.uniform(-half, half))
+        shape = Shape(position, rng.randint(3, 8), rng.randint(25, 100))
+        shape.transform.rotation = rng.uniform(0, 360)
+        shapes.append(shape)
+    return shapes
+
+def CollidingPairs(shapes, pairs):
+    return {(id(a), id(b)) for a, b in pairs
+            if AABBCollision(a, b) and SATCollision(a, b) is not None}
+
+def BenchBroadphase(counts=(100, 1000, 10000), bruteForceLimit=1000):
+    for count in counts:
+        shapes = MakeShapes(count)
+        expected = None
+        if count <= bruteForceLimit:
+            brute = BruteForce()
+            brute.Update(shapes)
+            expected = CollidingPairs(shapes, brute.Pairs())
+
+        for broadphase in (BruteForce(), SpatialHash(), SweepAndPrune()):
+            name = type(broadphase).__name__
+            if isinstance(broadphase, BruteForce) and count > bruteForceLimit:
+                print(f"{count:>6} {name:<14} skipped")
+                continue
+
+            start = time.perf_counter()
+            broadphase.Update(shapes)
+            pairs = broadphase.Pairs()
+            broadTime = time.perf_counter() - start
+
+            parity = "-"
+            if expected is not None:
+                parity = Verdict(CollidingPairs(shapes, pairs) == expected, f"broadphase {name} {count}")
+
+            frame = [shape.Copy() for shape in shapes]
+            ResetCacheStats()
+            start = time.perf_counter()
+            broadphase.Update(frame)
+            for shapeA, shapeB in broadphase.Pairs():
+                PolygonCollision(shapeA, shapeB)
+            frameTime = time.perf_counter() - start
+
+            print(f"{count:>6} {name:<14} pairs={len(pairs):<9} "
+                  f"broadphase={broadTime * 1000:8.2f}ms frame={frameTime * 1000:9.2f}ms "
+                  f"cacheHits={CacheHitRate():.0%} parity={parity}")
+
+def MakeBullets(count, shapes, seed=1):
+    rng = Random(seed)
+    bullets = []
+    for _ in range(count):
+        target = shapes[rng.randrange(len(shapes))].transform.position
+        position = Vec2(target.x + rng.uniform(-150, 150), target.y + rng.uniform(-150, 150))
+        bullets.append(Agar(position, 15, (255, 0, 0)))
+    return bullets
+
+def BulletHits(bullets, query):
+    hits = []
+    for bullet in bullets:
+        hit = None
+        for shape in query(bullet):
+            probe = Agar(bullet.transform.position.Copy(), bullet.transform.scale)
+            if PolygonCircleCollision(shape, probe):
+                hit = id(shape)
+                break
+        hits.append(hit)
+    return hits
+
+def BenchBulletQueries(shapeCounts=(100, 1000, 10000), bulletCount=500, bruteForceLimit=1000):
+    for count in shapeCounts:
+        shapes = MakeShapes(count)
+        bullets = MakeBullets(bulletCount, shapes)
+        index = SpatialHash()
+        index.Update(shapes)
+
+        queries = [("SpatialHash", lambda bullet: index.QueryCircle(bullet.transform.position,
+                                                                  bullet.transform.scale))]
+        if count <= bruteForceLimit:
+            queries.insert(0, ("BruteForce", lambda bullet: shapes))
+
+        results = {}
+        for name, query in queries:
+            start = time.perf_counter()
+            results[name] = BulletHits(bullets, query)
+            elapsed = time.perf_counter() - start
+            print(f"{count:>6} shapes {bulletCount} bullets {name:<12} {elapsed * 1000:9.2f}ms")
+
+        if "BruteForce" in results:
+            parity = Verdict(results["BruteForce"] == results["SpatialHash"], f"bullets {count}")
+            print(f"{count:>6} shapes parity={parity}")
+
+def BenchSweptBullets(speeds=(1500, 3000, 6000), tickRates=(60, 20), shapeCount=2000, bulletCount=2000, radius=15):
+    # Small shapes and fast bullets aimed straight through them, counted once per tick position and once swept
+    rng = Random(4)
+    shapes = [Shape(Vec2(rng.uniform(-5000, 5000), rng.uniform(-5000, 5000)), rng.randint(3, 8), 12)
+              for _ in range(shapeCount)]
+    index = SpatialHash()
+    index.Update(shapes)
+
+    for tickRate in tickRates:
+        for speed in speeds:
+            step = speed / tickRate
+            moves = []
+            for _ in range(bulletCount):
+                target = rng.choice(shapes).transform.position
+                angle = rng.uniform(0, 2 * pi)
+                direction = Vec2(cos(angle), sin(angle))
+                # The shape center lies somewhere on the tick's motion, so every bullet should score a hit
+                start = target - direction * (step * rng.random())
+                moves.append((start, start + direction * step))
+
+            start = time.perf_counter()
+            discrete = sum(1 for a, b in moves
+                           if any(ClosestPointOnPolygon(shape.GetPoints(), b.x, b.y)[1] < radius * radius
+                                  for shape in index.QueryCircle(b, radius)))
+            discreteTime = time.perf_counter() - start
+
+            start = time.perf_counter()
+            swept = sum(1 for a, b in moves
+                        if any(SweptCircleTOI(shape.GetPoints(), a, b, radius) is not None
+                               for shape in index.QuerySweptCircle(a, b, radius)))
+            sweptTime = time.perf_counter() - start
+
+            print(f"{tickRate:>3}Hz speed {speed:>5} ({step:6.1f}px/tick) "
+                  f"discrete {discrete / bulletCount:6.1%} {discreteTime * 1000:7.2f}ms  "
+                  f"swept {swept / bulletCount:6.1%} {sweptTime * 1000:7.2f}ms")
+
+def BenchSpawn(counts=(100, 1000, 10000, 100000), calls=2000, ticks=600):
+    # Cost of one spawn search with the world already holding `count` shapes around the player
+    for count in counts:
+        world = World(seed=0)
+        world.shapes = MakeShapes(count, density=0.00002)
+        world.broadphase.Update(world.shapes)
+        world.MAX_SHAPES = count + calls
+        world.SHAPES_PER_CELL = 1000
+
+        start = time.perf_counter()
+        found = 0
+        for _ in range(calls):
+            found += world.FindSpawnPosition(world.random.randint(25, 100)) is not None
+        elapsed = time.perf_counter() - start
+        print(f"{count:>7} shapes search={elapsed / calls * 1e6:7.1f}us found={found / calls:6.1%}")
+
+    # Every spawn over a long run checked against everything alive at that moment
+    world = World(seed=0)
+    overlaps = spawned = 0
+    for tick in range(ticks):
+        before = set(map(id, world.shapes))
+        world.Step(1 / 60, DenseFieldInput(tick))
+        for shape in world.shapes:
+            if id(shape) in before:
+                continue
+            spawned += 1
+            position, radius = shape.transform.position, shape.GetBoundingRadius()
+            for other in world.shapes:
+                if other is not shape and (other.transform.position - position).Length() < radius + other.GetBoundingRadius():
+                    overlaps += 1
+    print(f"{ticks} ticks: {spawned} new shapes, {overlaps} overlapping at spawn, {len(world.shapes)} alive")
+
+def MakePile(count, seed=7):
+    # A tight hexagonal clump, neighbours overlapping slightly, so every shape starts in contact
+    rng = Random(seed)
+    side = int(count ** 0.5) + 1
+    shapes = []
+    for i in range(count):
+        row, column = divmod(i, side)
+        position = Vec2((column + 0.5 * (row % 2)) * 70.0, row * 61.0)
+        shape = Shape(position, rng.randint(3, 8), 38)
+        shape.transform.rotation = rng.uniform(0, 360)
+        shapes.append(shape)
+    return shapes
+
+def BenchContacts(counts=(100, 400), ticks=300, measureTicks=120, deltaTime=1 / 60, pull=400.0):
+    # A pile held together by a pull toward its centre, the closest thing to a resting stack a top-down world has
+    solvers = [("legacy", None),
+               ("1 iter", lambda: ContactManager(iterations=1, warmStart=False)),
+               ("8 iter", lambda: ContactManager(iterations=8, warmStart=False)),
+               ("8 iter warm", lambda: ContactManager(iterations=8)),
+               ("8 iter warm numpy", lambda: ContactManager(iterations=8, batched=True))]
+    for count in counts:
+        for name, MakeSolver in solvers:
+            shapes = MakePile(count)
+            for shape in shapes:
+                shape.physics.SLEEP_TICKS = float("inf")
+            cx = sum(shape.transform.position.x for shape in shapes) / count
+            cy = sum(shape.transform.position.y for shape in shapes) / count
+            broadphase = SpatialHash()
+            solver = MakeSolver() if MakeSolver else None
+            touching = set()
+            solveTime = speed = penetration = churn = 0.0
+
+            for tick in range(ticks):
+                for shape in shapes:
+                    position, velocity = shape.transform.position, shape.physics.linearVelocity
+                    dx, dy = cx - position.x, cy - position.y
+                    distance = max((dx * dx + dy * dy) ** 0.5, 1.0)
+                    shape.physics.linearVelocity = velocity.Set(velocity.x + dx / distance * pull * deltaTime,
+                                                                velocity.y + dy / distance * pull * deltaTime)
+                    shape.physics.Update(shape.transform, deltaTime)
+                broadphase.Update(shapes)
+                pairs = broadphase.Pairs()
+
+                start = time.perf_counter()
+                if solver is None:
+                    current = {(id(a), id(b)) for a, b in pairs if PolygonCollision(a, b)}
+                    created = len(current - touching)
+                    touching = current
+                else:
+                    solver.Step(pairs)
+                    created = solver.created
+                elapsed = time.perf_counter() - start
+
+                if tick >= ticks - measureTicks:
+                    solveTime += elapsed
+                    churn += created
+                    speed += sum(shape.physics.linearVelocity.Length() for shape in shapes) / count
+                    overlaps = [result[1] for a, b in pairs if (result := SATCollision(a, b)) is not None]
+                    penetration += max(overlaps, default=0.0)
+
+            print(f"{count:>5} shapes {name:<18} solve={solveTime / measureTicks * 1000:7.2f}ms "
+                  f"meanSpeed={speed / measureTicks:7.2f} maxPenetration={penetration / measureTicks:6.2f} "
+                  f"newContacts/tick={churn / measureTicks:6.2f}")
+
+def BenchChunks(ticks=6000, window=500):
+    # Walk far out and back again: step cost should follow the active area, not how much world has been seen
+    results = {}
+    for name, directory in (("memory", None), ("disk", tempfile.mkdtemp())):
+        world = World(seed=0, chunkDirectory=directory)
+        world.SHAPES_PER_CELL = 4
+        startIds = None
+        elapsed = 0.0
+        print(f"-- {name} store")
+        for tick in range(ticks):
+            direction = 1 if tick < ticks // 2 else -1
+            start = time.perf_counter()
+            world.Step(1 / 60, PlayerInput(move=Vec2(direction, 0)))
+            elapsed += time.perf_counter() - start
+            if tick == window:
+                startIds = {shape.entityId for shape in world.shapes}
+            if (tick + 1) % window == 0:
+                parked = world.chunks.StoredBytes() // (len(SHAPE_FIELDS) * 8)
+                print(f"tick {tick + 1:>5} x={world.player.transform.position.x:8.0f} "
+                      f"step={elapsed / window * 1000:6.2f}ms live={len(world.shapes):4} "
+                      f"parkedChunks={len(world.chunks):3} parkedShapes={parked:5} "
+                      f"stored={world.chunks.StoredBytes() / 1024:7.1f}KB")
+                elapsed = 0.0
+        back = startIds & {shape.entityId for shape in world.shapes}
+        print(f"back at the start: {len(back)} of the {len(startIds)} shapes seen there are live again")
+        results[name] = WorldChecksum(world)
+    print(f"memory and disk stores agree: {results['memory'] == results['disk']}")
+
+def BenchSleep(counts=(500, 2000), settleTicks=60, ticks=60, deltaTime=1 / 60, kickEvery=10):
+    # A settled pile, every shape resting against its neighbours, with one shape pushed every few ticks
+    defaultTicks = PhysicsComponent.SLEEP_TICKS
+    for count in counts:
+        results = []
+        for name, sleepTicks in (("awake", float("inf")), ("sleep", defaultTicks)):
+            PhysicsComponent.SLEEP_TICKS = sleepTicks
+            world = World(800, 600, seed=0)
+            # No player, only the kicks disturb the pile
+            world.RemovePlayer(world.player)
+            world.shapes = MakePile(count)
+            for _ in range(settleTicks):
+                world.UpdateShapes(deltaTime)
+                world.HandleCollisions()
+            rng = Random(5)
+            timer = world.timer = PhaseTimer()
+
+            start = time.perf_counter()
+            for tick in range(ticks):
+                if tick % kickEvery == 0:
+                    shape = rng.choice(world.shapes)
+                    shape.physics.linearVelocity = Vec2(rng.uniform(-300, 300), rng.uniform(-300, 300))
+                    shape.physics.Wake()
+                world.UpdateShapes(deltaTime)
+                world.HandleCollisions()
+                counters = timer.counters
+                timer.EndFrame()
+            elapsed = (time.perf_counter() - start) / ticks
+            results.append(f"{name} {elapsed * 1000:7.2f}ms/tick")
+            if name == "sleep":
+                results.append(f"pairs={counters.get('BroadphasePairs', 0)} "
+                               f"sleepingShapes={counters.get('SleepingShapes', 0)} "
+                               f"skippedPairs={counters.get('SleepingPairs', 0)}")
+        print(f"{count:>6} shapes  " + "  ".join(results))
+    PhysicsComponent.SLEEP_TICKS = defaultTicks
+
+def MakeBodies(count, seed=2):
+    rng = Random(seed)
+    bodies = []
+    for _ in range(count):
+        transform = TransformComponent(Vec2(rng.uniform(-5000, 5000), rng.uniform(-5000, 5000)),
+                                       rng.uniform(0, 360))
+        physics = PhysicsComponent(Vec2(rng.uniform(-300, 300), rng.uniform(-300, 300)),
+                                   rng.uniform(-50, 50))
+        bodies.append((transform, physics))
+    return bodies
+
+def BenchPhysics(counts=(1000, 10000, 50000), ticks=10, deltaTime=1 / 60, worldCounts=(1000, 5000), worldTicks=30):
+    for count in counts:
+        bodies = MakeBodies(count)
+        world = PhysicsWorld(count)
+        for transform, physics in bodies:
+            world.Add(transform, physics)
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            for transform, physics in bodies:
+                physics.Update(transform, deltaTime)
+        objectTime = (time.perf_counter() - start) / ticks
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            world.Step(deltaTime)
+        worldTime = (time.perf_counter() - start) / ticks
+
+        error = max(abs(transform.position.x - body.transform.position.x) +
+                    abs(transform.position.y - body.transform.position.y)
+                    for (transform, _), body in zip(bodies, world.bodies))
+        print(f"{count:>6} bodies per-object={objectTime * 1000:9.2f}ms/tick "
+              f"PhysicsWorld={worldTime * 1000:7.2f}ms/tick maxError={error:.2e}")
+
+    # The same shapes moved and collided by a World, once on their own components and once attached to a PhysicsWorld
+    for count in worldCounts:
+        results = []
+        for name, physicsWorld in (("components", None), ("PhysicsWorld", PhysicsWorld(count))):
+            world = World(800, 600, seed=0, physicsWorld=physicsWorld)
+            rng = Random(3)
+            world.shapes = MakeShapes(count)
+            for shape in world.shapes:
+                shape.physics.linearVelocity = Vec2(rng.uniform(-300, 300), rng.uniform(-300, 300))
+            world.AttachShapes(world.shapes)
+
+            start = time.perf_counter()
+            for _ in range(worldTicks):
+                world.UpdateShapes(deltaTime)
+                world.HandleCollisions()
+            results.append(f"{name}={(time.perf_counter() - start) / worldTicks * 1000:7.2f}ms/tick")
+        print(f"{count:>6} shapes in a World  " + "  ".join(results))
+
+def BenchBatchSAT(counts=(1000, 10000), density=0.0002):
+    for count in counts:
+        shapes = MakeShapes(count, density=density)
+        broadphase = SpatialHash()
+        broadphase.Update(shapes)
+        pairs = broadphase.Pairs()
+        for shape in shapes:
+            shape.GetPoints()
+
+        start = time.perf_counter()
+        scalar = [SATCollision(a, b) for a, b in pairs]
+        scalarTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pointsA, centersA = PackPolygons([a for a, _ in pairs])
+        pointsB, centersB = PackPolygons([b for _, b in pairs])
+        packTime = time.perf_counter() - start
+        indices, normals, penetrations = BatchSATCollision(pointsA, pointsB, centersA, centersB)
+        batchTime = time.perf_counter() - start
+
+        expected = [i for i, result in enumerate(scalar) if result is not None]
+        # Normals may legitimately differ when two axes tie for the smallest overlap, so compare depths
+        error = max((abs(scalar[i][1] - p) for i, p in zip(indices.tolist(), penetrations.tolist())), default=0.0)
+        parity = Verdict(expected == indices.tolist() and error < 1e-6, f"sat {count}")
+        print(f"{count:>6} shapes pairs={len(pairs):<7} colliding={len(expected):<6} scalar={scalarTime * 1000:8.2f}ms "
+              f"batch={batchTime * 1000:7.2f}ms (pack {packTime * 1000:.2f}ms) parity={parity}")
+
+def PartitionError(world, shapes):
+    # Largest difference between the world's rows and the shapes, relative to the size of the values
+    arrays = world.arrays
+    error = 0.0
+    for index, shape in enumerate(shapes):
+        (x, y), (vx, vy) = arrays["positions"][index], arrays["velocities"][index]
+        position, velocity = shape.transform.position, shape.physics.linearVelocity
+        for actual, expected in ((x, position.x), (y, position.y), (vx, velocity.x), (vy, velocity.y),
+                                 (arrays["angularVelocities"][index], shape.physics.angularVelocity)):
+            error = max(error, abs(float(actual) - expected) / max(1.0, abs(expected)))
+    return error
+
+def BenchPartition(count=20000, ticks=20, deltaTime=1 / 60, density=0.0002, maxWorkers=None):
+    shapes = MakeShapes(count, density=density)
+    rng = Random(3)
+    for shape in shapes:
+        shape.physics.linearVelocity = Vec2(rng.uniform(-200, 200), rng.uniform(-200, 200))
+    half = (count / density) ** 0.5 / 2
+
+    # Worker counts are compared with each other over the whole run. Against the scalar code only one tick of a
+    # pile is compared: the field above has shapes swallowed whole, where SAT axes tie and either pick is right
+    pile = MakePile(2000)
+    for shape in pile:
+        shape.physics.linearVelocity = Vec2(rng.uniform(-200, 200), rng.uniform(-200, 200))
+    pileMinX = min(shape.transform.position.x for shape in pile)
+    pileMaxX = max(shape.transform.position.x for shape in pile)
+    scalar = PartitionReference(pile, deltaTime)
+
+    reference = None
+    for workers in range(1, (maxWorkers or os.cpu_count() or 1) + 1):
+        with PartitionedWorld(len(pile), workers, pileMinX, pileMaxX) as world:
+            for shape in pile:
+                world.Add(shape)
+            world.Step(deltaTime)
+            scalarError = PartitionError(world, scalar)
+
+        with PartitionedWorld(count, workers, -half, half) as world:
+            for shape in shapes:
+                world.Add(shape)
+            start = time.perf_counter()
+            resolved = 0
+            for _ in range(ticks):
+                world.Step(deltaTime)
+                resolved += world.resolved
+            elapsed = time.perf_counter() - start
+            positions = world.arrays["positions"][:count].copy()
+            handoffs = world.handoffs
+
+        if reference is None:
+            reference = positions
+        error = float(abs(positions - reference).max())
+        print(f"{workers:>2} workers {count} bodies {ticks / elapsed:8.1f} ticks/s "
+              f"resolved={resolved} handoffs={handoffs} maxDiffVs1={error:.2e} "
+              f"scalar={Verdict(scalarError < 1e-6, f'partition {workers} workers')} ({scalarError:.1e})")
+
+def CountCallAllocations(call):
+    CountAllocations(True)
+    start = Vec2.allocations
+    call()
+    count = Vec2.allocations - start
+    CountAllocations(False)
+    return count
+
+def BenchRender(counts=(1000, 10000), frames=30, density=0.0005):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from renderer import Renderer, LoadFont
+
+    pygame.display.init()
+    screen = pygame.display.set_mode((800, 600))
+    font = LoadFont(16)
+
+    for count in counts:
+        world = World(800, 600, seed=0)
+        world.shapes = MakeShapes(count, density=density)
+
+        def Everything(renderer):
+            offset = Vec2(400, 300) - world.player.transform.position
+            for shape in world.shapes:
+                renderer.DrawShape(shape, offset)
+
+        def Culled(renderer):
+            renderer.Draw(world, 60, Vec2(400, 300))
+
+        results = []
+        for name, draw in (("everything", Everything), ("culled", Culled)):
+            renderer = Renderer(screen, font)
+            draw(renderer)
+            start = time.perf_counter()
+            for frame in range(frames):
+                for shape in world.shapes:
+                    shape.transform.rotation += 1.0
+                draw(renderer)
+            results.append(f"{name} {(time.perf_counter() - start) / frames * 1000:.2f}ms")
+        print(f"{count:>6} shapes  " + "  ".join(results) + f"  drawn={renderer.drawn} culled={renderer.culled}")
+
+    pygame.quit()
+
+STARTUP_MODULES = ("collisions", "world", "snapshot", "replay", "server", "renderer", "game")
+
+def TimeFreshProcess(code, runs):
+    # A fresh interpreter each run, nothing is already imported; the fastest run is the least noisy
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), env=environment).stdout
+        results.append(output.split())
+    return min(results, key=lambda result: float(result[0]))
+
+def BenchStartup(runs=5):
+    for module in STARTUP_MODULES:
+        elapsed, numpy, pygame = TimeFreshProcess(
+            f"import sys, time\nstart = time.perf_counter()\nimport {module}\n"
+            f"print(time.perf_counter() - start, 'numpy' in sys.modules, 'pygame' in sys.modules)", runs)
+        print(f"import {module:<11} {float(elapsed) * 1000:7.1f}ms  numpy={numpy:<5} pygame={pygame}")
+
+    elapsed, = TimeFreshProcess("import time\nimport game\nstart = time.perf_counter()\ngame.Game()\n"
+                                "print(time.perf_counter() - start)", runs)
+    print(f"Game() startup      {float(elapsed) * 1000:7.1f}ms")
+    elapsed, = TimeFreshProcess("import time, warnings\nimport pygame\nwarnings.simplefilter('ignore')\n"
+                                "start = time.perf_counter()\npygame.init()\npygame.font.SysFont('Consolas', 16)\n"
+                                "print(time.perf_counter() - start)", runs)
+    print(f"pygame.init()+SysFont {float(elapsed) * 1000:5.1f}ms  (what Game() used to do)")
+
+async def SimulateClients(clientCount, ticks, delta, seed=0):
+    server = Server(World(seed=seed), delta=delta)
+    port = await server.Start()
+    clients = [Client() for _ in range(clientCount)]
+    for client in clients:
+        await client.Connect("127.0.0.1", port)
+    while len(server.clients) < clientCount:
+        await asyncio.sleep(0)
+
+    rng = Random(seed)
+    mismatches = 0
+    for tick in range(ticks):
+        for client in clients:
+            client.Send(PlayerInput(Vec2(rng.uniform(-1, 1), rng.uniform(-1, 1)),
+                                    Vec2(rng.uniform(-1, 1), rng.uniform(-1, 1)), rng.random() < 0.5))
+        await asyncio.sleep(0)
+        server.Tick()
+        for client in clients:
+            states = await client.Receive()
+            connection = next(c for c in server.clients if c.player.entityId == client.decoder.playerId)
+            mismatches += states != connection.encoder.history[client.decoder.tick]
+
+    sent = sum(connection.bytesSent for connection in server.clients)
+    encodeTime = sum(connection.encodeTime for connection in server.clients)
+    entities = len(server.world.shapes) + len(server.world.bullets) + len(server.world.players)
+    for client in clients:
+        await client.Close()
+    await server.Close()
+    return sent / clientCount / ticks, encodeTime / clientCount / ticks, entities, mismatches
+
+async def SimulatePrediction(latency, ticks, tickRate, seed=0, burst=1):
+    server = Server(World(seed=seed), tickRate)
+    port = await server.Start()
+    client = Client(PlayerPredictor(server.world.PLAYER_SPEED, tickRate))
+    await client.Connect("127.0.0.1", port)
+    while not server.clients:
+        await asyncio.sleep(0)
+
+    rng = Random(seed)
+    move = Vec2()
+    staleErrors, predictedErrors, corrections = [], [], []
+    for tick in range(ticks):
+        # A bursty client sends `burst` inputs at once and then nothing until the server has used them up
+        if tick % burst == 0:
+            for _ in range(burst):
+                if client.predictor.sequence % 15 == 0:
+                    move = Vec2(rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1)))
+                client.Send(PlayerInput(move))
+            while server.clients[0].receivedSequence != client.predictor.sequence:
+                await asyncio.sleep(0)
+        server.Tick()
+
+        # Snapshots are read `latency` ticks late, as if they had been in flight that long
+        if tick < latency:
+            continue
+        states = await client.Receive()
+        if tick > latency:
+            # The very first snapshot only moves the predictor from its origin onto the spawn point
+            corrections.append(client.predictor.correction)
+        truth = server.clients[0].player.transform.position
+        stale = DequantizeEntity(states[client.decoder.playerId])[4]
+        staleErrors.append((stale - truth).Length())
+        predictedErrors.append((client.predictor.player.transform.position - truth).Length())
+
+    await client.Close()
+    await server.Close()
+    return staleErrors, predictedErrors, corrections
+
+def BenchPrediction(latencies=(0, 3, 6, 12), ticks=300, tickRate=30, bursts=(1, 2)):
+    for burst in bursts:
+        for latency in latencies:
+            stale, predicted, corrections = asyncio.run(SimulatePrediction(latency, ticks, tickRate, burst=burst))
+            print(f"{burst} inputs/burst latency {latency:>2} ticks ({latency * 1000 // tickRate:>3}ms)  "
+                  f"error without prediction mean={sum(stale) / len(stale):6.1f}px max={max(stale):6.1f}px  "
+                  f"with prediction mean={sum(predicted) / len(predicted):5.2f}px max={max(predicted):5.2f}px  "
+                  f"correction mean={sum(corrections) / len(corrections):5.2f}px max={max(corrections):5.2f}px")
+
+def BenchServer(clientCounts=(1, 8, 32), ticks=150, tickRate=30):
+    for clientCount in clientCounts:
+        results = []
+        for name, delta in (("full", False), ("delta", True)):
+            bytesPerTick, encodeTime, entities, mismatches = asyncio.run(SimulateClients(clientCount, ticks, delta))
+            results.append(f"{name} {bytesPerTick:7.0f}B/tick {bytesPerTick * tickRate * 8 / 1000:7.1f}kbit/s "
+                           f"encode={encodeTime * 1000:.3f}ms")
+        print(f"{clientCount:>3} clients {entities:>4} entities  " + "  ".join(results) +
+              f"  decodeMismatches={mismatches}")
+
+def BenchReplay(scenario="storm", ticks=1800, dt=1 / 60, seeks=(1500, 100, 1799, 900)):
+    # A replay starts from a fresh seeded world, so only the scenario's input is used, not its setup
+    path = os.path.join(tempfile.mkdtemp(), f"{scenario}.gior")
+    makeInput = SCENARIOS[scenario][1]
+    world = World(seed=0)
+    recorder = Recorder(path, world, dt)
+
+    start = time.perf_counter()
+    for tick in range(ticks):
+        recorder.Step(world, dt, makeInput(tick))
+    recorder.Close()
+    recordTime = time.perf_counter() - start
+    print(f"recorded {ticks} steps of {scenario} input in {recordTime:.2f}s, {os.path.getsize(path)} bytes "
+          f"({os.path.getsize(path) / ticks:.1f}B/step)")
+
+    replay = Replay(path, snapshotInterval=300)
+    start = time.perf_counter()
+    replay.Advance()
+    print(f"replayed {len(replay)} steps in {time.perf_counter() - start:.2f}s with every checksum verified")
+
+    for step in seeks:
+        start = time.perf_counter()
+        replay.Seek(step)
+        match = WorldChecksum(replay.world) == replay.checksums[step - 1]
+        print(f"seek to {step:>5} {(time.perf_counter() - start) * 1000:8.1f}ms "
+              f"checksum={Verdict(match, f'replay seek {step}')}")
+
+def BenchSnapshot(counts=(1000, 10000, 100000), bulletFraction=0.1):
+    for count in counts:
+        world = World(seed=0)
+        bulletCount = int(count * bulletFraction)
+        world.shapes = MakeShapes(count - bulletCount)
+        rng = Random(6)
+        for shape in world.shapes:
+            shape.entityId = world.NextEntityId()
+            shape.physics.linearVelocity = Vec2(rng.uniform(-50, 50), rng.uniform(-50, 50))
+        for _ in range(bulletCount):
+            world.SpawnBullet(Vec2(rng.uniform(-1, 1), rng.uniform(-1, 1)))
+
+        start = time.perf_counter()
+        data = SaveWorld(world)
+        saveTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = LoadWorld(data)
+        loadTime = time.perf_counter() - start
+
+        path = os.path.join(tempfile.mkdtemp(), "world.gios")
+        start = time.perf_counter()
+        SaveFile(world, path)
+        LoadFile(path)
+        fileTime = time.perf_counter() - start
+
+        roundTrip = SaveWorld(loaded) == data and WorldChecksum(loaded) == WorldChecksum(world)
+        world.Step(1 / 60, PlayerInput())
+        loaded.Step(1 / 60, PlayerInput())
+        stepped = WorldChecksum(loaded) == WorldChecksum(world)
+        print(f"{count:>7} entities {len(data) / 1e6:6.2f}MB save={saveTime * 1000:8.1f}ms load={loadTime * 1000:8.1f}ms "
+              f"file save+load={fileTime * 1000:8.1f}ms roundTrip={Verdict(roundTrip, f'snapshot {count}')} "
+              f"nextStep={Verdict(stepped, f'snapshot step {count}')}")
+
+def BenchVec2(number=200000):
+    a, b = Vec2(1.5, -2.0), Vec2(0.25, 3.0)
+    cases = [
+        ("a = a + b * s", lambda: a + b * 0.5),
+        ("a.AddScaled(b, s)", lambda: a.AddScaled(b, 0.5)),
+        ("a *= s", lambda: a.__imul__(1.0)),
+        ("-a", lambda: -a),
+        ("a < 2.0", lambda: a < 2.0),
+        ("(a - b).Length() ** 2", lambda: (a - b).Length() ** 2),
+        ("a.DistanceSquared(b)", lambda: a.DistanceSquared(b)),
+    ]
+    for name, call in cases:
+        elapsed = timeit.timeit(call, number=number)
+        print(f"{name:<24} {elapsed / number * 1e9:7.1f}ns  allocations={CountCallAllocations(call)}")
+
+    # Allocation budgets for the hot paths, OVER fails the run if a change starts allocating per vertex again
+    shapeA, shapeB = MakeShapes(2, density=1.0)
+    shapeB.transform.position = shapeA.transform.position + Vec2(10, 0)
+    circle = Agar(shapeA.transform.position + Vec2(5, 5), 15)
+    transform, physics = MakeBodies(1)[0]
+    budgets = [
+        ("PhysicsComponent.Update", lambda: physics.Update(transform, 1 / 60), 0),
+        ("SATCollision", lambda: SATCollision(shapeA, shapeB), 1),
+        ("PolygonCircleCollision", lambda: PolygonCircleCollision(shapeA, circle), 1),
+        ("PolygonCollision", lambda: PolygonCollision(shapeA, shapeB), 1),
+    ]
+    for name, call, budget in budgets:
+        count = CountCallAllocations(call)
+        print(f"{name:<24} allocations={count} budget={budget} {Verdict(count <= budget, name, 'OVER')}")
+
+BENCHMARKS = {
+    "broadphase": BenchBroadphase,
+    "bullets": BenchBulletQueries,
+    "swept": BenchSweptBullets,
+    "sleep": BenchSleep,
+    "chunks": BenchChunks,
+    "contacts": BenchContacts,
+    "spawn": BenchSpawn,
+    "server": BenchServer,
+    "predict": BenchPrediction,
+    "replay": BenchReplay,
+    "snapshot": BenchSnapshot,
+    "physics": BenchPhysics,
+    "sat": BenchBatchSAT,
+    "vec2": BenchVec2,
+    "partition": BenchPartition,
+    "render": BenchRender,
+    "startup": BenchStartup,
+}
+
+def DenseFieldSetup(world):
+    world.MAX_SHAPES = 300
+    world.SHAPES_PER_CELL = 30
+    for _ in range(world.MAX_SHAPES):
+        world.SpawnShapes()
+
+def DenseFieldInput(tick):
+    angle = tick * 0.02
+    return PlayerInput(move=Vec2(cos(angle), sin(angle)))
+
+def BulletStormSetup(world):
+    world.MAX_SHAPES = 60
+    world.SHAPES_PER_CELL = 6
+    world.BASE_FIRE_RATE = 40.0
+    for name in world.upgrades:
+        for _ in range(world.MAX_UPGRADE_LEVEL):
+            world.TryUpgrade(name)
+
+def BulletStormInput(tick):
+    angle = tick * 0.3
+    return PlayerInput(aim=Vec2(cos(angle), sin(angle)), shooting=True)
+
+def ChainSplitSetup(world):
+    world.MAX_SHAPES = 0
+    world.BASE_FIRE_RATE = 20.0
+    center = world.player.transform.position
+    for i in range(48):
+        angle = 2 * pi * i / 48
+        shape = Shape(Vec2(center.x + cos(angle) * 300, center.y + sin(angle) * 300), 8, 40)
+        shape.hp = 1
+        world.shapes.append(shape)
+
+def ChainSplitInput(tick):
+    angle = tick * 0.13
+    return PlayerInput(aim=Vec2(cos(angle), sin(angle)), shooting=True)
+
+SCENARIOS = {
+    "dense": (DenseFieldSetup, DenseFieldInput),
+    "storm": (BulletStormSetup, BulletStormInput),
+    "split": (ChainSplitSetup, ChainSplitInput),
+}
+
+def PlayScenario(name, ticks, seed, dt, onTick=None):
+    setup, makeInput = SCENARIOS[name]
+    world = World(seed=seed)
+    setup(world)
+    for tick in range(ticks):
+        if onTick is None:
+            world.Step(dt, makeInput(tick))
+        else:
+            onTick(world, tick, makeInput(tick))
+    return world
+
+def RunScenario(name, ticks=600, seed=0, dt=1 / 60, profileFrames=0):
+    timer = PhaseTimer()
+    frames = []
+
+    def TimedTick(world, tick, playerInput):
+        world.timer = timer
+        start = time.perf_counter()
+        world.Step(dt, playerInput)
+        frames.append((time.perf_counter() - start, timer.EndFrame()))
+
+    world = PlayScenario(name, ticks, seed, dt, TimedTick)
+
+    frameTimes = [frameTime for frameTime, _ in frames]
+    phases = {}
+    for phaseName in frames[0][1]:
+        values = [phaseTimes.get(phaseName, 0.0) for _, phaseTimes in frames]
+        phases[phaseName] = {
+            "totalMs": sum(values) * 1000,
+            "meanMs": sum(values) / len(values) * 1000,
+            "p50Ms": Percentile(values, 0.5) * 1000,
+            "p99Ms": Percentile(values, 0.99) * 1000,
+            "maxMs": max(values) * 1000,
+        }
+
+    result = {
+        "scenario": name,
+        "seed": seed,
+        "ticks": ticks,
+        "frame": {
+            "meanMs": sum(frameTimes) / len(frameTimes) * 1000,
+            "p50Ms": Percentile(frameTimes, 0.5) * 1000,
+            "p99Ms": Percentile(frameTimes, 0.99) * 1000,
+            "maxMs": max(frameTimes) * 1000,
+        },
+        "phases": phases,
+        "final": {"shapes": len(world.shapes), "bullets": len(world.bullets), "fragments": world.fragments},
+    }
+
+    if profileFrames:
+        slowest = sorted(range(ticks), key=lambda tick: frameTimes[tick], reverse=True)[:profileFrames]
+        result["slowest"] = ProfileTicks(name, ticks, seed, dt, slowest, frameTimes)
+    return result
+
+def ProfileTicks(name, ticks, seed, dt, targets, frameTimes, limit=15):
+    # The scenario is deterministic, so replaying it reaches the same slow ticks without profiling every frame
+    profiles = {}
+
+    def ProfiledTick(world, tick, playerInput):
+        if tick not in targets:
+            world.Step(dt, playerInput)
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        world.Step(dt, playerInput)
+        profiler.disable()
+        profiles[tick] = pstats.Stats(profiler)
+
+    PlayScenario(name, ticks, seed, dt, ProfiledTick)
+
+    slowest = []
+    for tick in targets:
+        stats = profiles[tick]
+        entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        slowest.append({
+            "tick": tick,
+            "frameMs": frameTimes[tick] * 1000,
+            "top": [{"function": f"{path}:{line}({function})", "calls": calls,
+                     "tottimeMs": tottime * 1000, "cumtimeMs": cumtime * 1000}
+                    for (path, line, function), (_, calls, tottime, cumtime, _) in entries],
+        })
+    return slowest
+
+def Main():
+    parser = argparse.ArgumentParser(description="Geometry.io benchmarks")
+    parser.add_argument("names", nargs="*", help=f"any of {', '.join(list(BENCHMARKS) + list(SCENARIOS))}")
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile", type=int, default=0, metavar="N", help="cProfile the N slowest ticks")
+    parser.add_argument("--json", metavar="PATH", help="write scenario results to PATH instead of stdout")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.names or list(BENCHMARKS) + list(SCENARIOS):
+        if name in SCENARIOS:
+            results.append(RunScenario(name, args.ticks, args.seed, profileFrames=args.profile))
+        else:
+            print(f"== {name}")
+            BENCHMARKS[name]()
+
+    if results:
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(results, file, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    Main()
\ No newline at end of file
@@ -0,0 +1,198 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+from bisect import bisect_right
+from math import hypot
+from collisions import GetAABB
+
+class Broadphase:
+    def __init__(self):
+        self.shapes = []
+        self.bounds = []
+        self.circles = []
+        self.overhang = 0.0
+
+    def Update(self, shapes):
+        self.shapes = shapes
+        self.bounds = [GetAABB(shape) for shape in shapes]
+        self.circles = [(shape.transform.position.x, shape.transform.position.y, shape.GetBoundingRadius())
+                        for shape in shapes]
+        # Cells and sort keys come from the boxes but circle queries test bounding circles, which stick out
+        # past the box of a rotated shape, so the candidate search is widened by the worst overhang
+        self.overhang = max((max(x + r - maxX, minX - x + r, y + r - maxY, minY - y + r)
+                             for (x, y, r), (minX, minY, maxX, maxY) in zip(self.circles, self.bounds)), default=0.0)
+
+    def UpdateCircles(self, circles):
+        # Rebuild from bounding circles alone, enough for the circle queries but not for Pairs
+        self.shapes = []
+        self.circles = list(circles)
+        self.bounds = [(x - r, y - r, x + r, y + r) for x, y, r in self.circles]
+        self.overhang = 0.0
+
+    def FindPairs(self):
+        # Every pair, subclasses narrow this down
+        n = len(self.shapes)
+        return [(i, j) for i in range(n) for j in range(i + 1, n)]
+
+    def Pairs(self):
+        shapes = self.shapes
+        return [(shapes[i], shapes[j]) for i, j in sorted(self.FindPairs())]
+
+    def FindCircleCandidates(self, x, y, radius):
+        # The circles, not the shapes, since UpdateCircles leaves no shapes behind
+        return range(len(self.circles))
+
+    def QueryCircle(self, center, radius):
+        x, y = center.x, center.y
+        circles = self.circles
+        hits = []
+        for i in self.FindCircleCandidates(x, y, radius):
+            cx, cy, r = circles[i]
+            dx, dy = cx - x, cy - y
+            reach = r + radius
+            if dx*dx + dy*dy <= reach * reach:
+                hits.append(i)
+        hits.sort()
+        shapes = self.shapes
+        return [shapes[i] for i in hits]
+
+    def CountCentersIn(self, minX, minY, maxX, maxY):
+        # Only the stored circles are read, so this stays valid while the shape list is being edited
+        circles = self.circles
+        halfWidth, halfHeight = (maxX - minX) * 0.5, (maxY - minY) * 0.5
+        count = 0
+        for i in self.FindCircleCandidates(minX + halfWidth, minY + halfHeight, hypot(halfWidth, halfHeight)):
+            cx, cy, _ = circles[i]
+            if minX <= cx < maxX and minY <= cy < maxY:
+                count += 1
+        return count
+
+    def TouchesCircle(self, x, y, radius):
+        circles = self.circles
+        for i in self.FindCircleCandidates(x, y, radius):
+            cx, cy, r = circles[i]
+            dx, dy = cx - x, cy - y
+            reach = r + radius
+            if dx*dx + dy*dy < reach * reach:
+                return True
+        return False
+
+    def QuerySweptCircle(self, start, end, radius):
+        # Capsule around the motion: candidates come from the circle enclosing it, then the exact segment distance
+        sx, sy = start.x, start.y
+        dx, dy = end.x - sx, end.y - sy
+        length2 = dx*dx + dy*dy
+        circles = self.circles
+        hits = []
+        for i in self.FindCircleCandidates(sx + dx * 0.5, sy + dy * 0.5, length2 ** 0.5 * 0.5 + radius):
+            cx, cy, r = circles[i]
+            t = 0.0 if length2 < 1e-12 else max(0.0, min(1.0, ((cx - sx) * dx + (cy - sy) * dy) / length2))
+            px, py = sx + dx * t - cx, sy + dy * t - cy
+            reach = r + radius
+            if px*px + py*py <= reach * reach:
+                hits.append(i)
+        hits.sort()
+        shapes = self.shapes
+        return [shapes[i] for i in hits]
+
+class BruteForce(Broadphase):
+    # The base class's all-pairs search, named for the benchmarks and fuzzers that compare against it
+    pass
+
+class SpatialHash(Broadphase):
+    def __init__(self, cellSize=200):
+        super().__init__()
+        self.cellSize = cellSize
+        self.cells = {}
+
+    def Update(self, shapes):
+        super().Update(shapes)
+        self.BuildCells()
+
+    def UpdateCircles(self, circles):
+        super().UpdateCircles(circles)
+        self.BuildCells()
+
+    def BuildCells(self):
+        self.cells = {}
+        size = self.cellSize
+        for index, (minX, minY, maxX, maxY) in enumerate(self.bounds):
+            for cx in range(int(minX // size), int(maxX // size) + 1):
+                for cy in range(int(minY // size), int(maxY // size) + 1):
+                    cell = self.cells.get((cx, cy))
+                    if cell is None:
+                        self.cells[(cx, cy)] = [index]
+                    else:
+                        cell.append(index)
+
+    def FindPairs(self):
+        bounds = self.bounds
+        pairs = set()
+        for cell in self.cells.values():
+            n = len(cell)
+            for a in range(n):
+                i = cell[a]
+                minAx, minAy, maxAx, maxAy = bounds[i]
+                for b in range(a + 1, n):
+                    j = cell[b]
+                    minBx, minBy, maxBx, maxBy = bounds[j]
+                    if maxAx < minBx or maxBx < minAx or maxAy < minBy or maxBy < minAy:
+                        continue
+                    pairs.add((i, j))
+        return pairs
+
+    def FindCircleCandidates(self, x, y, radius):
+        radius += self.overhang
+        size = self.cellSize
+        cells = self.cells
+        candidates = set()
+        for cx in range(int((x - radius) // size), int((x + radius) // size) + 1):
+            for cy in range(int((y - radius) // size), int((y + radius) // size) + 1):
+                cell = cells.get((cx, cy))
+                if cell is not None:
+                    candidates.update(cell)
+        return candidates
+
+class SweepAndPrune(Broadphase):
+    def __init__(self):
+        super().__init__()
+        self.order = []
+        self.keys = []
+
+    def Update(self, shapes):
+        super().Update(shapes)
+        self.Sort()
+
+    def UpdateCircles(self, circles):
+        super().UpdateCircles(circles)
+        self.Sort()
+
+    def Sort(self):
+        n = len(self.bounds)
+        # Keep last tick's order and let the sort fix it up, it is almost sorted already
+        if len(self.order) != n:
+            self.order = list(range(n))
+        bounds = self.bounds
+        self.order.sort(key=lambda i: bounds[i][0])
+        self.keys = [bounds[i][0] for i in self.order]
+
+    def FindPairs(self):
+        bounds = self.bounds
+        pairs = []
+        active = []
+        for i in self.order:
+            minAx, minAy, maxAx, maxAy = bounds[i]
+            active = [j for j in active if bounds[j][2] >= minAx]
+            for j in active:
+                minBy, maxBy = bounds[j][1], bounds[j][3]
+                if maxAy < minBy or maxBy < minAy:
+                    continue
+                pairs.append((i, j) if i < j else (j, i))
+            active.append(i)
+        return pairs
+
+    def FindCircleCandidates(self, x, y, radius):
+        radius += self.overhang
+        bounds = self.bounds
+        end = bisect_right(self.keys, x + radius)
+        return [i for i in self.order[:end] if bounds[i][2] >= x - radius]
\ No newline at end of file
@@ -0,0 +1,128 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import os
+from array import array
+from shape import GetPolygonTemplate
+
+# Every shape is one fixed-stride row of float64s, the same rows world snapshots are made of
+SHAPE_FIELDS = ("entityId", "x", "y", "rotation", "scale", "r", "g", "b", "vx", "vy", "angularVelocity",
+                "mass", "drag", "sleeping", "sleepTimer", "pointCount", "size", "hp")
+
+def Number(value):
+    # Counts and sizes were ints before they went through a float64 column
+    return int(value) if value.is_integer() else value
+
+def PackShapes(shapes, values=None):
+    values = array("d") if values is None else values
+    # Rows gather in a list and convert to float64 in one extend, a per-row array extend costs more than the row
+    rows = []
+    for shape in shapes:
+        transform, physics = shape.transform, shape.physics
+        r, g, b = shape.color
+        rows += (-1 if shape.entityId is None else shape.entityId,
+                 transform.position.x, transform.position.y, transform.rotation, transform.scale,
+                 r, g, b, physics.linearVelocity.x, physics.linearVelocity.y, physics.angularVelocity,
+                 physics.mass, physics.drag, physics.sleeping, physics.sleepTimer,
+                 shape.pointCount, shape.size, shape.hp)
+    values.extend(rows)
+    return values
+
+def RestorePhysics(physics, vx, vy, angularVelocity, mass, drag, sleeping, sleepTimer):
+    physics.linearVelocity = physics.linearVelocity.Set(vx, vy)
+    physics.angularVelocity = angularVelocity
+    physics.mass = mass
+    physics.drag = drag
+    physics.sleeping = bool(sleeping)
+    physics.sleepTimer = int(sleepTimer)
+
+def UnpackShapes(values, Acquire):
+    stride = len(SHAPE_FIELDS)
+    # One extended slice per column instead of one row slice per shape, and every field written once
+    # rather than through Shape.Reset and then again from the row
+    columns = [values[field::stride] for field in range(stride)]
+    shapes = []
+    for (entityId, x, y, rotation, scale, r, g, b, vx, vy, angularVelocity,
+         mass, drag, sleeping, sleepTimer, pointCount, size, hp) in zip(*columns):
+        shape = Acquire()
+        transform = shape.transform
+        transform.position = transform.position.Set(x, y)
+        transform.rotation = rotation
+        transform.scale = scale
+        pointCount = int(pointCount)
+        shape.template = GetPolygonTemplate(pointCount)
+        shape.pointCount = pointCount
+        shape.color = (int(r), int(g), int(b))
+        shape.size = Number(size)
+        shape.hp = Number(hp)
+        shape.entityId = None if entityId < 0 else int(entityId)
+        RestorePhysics(shape.physics, vx, vy, angularVelocity, mass, drag, sleeping, sleepTimer)
+        shapes.append(shape)
+    return shapes
+
+def ChunkOf(position, size):
+    return int(position.x // size), int(position.y // size)
+
+class ChunkStore:
+    # Parked chunks as packed shape rows, kept in memory or as one file per chunk when given a directory
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.chunks = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            # Chunk files left by an earlier session are not in the index, Park would append to them and
+            # Take would bring their shapes back a second time
+            for name in os.listdir(directory):
+                if name.endswith(".chunk"):
+                    os.remove(os.path.join(directory, name))
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __contains__(self, key):
+        return key in self.chunks
+
+    def Keys(self):
+        return sorted(self.chunks)
+
+    def Path(self, key):
+        return os.path.join(self.directory, f"{key[0]}_{key[1]}.chunk")
+
+    def Park(self, key, values):
+        # A chunk that is already parked just grows, shapes drift across borders into parked chunks too
+        if self.directory is None:
+            stored = self.chunks.get(key)
+            if stored is None:
+                self.chunks[key] = values
+            else:
+                stored.extend(values)
+            return
+        with open(self.Path(key), "ab") as file:
+            file.write(values.tobytes())
+        self.chunks[key] = self.chunks.get(key, 0) + len(values)
+
+    def Peek(self, key):
+        stored = self.chunks.get(key)
+        if stored is None or self.directory is None:
+            return stored
+        values = array("d")
+        with open(self.Path(key), "rb") as file:
+            values.frombytes(file.read())
+        return values
+
+    def Take(self, key):
+        values = self.Peek(key)
+        if values is not None:
+            del self.chunks[key]
+            if self.directory is not None:
+                os.remove(self.Path(key))
+        return values
+
+    def Clear(self):
+        for key in list(self.chunks):
+            self.Take(key)
+
+    def StoredBytes(self):
+        if self.directory is None:
+            return sum(len(values) * values.itemsize for values in self.chunks.values())
+        return sum(self.chunks.values()) * array("d").itemsize
\ No newline at end of file
@@ -3,6 +3,20 @@
 
 from vec2 import Vec2
 
+# numpy takes longer to import than everything else a headless world needs, only the batched paths load it
+np = None
+numpyLoaded = False
+
+def LoadNumpy():
+    global np, numpyLoaded
+    if not numpyLoaded:
+        numpyLoaded = True
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+    return np
+
 def ClosestPointOnSegment(p, a, b):
     ab = b - a
     abLen2 = ab.x * ab.x + ab.y * ab.y
@@ -12,30 +26,50 @@ def ClosestPointOnSegment(p, a, b):
     t = max(0.0, min(1.0, t))
     return a + ab * t
 
-def PolygonCircleCollision(poly, circle, restitution=0.8, correction=0.8):
-    points = poly.GetPoints()
+def ClosestPointOnPolygon(points, cx, cy):
     closest = None
     minDist2 = float("inf")
     n = len(points)
 
-    circlePos = circle.transform.position
-    radius = circle.transform.scale
-
+    # Same search as ClosestPointOnSegment over every edge, kept in floats so it allocates nothing per vertex
     for i in range(n):
-        p1 = Vec2(*points[i])
-        p2 = Vec2(*points[(i + 1) % n])
+        x1, y1 = points[i]
+        x2, y2 = points[(i + 1) % n]
 
-        dist2 = (circlePos - p1).Length()**2
+        dx, dy = cx - x1, cy - y1
+        dist2 = dx*dx + dy*dy
         if dist2 < minDist2:
             minDist2 = dist2
-            closest = p1
-
-        cp = ClosestPointOnSegment(circlePos, p1, p2)
-        dist2 = (circlePos - cp).Length()**2
+            closest = (x1, y1)
+
+        ex, ey = x2 - x1, y2 - y1
+        edgeLen2 = ex*ex + ey*ey
+        if edgeLen2 < 1e-12:
+            px, py = x1, y1
+        else:
+            t = max(0.0, min(1.0, (dx*ex + dy*ey) / edgeLen2))
+            px, py = x1 + ex*t, y1 + ey*t
+        dx, dy = cx - px, cy - py
+        dist2 = dx*dx + dy*dy
         if dist2 < minDist2:
             minDist2 = dist2
-            closest = cp
+            closest = (px, py)
+
+    return closest, minDist2
 
+def PolygonCircleCollision(poly, circle, restitution=0.8, correction=0.8):
+    circlePos = circle.transform.position
+    radius = circle.transform.scale
+    cx, cy = circlePos.x, circlePos.y
+
+    # Bounding circles first, most shapes are nowhere near the circle and this skips the edge walk
+    polyPos = poly.transform.position
+    dx, dy = cx - polyPos.x, cy - polyPos.y
+    reach = poly.GetBoundingRadius() + radius
+    if dx*dx + dy*dy >= reach * reach:
+        return False
+
+    closest, minDist2 = ClosestPointOnPolygon(poly.GetPoints(), cx, cy)
     if closest is None:
         return False
 
@@ -43,12 +77,21 @@ def PolygonCircleCollision(poly, circle, restitution=0.8, correction=0.8):
     if dist >= radius:
         return False
 
-    normal = (circlePos - closest).Normalized()
-    if normal.Length() < 1e-8:
-        normal = Vec2(0, 1)
+    closestX, closestY = closest
+    normal = Vec2(cx - closestX, cy - closestY)
+    if dist > 0:
+        normal /= dist
+    if normal.LengthSquared() < 1e-16:
+        normal.Set(0, 1)
 
     penetration = radius - dist
-    circle.transform.position += normal * penetration * correction
+    circle.transform.position = circle.transform.position.AddScaled(normal, penetration * correction)
+
+    return ResolvePolygonCircleCollision(poly, circle, normal, closestX, closestY, restitution)
+
+def ResolvePolygonCircleCollision(poly, circle, normal, closestX, closestY, restitution=0.8):
+    poly.physics.Wake()
+    circle.physics.Wake()
 
     velAlongNormal = circle.physics.linearVelocity.Dot(normal)
     if velAlongNormal > 0:
@@ -57,22 +100,101 @@ def PolygonCircleCollision(poly, circle, restitution=0.8, correction=0.8):
     j = -(1 + restitution) * velAlongNormal
     j /= (1 / circle.physics.mass + 1 / poly.physics.mass)
 
-    impulse = normal * j
-    circle.physics.linearVelocity += impulse / circle.physics.mass
-    poly.physics.linearVelocity -= impulse / poly.physics.mass
+    circle.physics.linearVelocity = circle.physics.linearVelocity.AddScaled(normal, j / circle.physics.mass)
+    poly.physics.linearVelocity = poly.physics.linearVelocity.AddScaled(normal, -j / poly.physics.mass)
 
-    r = closest - poly.transform.position
-    angularImpulse = (r.x * normal.y - r.y * normal.x) * (velAlongNormal * restitution / poly.physics.mass) * 0.01
+    rx = closestX - poly.transform.position.x
+    ry = closestY - poly.transform.position.y
+    angularImpulse = (rx * normal.y - ry * normal.x) * (velAlongNormal * restitution / poly.physics.mass) * 0.01
     poly.physics.angularVelocity += angularImpulse
 
     return True
 
+def PointInConvexPolygon(points, x, y, centerX, centerY):
+    n = len(points)
+    for i in range(n):
+        x1, y1 = points[i]
+        x2, y2 = points[(i + 1) % n]
+        # The point has to sit on the same side of every edge as the center does
+        side = (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)
+        centerSide = (x2 - x1) * (centerY - y1) - (y2 - y1) * (centerX - x1)
+        if side * centerSide < 0:
+            return False
+    return True
+
+def SweptCircleTOI(points, start, end, radius):
+    # Time of impact of a circle moving from start to end against a convex polygon, as a fraction of the move.
+    # Returns (t, normal, contact) for the first touch, or None if the circle never comes within radius.
+    sx, sy = start.x, start.y
+    closest, minDist2 = ClosestPointOnPolygon(points, sx, sy)
+    if closest is None:
+        return None
+
+    n = len(points)
+    centerX = sum(x for x, _ in points) / n
+    centerY = sum(y for _, y in points) / n
+
+    # Already touching, or starting inside, counts as an impact at the very start of the move
+    if minDist2 < radius * radius or PointInConvexPolygon(points, sx, sy, centerX, centerY):
+        dist = minDist2 ** 0.5
+        if dist > 0:
+            return 0.0, Vec2((sx - closest[0]) / dist, (sy - closest[1]) / dist), closest
+        return 0.0, Vec2(0, 1), closest
+
+    dx, dy = end.x - sx, end.y - sy
+    best = None
+
+    for i in range(n):
+        x1, y1 = points[i]
+        x2, y2 = points[(i + 1) % n]
+        ex, ey = x2 - x1, y2 - y1
+        edgeLen2 = ex*ex + ey*ey
+        if edgeLen2 < 1e-12:
+            continue
+
+        # Edge face pushed out by the radius, the motion has to cross it from the outside
+        edgeLen = edgeLen2 ** 0.5
+        nx, ny = ey / edgeLen, -ex / edgeLen
+        if nx * (x1 - centerX) + ny * (y1 - centerY) < 0:
+            nx, ny = -nx, -ny
+        dist0 = nx * (sx - x1) + ny * (sy - y1) - radius
+        dist1 = nx * (sx + dx - x1) + ny * (sy + dy - y1) - radius
+        if dist0 >= 0 and dist1 < 0:
+            t = dist0 / (dist0 - dist1)
+            hx, hy = sx + dx * t - x1, sy + dy * t - y1
+            s = (hx * ex + hy * ey) / edgeLen2
+            if 0.0 <= s <= 1.0 and (best is None or t < best[0]):
+                best = (t, Vec2(nx, ny), (x1 + ex * s, y1 + ey * s))
+
+        # Rounded corner: solve |start + d t - vertex| = radius
+        a = dx*dx + dy*dy
+        if a < 1e-12:
+            continue
+        fx, fy = sx - x1, sy - y1
+        b = fx*dx + fy*dy
+        c = fx*fx + fy*fy - radius * radius
+        disc = b*b - a*c
+        if disc < 0:
+            continue
+        t = (-b - disc ** 0.5) / a
+        if 0.0 <= t <= 1.0 and (best is None or t < best[0]):
+            best = (t, Vec2((fx + dx * t) / radius, (fy + dy * t) / radius), (x1, y1))
+
+    return best
+
+def SweptPolygonCircleCollision(poly, circle, start, restitution=0.8):
+    end = circle.transform.position
+    hit = SweptCircleTOI(poly.GetPoints(), start, end, circle.transform.scale)
+    if hit is None:
+        return None
+
+    t, normal, (closestX, closestY) = hit
+    circle.transform.position = Vec2(start.x + (end.x - start.x) * t, start.y + (end.y - start.y) * t)
+    ResolvePolygonCircleCollision(poly, circle, normal, closestX, closestY, restitution)
+    return t
 
 def GetAABB(poly):
-    points = poly.GetPoints()
-    xs = [p[0] for p in points]
-    ys = [p[1] for p in points]
-    return min(xs), min(ys), max(xs), max(ys)
+    return poly.GetAABB()
 
 def AABBCollision(polyA, polyB):
     minAx, minAy, maxAx, maxAy = GetAABB(polyA)
@@ -81,13 +203,9 @@ def AABBCollision(polyA, polyB):
     return not (maxAx < minBx or maxBx < minAx or maxAy < minBy or maxBy < minAy)
 
 def ProjectPolygon(points, axis):
-    minProj = float('inf')
-    maxProj = -float('inf')
-    for p in points:
-        proj = Vec2(*p).Dot(axis)
-        minProj = min(minProj, proj)
-        maxProj = max(maxProj, proj)
-    return minProj, maxProj
+    ax, ay = axis.x, axis.y
+    projections = [x * ax + y * ay for x, y in points]
+    return min(projections), max(projections)
 
 def Overlap1D(minA, maxA, minB, maxB):
     return min(maxA, maxB) - max(minA, minB)
@@ -98,17 +216,13 @@ def SATCollision(polyA, polyB):
     smallestOverlap = float('inf')
     collisionNormal = None
 
-    for shape in (pointsA, pointsB):
-        for i in range(len(shape)):
-            p1 = Vec2(*shape[i])
-            p2 = Vec2(*shape[(i+1) % len(shape)])
-            edge = p2 - p1
-            axis = Vec2(-edge.y, edge.x).Normalized()
-
-            minA, maxA = ProjectPolygon(pointsA, axis)
-            minB, maxB = ProjectPolygon(pointsB, axis)
+    for normals in (polyA.GetNormals(), polyB.GetNormals()):
+        for axis in normals:
+            ax, ay = axis
+            projA = [x * ax + y * ay for x, y in pointsA]
+            projB = [x * ax + y * ay for x, y in pointsB]
 
-            overlap = Overlap1D(minA, maxA, minB, maxB)
+            overlap = Overlap1D(min(projA), max(projA), min(projB), max(projB))
             if overlap <= 0:
                 return None  
             elif overlap < smallestOverlap:
@@ -117,11 +231,11 @@ def SATCollision(polyA, polyB):
 
     centerA = polyA.transform.position
     centerB = polyB.transform.position
-    direction = (centerB - centerA)
-    if direction.Dot(collisionNormal) < 0:
-        collisionNormal = collisionNormal * -1
+    nx, ny = collisionNormal
+    if (centerB.x - centerA.x) * nx + (centerB.y - centerA.y) * ny < 0:
+        nx, ny = -nx, -ny
 
-    return collisionNormal, smallestOverlap
+    return Vec2(nx, ny), smallestOverlap
 
 def PolygonCollision(polyA, polyB, restitution=0.8, percent=1.0, angularFactor=0.05):
     if not AABBCollision(polyA, polyB):
@@ -132,30 +246,87 @@ def PolygonCollision(polyA, polyB, restitution=0.8, percent=1.0, angularFactor=0
         return False
 
     normal, penetration = satResult
+    ResolvePolygonCollision(polyA, polyB, normal, penetration, restitution, percent, angularFactor)
+    return True
 
+def ResolvePolygonCollision(polyA, polyB, normal, penetration, restitution=0.8, percent=1.0, angularFactor=0.05):
     invMassA = 1 / polyA.physics.mass if polyA.physics.mass > 0 else 0
     invMassB = 1 / polyB.physics.mass if polyB.physics.mass > 0 else 0
+    polyA.physics.Wake()
+    polyB.physics.Wake()
 
-    correction = normal * penetration * percent
-    polyA.transform.position -= correction * invMassA
-    polyB.transform.position += correction * invMassB
+    correction = penetration * percent
+    polyA.transform.position = polyA.transform.position.AddScaled(normal, -correction * invMassA)
+    polyB.transform.position = polyB.transform.position.AddScaled(normal, correction * invMassB)
 
     velA = polyA.physics.linearVelocity
     velB = polyB.physics.linearVelocity
-    relVel = velA - velB
-    velAlongNormal = relVel.Dot(normal)
-    if velAlongNormal > 0:
-        return True
+    # The normal points from A to B, so a positive closing speed means the pair is still approaching
+    velAlongNormal = (velA.x - velB.x) * normal.x + (velA.y - velB.y) * normal.y
+    if velAlongNormal <= 0:
+        return
 
-    j = -(1 + restitution) * velAlongNormal
+    j = (1 + restitution) * velAlongNormal
     j /= invMassA + invMassB if invMassA + invMassB != 0 else 1
-    impulse = normal * j
-    polyA.physics.linearVelocity += impulse * invMassA
-    polyB.physics.linearVelocity -= impulse * invMassB
-
-    centerOffsetA = polyA.transform.position - ((polyA.transform.position + polyB.transform.position) * 0.5)
-    centerOffsetB = polyB.transform.position - ((polyA.transform.position + polyB.transform.position) * 0.5)
-    polyA.physics.angularVelocity += centerOffsetA.x * normal.y * angularFactor - centerOffsetA.y * normal.x * angularFactor
-    polyB.physics.angularVelocity += centerOffsetB.x * normal.y * angularFactor - centerOffsetB.y * normal.x * angularFactor
-
-    return True
+    polyA.physics.linearVelocity = polyA.physics.linearVelocity.AddScaled(normal, -j * invMassA)
+    polyB.physics.linearVelocity = polyB.physics.linearVelocity.AddScaled(normal, j * invMassB)
+
+    posA = polyA.transform.position
+    posB = polyB.transform.position
+    offsetX = (posA.x - posB.x) * 0.5
+    offsetY = (posA.y - posB.y) * 0.5
+    polyA.physics.angularVelocity += offsetX * normal.y * angularFactor - offsetY * normal.x * angularFactor
+    polyB.physics.angularVelocity -= offsetX * normal.y * angularFactor - offsetY * normal.x * angularFactor
+
+def PackPolygons(polys, maxPoints=8):
+    # Pad by repeating the last vertex: duplicates never change a projection and only add zero-length edges
+    LoadNumpy()
+    packed = []
+    for poly in polys:
+        points = poly.GetPoints()
+        packed.append(points + [points[-1]] * (maxPoints - len(points)))
+    centers = [poly.transform.position.AsTuple() for poly in polys]
+    return (np.array(packed, dtype=float).reshape(len(polys), maxPoints, 2),
+            np.array(centers, dtype=float).reshape(len(polys), 2))
+
+def BatchEdgeNormals(points):
+    LoadNumpy()
+    edges = np.roll(points, -1, axis=1) - points
+    normals = np.stack((-edges[..., 1], edges[..., 0]), axis=-1)
+    lengths = np.hypot(normals[..., 0], normals[..., 1])
+    valid = lengths > 1e-12
+    normals /= np.where(valid, lengths, 1.0)[..., None]
+    return normals, valid
+
+def BatchSATCollision(pointsA, pointsB, centersA, centersB):
+    LoadNumpy()
+    normalsA, validA = BatchEdgeNormals(pointsA)
+    normalsB, validB = BatchEdgeNormals(pointsB)
+    axes = np.concatenate((normalsA, normalsB), axis=1)
+    valid = np.concatenate((validA, validB), axis=1)
+
+    projA = np.einsum("nvd,nad->nav", pointsA, axes)
+    projB = np.einsum("nvd,nad->nav", pointsB, axes)
+    overlap = np.minimum(projA.max(axis=2), projB.max(axis=2)) - np.maximum(projA.min(axis=2), projB.min(axis=2))
+    overlap = np.where(valid, overlap, np.inf)
+
+    indices = np.nonzero((overlap > 0).all(axis=1))[0]
+    best = overlap[indices].argmin(axis=1)
+    normals = axes[indices, best]
+    penetrations = overlap[indices, best]
+
+    direction = centersB[indices] - centersA[indices]
+    flip = np.einsum("nd,nd->n", direction, normals) < 0
+    normals[flip] *= -1
+    return indices, normals, penetrations
+
+def BatchPolygonCollision(pairs, restitution=0.8, percent=1.0, angularFactor=0.05):
+    if not pairs:
+        return 0
+    pointsA, centersA = PackPolygons([a for a, _ in pairs])
+    pointsB, centersB = PackPolygons([b for _, b in pairs])
+    indices, normals, penetrations = BatchSATCollision(pointsA, pointsB, centersA, centersB)
+    for index, (nx, ny), penetration in zip(indices.tolist(), normals.tolist(), penetrations.tolist()):
+        polyA, polyB = pairs[index]
+        ResolvePolygonCollision(polyA, polyB, Vec2(nx, ny), penetration, restitution, percent, angularFactor)
+    return len(indices)
\ No newline at end of file
@@ -4,33 +4,109 @@
 from vec2 import Vec2
 
 class TransformComponent:
-    def __init__(self, position=Vec2(), rotation=0, scale=1):
-        self.position = position
+    def __init__(self, position=None, rotation=0, scale=1):
+        self.version = 0
+        self.position = position if position is not None else Vec2()
         self.rotation = rotation
         self.scale = scale
 
+    def Reset(self, position, rotation=0, scale=1):
+        self.position = self.position.Set(position.x, position.y)
+        self.rotation = rotation
+        self.scale = scale
+
+    # Any assignment, including `position += ...`, bumps the version so shapes can tell their cached points are stale
+    @property
+    def position(self): return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = value
+        self.version += 1
+
+    @property
+    def rotation(self): return self._rotation
+
+    @rotation.setter
+    def rotation(self, value):
+        self._rotation = value
+        self.version += 1
+
+    @property
+    def scale(self): return self._scale
+
+    @scale.setter
+    def scale(self, value):
+        self._scale = value
+        self.version += 1
+
 class PhysicsComponent:
-    def __init__(self, linearVelocity=Vec2(), angularVelocity=0.0, mass=1.0, drag=0.999):
-        self.linearVelocity = linearVelocity
+    # A body that stays this slow for SLEEP_TICKS updates in a row stops integrating until something touches it
+    SLEEP_LINEAR_SPEED = 5.0
+    SLEEP_ANGULAR_SPEED = 1.0
+    SLEEP_TICKS = 30
+
+    def __init__(self, linearVelocity=None, angularVelocity=0.0, mass=1.0, drag=0.999):
+        self.linearVelocity = linearVelocity if linearVelocity is not None else Vec2()
         self.angularVelocity = angularVelocity
         self.mass = mass
         self.drag = drag
+        self.sleeping = False
+        self.sleepTimer = 0
+
+    def Reset(self, angularVelocity=0.0, mass=1.0, drag=0.999):
+        self.linearVelocity = self.linearVelocity.Set(0.0, 0.0)
+        self.angularVelocity = angularVelocity
+        self.mass = mass
+        self.drag = drag
+        self.sleeping = False
+        self.sleepTimer = 0
+
+    def Wake(self):
+        self.sleeping = False
+        self.sleepTimer = 0
+
+    def Sleep(self):
+        self.sleeping = True
+        self.linearVelocity = self.linearVelocity.Set(0.0, 0.0)
+        self.angularVelocity = 0.0
 
     def Update(self, transformComponent, deltaTime):
-        if self.linearVelocity.Length() > 0.0:
-            transformComponent.position += self.linearVelocity * deltaTime
+        if self.sleeping:
+            return
+
+        velocity = self.linearVelocity
+        moving = velocity.x != 0.0 or velocity.y != 0.0
+        spinning = self.angularVelocity != 0.0
+        if not (moving or spinning):
+            self.UpdateSleep(velocity)
+            return
+
+        damping = (1.0 - self.drag) ** deltaTime
 
-            damping = (1.0 - self.drag) ** deltaTime
-            self.linearVelocity *= damping
+        if moving:
+            # Assign back so the transform version is bumped
+            transformComponent.position = transformComponent.position.AddScaled(velocity, deltaTime)
 
-            if self.linearVelocity.Length() < 0.001:
-                self.linearVelocity = Vec2()
+            velocity *= damping
+            if velocity.LengthSquared() < 0.001 * 0.001:
+                velocity.Set(0.0, 0.0)
 
-        if abs(self.angularVelocity) > 0.0:
+        if spinning:
             transformComponent.rotation += self.angularVelocity * deltaTime
 
-            damping = (1.0 - self.drag) ** deltaTime
             self.angularVelocity *= damping
 
             if abs(self.angularVelocity) < 0.001:
                 self.angularVelocity = 0.0
+
+        self.UpdateSleep(velocity)
+
+    def UpdateSleep(self, velocity):
+        limit = self.SLEEP_LINEAR_SPEED
+        if velocity.LengthSquared() < limit * limit and abs(self.angularVelocity) < self.SLEEP_ANGULAR_SPEED:
+            self.sleepTimer += 1
+            if self.sleepTimer >= self.SLEEP_TICKS:
+                self.Sleep()
+        else:
+            self.sleepTimer = 0
\ No newline at end of file
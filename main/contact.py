@@ -0,0 +1,259 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+from collisions import AABBCollision, SATCollision, LoadNumpy
+
+class Contact:
+    def __init__(self, shapeA, shapeB):
+        self.shapeA = shapeA
+        self.shapeB = shapeB
+        self.nx = 0.0
+        self.ny = 0.0
+        self.penetration = 0.0
+        self.impulse = 0.0
+
+def ContactKey(shapeA, shapeB):
+    # Entity ids are never handed out twice, pooled objects are, so identity is only the fallback
+    keyA = shapeA.entityId if shapeA.entityId is not None else -id(shapeA)
+    keyB = shapeB.entityId if shapeB.entityId is not None else -id(shapeB)
+    return (keyA, keyB) if keyA < keyB else (keyB, keyA)
+
+def ColorContacts(bodiesA, bodiesB):
+    # Greedy coloring so that no two contacts in one batch touch the same body
+    used = {}
+    batches = []
+    for c, (i, j) in enumerate(zip(bodiesA, bodiesB)):
+        taken = used.get(i, 0) | used.get(j, 0)
+        color = 0
+        while taken & (1 << color):
+            color += 1
+        used[i] = used.get(i, 0) | 1 << color
+        used[j] = used.get(j, 0) | 1 << color
+        if color == len(batches):
+            batches.append([])
+        batches[color].append(c)
+    return batches
+
+class ContactManager:
+    RESTITUTION_THRESHOLD = 200.0
+    WAKE_SPEED = 5.0
+
+    def __init__(self, iterations=8, restitution=0.8, percent=0.4, slop=0.5, angularFactor=0.05,
+                 warmStart=True, batched=False):
+        self.iterations = iterations
+        self.restitution = restitution
+        self.percent = percent
+        self.slop = slop
+        self.angularFactor = angularFactor
+        self.warmStart = warmStart
+        self.batched = batched
+        self.contacts = {}
+        self.warmStarted = 0
+        self.created = 0
+
+    def Step(self, pairs):
+        # Returns (touching contacts, pairs skipped because both bodies sleep)
+        contacts, sleepingPairs = self.Update(pairs)
+        self.Solve(contacts)
+        return len(contacts), sleepingPairs
+
+    def Update(self, pairs):
+        # Narrowphase every awake pair, carrying last step's impulse over for pairs that were already touching
+        cache = self.contacts
+        contacts = {}
+        sleepingPairs = 0
+        created = 0
+        for shapeA, shapeB in pairs:
+            if shapeA.physics.sleeping and shapeB.physics.sleeping:
+                sleepingPairs += 1
+                continue
+            if not AABBCollision(shapeA, shapeB):
+                continue
+            result = SATCollision(shapeA, shapeB)
+            if result is None:
+                continue
+
+            # The key only finds the cached contact, the pair keeps the broadphase's order so the solve
+            # order never depends on object identity
+            normal, penetration = result
+            key = ContactKey(shapeA, shapeB)
+            contact = cache.get(key)
+            if contact is not None and contact.shapeA is shapeB and contact.shapeB is shapeA:
+                contact.shapeA, contact.shapeB = shapeA, shapeB
+                contact.nx, contact.ny = -contact.nx, -contact.ny
+            if contact is None or contact.shapeA is not shapeA or contact.shapeB is not shapeB:
+                contact = Contact(shapeA, shapeB)
+                created += 1
+            elif contact.nx * normal.x + contact.ny * normal.y < 0.95:
+                # A different feature is touching now, last step's impulse says nothing about it
+                contact.impulse = 0.0
+            contact.nx, contact.ny = normal.x, normal.y
+            contact.penetration = penetration
+            contacts[key] = contact
+        self.contacts = contacts
+        self.created = created
+        return list(contacts.values()), sleepingPairs
+
+    def Solve(self, contacts):
+        if not contacts:
+            self.warmStarted = 0
+            return
+
+        # Velocities are gathered into flat lists once, the iterations never touch a Vec2
+        bodies = {}
+        physics = []
+        bodiesA, bodiesB = [], []
+        for contact in contacts:
+            for shape, indices in ((contact.shapeA, bodiesA), (contact.shapeB, bodiesB)):
+                index = bodies.get(id(shape))
+                if index is None:
+                    index = bodies[id(shape)] = len(physics)
+                    physics.append(shape.physics)
+                indices.append(index)
+        vx = [body.linearVelocity.x for body in physics]
+        vy = [body.linearVelocity.y for body in physics]
+        invMass = [1 / body.mass if body.mass > 0 else 0.0 for body in physics]
+        # Like the old pairwise response, only a pair that was closing before the solve gets a spin kick
+        approaching = [(vx[j] - vx[i]) * contact.nx + (vy[j] - vy[i]) * contact.ny < 0
+                       for contact, i, j in zip(contacts, bodiesA, bodiesB)]
+
+        normalMass, bounce, invA, invB = self.Prestep(contacts, bodiesA, bodiesB, physics, vx, vy, invMass)
+        impulses = [contact.impulse for contact in contacts]
+        if self.batched and LoadNumpy() is not None:
+            vx, vy = self.IterateBatched(contacts, bodiesA, bodiesB, vx, vy, normalMass, invA, invB, impulses)
+        else:
+            self.Iterate(contacts, bodiesA, bodiesB, vx, vy, normalMass, invA, invB, impulses)
+
+        # Only the resting impulse is carried over, a bounce warm started into the next step pushes the pile apart
+        for contact, impulse in zip(contacts, impulses):
+            contact.impulse = impulse
+        self.Restitute(contacts, bodiesA, bodiesB, vx, vy, normalMass, bounce, invA, invB, impulses)
+        for body, x, y in zip(physics, vx, vy):
+            if not body.sleeping:
+                body.linearVelocity = body.linearVelocity.Set(x, y)
+        self.Correct(contacts, invA, invB, approaching)
+
+    def Prestep(self, contacts, bodiesA, bodiesB, physics, vx, vy, invMass):
+        count = len(contacts)
+        normalMass, bounce = [0.0] * count, [0.0] * count
+        invA, invB = [0.0] * count, [0.0] * count
+        warmStarted = 0
+        for c, contact in enumerate(contacts):
+            i, j = bodiesA[c], bodiesB[c]
+            nx, ny = contact.nx, contact.ny
+            vn = (vx[j] - vx[i]) * nx + (vy[j] - vy[i]) * ny
+
+            # A sleeping body is only woken by a real push, otherwise it holds still like a wall
+            bodyA, bodyB = physics[i], physics[j]
+            if (bodyA.sleeping or bodyB.sleeping) and (vn < -self.WAKE_SPEED or contact.penetration > self.slop * 4):
+                bodyA.Wake()
+                bodyB.Wake()
+            a = 0.0 if bodyA.sleeping else invMass[i]
+            b = 0.0 if bodyB.sleeping else invMass[j]
+            invA[c], invB[c] = a, b
+            if a + b == 0:
+                contact.impulse = 0.0
+                continue
+
+            normalMass[c] = 1 / (a + b)
+            # Only bounce off real impacts, resting contacts should settle instead of chattering
+            bounce[c] = -self.restitution * vn if vn < -self.RESTITUTION_THRESHOLD else 0.0
+
+            if self.warmStart and contact.impulse > 0:
+                impulse = contact.impulse
+                vx[i] -= impulse * a * nx
+                vy[i] -= impulse * a * ny
+                vx[j] += impulse * b * nx
+                vy[j] += impulse * b * ny
+                warmStarted += 1
+            else:
+                contact.impulse = 0.0
+        self.warmStarted = warmStarted
+        return normalMass, bounce, invA, invB
+
+    def Iterate(self, contacts, bodiesA, bodiesB, vx, vy, normalMass, invA, invB, impulses):
+        normals = [(contact.nx, contact.ny) for contact in contacts]
+        for _ in range(self.iterations):
+            for c, (nx, ny) in enumerate(normals):
+                mass = normalMass[c]
+                if mass == 0:
+                    continue
+                i, j = bodiesA[c], bodiesB[c]
+                vn = (vx[j] - vx[i]) * nx + (vy[j] - vy[i]) * ny
+                # Clamp the running total rather than each step, so later iterations may take impulse back
+                old = impulses[c]
+                new = max(old - mass * vn, 0.0)
+                impulses[c] = new
+                delta = new - old
+                a, b = delta * invA[c], delta * invB[c]
+                vx[i] -= a * nx
+                vy[i] -= a * ny
+                vx[j] += b * nx
+                vy[j] += b * ny
+
+    def IterateBatched(self, contacts, bodiesA, bodiesB, vx, vy, normalMass, invA, invB, impulses):
+        # Contacts in one color share no body, so a whole color is one vectorized sequential-impulse step
+        np = LoadNumpy()
+        velocities = np.column_stack((vx, vy))
+        normals = np.array([(contact.nx, contact.ny) for contact in contacts], dtype=float)
+        indicesA, indicesB = np.array(bodiesA), np.array(bodiesB)
+        mass = np.array(normalMass)
+        massA, massB = np.array(invA), np.array(invB)
+        accumulated = np.array(impulses)
+        batches = [np.array(batch) for batch in ColorContacts(bodiesA, bodiesB)]
+
+        for _ in range(self.iterations):
+            for batch in batches:
+                i, j, n = indicesA[batch], indicesB[batch], normals[batch]
+                vn = np.einsum("cd,cd->c", velocities[j] - velocities[i], n)
+                old = accumulated[batch]
+                new = np.maximum(old - mass[batch] * vn, 0.0)
+                accumulated[batch] = new
+                delta = (new - old)[:, None] * n
+                velocities[i] -= delta * massA[batch][:, None]
+                velocities[j] += delta * massB[batch][:, None]
+
+        impulses[:] = accumulated.tolist()
+        return velocities[:, 0].tolist(), velocities[:, 1].tolist()
+
+    def Restitute(self, contacts, bodiesA, bodiesB, vx, vy, normalMass, bounce, invA, invB, impulses):
+        # One pass after the solve lifts each impact from resting to its bounce speed
+        for c, target in enumerate(bounce):
+            if not target:
+                continue
+            i, j = bodiesA[c], bodiesB[c]
+            nx, ny = contacts[c].nx, contacts[c].ny
+            vn = (vx[j] - vx[i]) * nx + (vy[j] - vy[i]) * ny
+            old = impulses[c]
+            new = max(old + normalMass[c] * (target - vn), 0.0)
+            impulses[c] = new
+            delta = new - old
+            a, b = delta * invA[c], delta * invB[c]
+            vx[i] -= a * nx
+            vy[i] -= a * ny
+            vx[j] += b * nx
+            vy[j] += b * ny
+
+    def Correct(self, contacts, invA, invB, approaching):
+        # Push out only part of the overlap beyond the slop each step, full correction is what made piles jitter
+        percent, slop, angularFactor = self.percent, self.slop, self.angularFactor
+        for c, contact in enumerate(contacts):
+            a, b = invA[c], invB[c]
+            if a + b == 0:
+                continue
+            shapeA, shapeB = contact.shapeA, contact.shapeB
+            nx, ny = contact.nx, contact.ny
+            correction = max(contact.penetration - slop, 0.0) * percent / (a + b)
+            if correction > 0:
+                positionA, positionB = shapeA.transform.position, shapeB.transform.position
+                shapeA.transform.position = positionA.Set(positionA.x - nx * correction * a, positionA.y - ny * correction * a)
+                shapeB.transform.position = positionB.Set(positionB.x + nx * correction * b, positionB.y + ny * correction * b)
+
+            if not approaching[c]:
+                continue
+            posA, posB = shapeA.transform.position, shapeB.transform.position
+            spin = ((posA.x - posB.x) * ny - (posA.y - posB.y) * nx) * 0.5 * angularFactor
+            if a:
+                shapeA.physics.angularVelocity += spin
+            if b:
+                shapeB.physics.angularVelocity -= spin
\ No newline at end of file
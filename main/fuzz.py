@@ -0,0 +1,697 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import argparse
+import sys
+from math import hypot
+from random import Random
+from agar import Agar
+from broadphase import BruteForce, SpatialHash, SweepAndPrune
+from collisions import (ClosestPointOnSegment, ClosestPointOnPolygon, PolygonCircleCollision, PointInConvexPolygon,
+                        SweptCircleTOI, AABBCollision, SATCollision, PolygonCollision, ResolvePolygonCollision,
+                        PackPolygons, BatchSATCollision, BatchPolygonCollision, LoadNumpy)
+from components import TransformComponent, PhysicsComponent
+from contact import ContactManager
+from partition import PartitionedWorld
+from physicsworld import PhysicsWorld
+from reference import CloneShape, PartitionReference
+from shape import Shape, GenPolygon, TransformPoints, EdgeNormals
+from vec2 import Vec2
+
+# Every case draws from Random(f"{seed}:{property}:{case}"), so a failure reproduces with --seed and --case alone
+TOLERANCE = 1e-9
+
+def Tolerance(*values):
+    return TOLERANCE * max(1.0, *(abs(value) for value in values))
+
+def RandomShape(rng, origin, spread):
+    # Mostly ordinary shapes, with the odd sliver, giant or exactly shared center thrown in
+    size = rng.choice((rng.uniform(5, 150), rng.uniform(5, 150), rng.uniform(1e-3, 1), rng.uniform(500, 5000)))
+    position = Vec2(origin.x + rng.uniform(-spread, spread), origin.y + rng.uniform(-spread, spread))
+    shape = Shape(position, rng.randint(3, 8), size)
+    shape.transform.rotation = rng.choice((0.0, 90.0, 45.0, rng.uniform(-720, 720)))
+    shape.transform.scale = rng.uniform(0.25, 3)
+    shape.physics.mass = rng.uniform(0.25, 4)
+    shape.physics.linearVelocity = Vec2(rng.uniform(-500, 500), rng.uniform(-500, 500))
+    return shape
+
+def RandomOrigin(rng):
+    # Far from the origin the same shapes have far fewer bits of precision left for the overlap
+    scale = rng.choice((0.0, 1.0, 1e3, 1e6))
+    return Vec2(rng.uniform(-scale, scale), rng.uniform(-scale, scale))
+
+def RandomPair(rng):
+    origin = RandomOrigin(rng)
+    shapeA = RandomShape(rng, origin, 0)
+    reach = shapeA.GetBoundingRadius()
+    shapeB = RandomShape(rng, origin, 0)
+    reach += shapeB.GetBoundingRadius()
+    if rng.random() < 0.9:
+        shapeB.transform.position = Vec2(origin.x + rng.uniform(-reach, reach), origin.y + rng.uniform(-reach, reach))
+    return shapeA, shapeB
+
+def Magnitude(*shapes):
+    return max(max(abs(shape.transform.position.x), abs(shape.transform.position.y), shape.GetBoundingRadius())
+               for shape in shapes)
+
+def ReferencePoints(shape):
+    transform = shape.transform
+    return TransformPoints(GenPolygon(Vec2(), 1, shape.pointCount), transform.position.x, transform.position.y,
+                           transform.rotation, transform.scale * shape.size)
+
+def ReferenceSAT(pointsA, pointsB, centerA, centerB):
+    # The textbook test on freshly transformed points and freshly computed normals, no caches and no templates
+    best = None
+    for normals in (EdgeNormals(pointsA), EdgeNormals(pointsB)):
+        for ax, ay in normals:
+            if ax == 0 and ay == 0:
+                continue
+            projA = [x * ax + y * ay for x, y in pointsA]
+            projB = [x * ax + y * ay for x, y in pointsB]
+            overlap = min(max(projA), max(projB)) - max(min(projA), min(projB))
+            if overlap <= 0:
+                return None
+            if best is None or overlap < best[2]:
+                best = (ax, ay, overlap)
+    ax, ay, overlap = best
+    if (centerB.x - centerA.x) * ax + (centerB.y - centerA.y) * ay < 0:
+        ax, ay = -ax, -ay
+    return ax, ay, overlap
+
+def AxisOverlap(pointsA, pointsB, ax, ay):
+    projA = [x * ax + y * ay for x, y in pointsA]
+    projB = [x * ax + y * ay for x, y in pointsB]
+    return min(max(projA), max(projB)) - max(min(projA), min(projB))
+
+def Separable(shapeA, shapeB, normal):
+    # When one projection holds the other the overlap is the smaller width rather than the way out, and the
+    # direction comes from the centers, which a mostly swallowed shape can put on the wrong side. SAT promises
+    # that pushing apart separates the pair only when B's interval lies strictly further along the normal
+    projA = [x * normal.x + y * normal.y for x, y in shapeA.GetPoints()]
+    projB = [x * normal.x + y * normal.y for x, y in shapeB.GetPoints()]
+    return min(projA) < min(projB) and max(projA) < max(projB)
+
+def TiedAxes(shapeA, shapeB):
+    # Two different axes within rounding of the smallest overlap, the scalar and vector code may each pick either
+    overlaps = [(AxisOverlap(shapeA.GetPoints(), shapeB.GetPoints(), ax, ay), ax, ay)
+                for ax, ay in list(shapeA.GetNormals()) + list(shapeB.GetNormals())]
+    smallest, sx, sy = min(overlaps)
+    tolerance = Tolerance(Magnitude(shapeA, shapeB)) * 10
+    return any(overlap - smallest < tolerance and abs(ax * sy - ay * sx) > 1e-6 for overlap, ax, ay in overlaps)
+
+def Momentum(shapes):
+    return (sum(shape.physics.mass * shape.physics.linearVelocity.x for shape in shapes),
+            sum(shape.physics.mass * shape.physics.linearVelocity.y for shape in shapes))
+
+def MomentumScale(shapes):
+    return sum(shape.physics.mass * shape.physics.linearVelocity.Length() for shape in shapes)
+
+def Describe(shape):
+    transform = shape.transform
+    return (f"Shape(n={shape.pointCount} size={shape.size!r} at=({transform.position.x!r}, {transform.position.y!r}) "
+            f"rot={transform.rotation!r} scale={transform.scale!r})")
+
+def FuzzClosestPointOnSegment(rng):
+    scale = rng.choice((1.0, 1e3, 1e6))
+    a = Vec2(rng.uniform(-scale, scale), rng.uniform(-scale, scale))
+    b = a.Copy() if rng.random() < 0.1 else Vec2(rng.uniform(-scale, scale), rng.uniform(-scale, scale))
+    p = Vec2(rng.uniform(-2 * scale, 2 * scale), rng.uniform(-2 * scale, 2 * scale))
+    q = ClosestPointOnSegment(p, a, b)
+    tolerance = Tolerance(scale) * 10
+
+    # On the segment: inside its bounding box and on the line through it
+    if not (min(a.x, b.x) - tolerance <= q.x <= max(a.x, b.x) + tolerance and
+            min(a.y, b.y) - tolerance <= q.y <= max(a.y, b.y) + tolerance):
+        return f"closest point {q.AsTuple()} is off segment {a.AsTuple()}-{b.AsTuple()}"
+    ab = b - a
+    length = ab.Length()
+    if length > 0 and abs(ab.x * (q.y - a.y) - ab.y * (q.x - a.x)) / length > tolerance:
+        return f"closest point {q.AsTuple()} is off the line through {a.AsTuple()}-{b.AsTuple()}"
+
+    best = (p - q).Length()
+    for i in range(65):
+        sample = a + ab * (i / 64)
+        if (p - sample).Length() < best - tolerance:
+            return f"sample {sample.AsTuple()} is closer to {p.AsTuple()} than {q.AsTuple()}"
+
+def FuzzClosestPointOnPolygon(rng):
+    shape = RandomShape(rng, RandomOrigin(rng), 0)
+    points = shape.GetPoints()
+    position = shape.transform.position
+    reach = shape.GetBoundingRadius() * 2
+    cx, cy = position.x + rng.uniform(-reach, reach), position.y + rng.uniform(-reach, reach)
+
+    # The float-only walk against ClosestPointOnSegment on every edge
+    closest, dist2 = ClosestPointOnPolygon(points, cx, cy)
+    p = Vec2(cx, cy)
+    expected = min((p - ClosestPointOnSegment(p, Vec2(*points[i]), Vec2(*points[(i + 1) % len(points)]))).LengthSquared()
+                   for i in range(len(points)))
+    if abs(dist2 - expected) > Tolerance(Magnitude(shape)) ** 0.5 * max(1.0, expected) ** 0.5 * 10:
+        return f"{Describe(shape)} point ({cx!r}, {cy!r}): dist2 {dist2!r}, per-segment reference {expected!r}"
+    if abs((closest[0] - cx) ** 2 + (closest[1] - cy) ** 2 - dist2) > Tolerance(Magnitude(shape), dist2) * 10:
+        return f"{Describe(shape)} returned point {closest} does not lie at the returned distance"
+
+def FuzzCachedGeometry(rng):
+    # Every kind of transform change has to invalidate the cached points, normals and bounds
+    shape = RandomShape(rng, RandomOrigin(rng), 0)
+    for step in range(8):
+        shape.GetPoints()
+        change = rng.randrange(5)
+        if change == 0:
+            shape.transform.position = Vec2(rng.uniform(-1e4, 1e4), rng.uniform(-1e4, 1e4))
+        elif change == 1:
+            shape.transform.position += Vec2(rng.uniform(-10, 10), rng.uniform(-10, 10))
+        elif change == 2:
+            shape.transform.rotation += rng.uniform(-90, 90)
+        elif change == 3:
+            shape.transform.scale = rng.uniform(0.25, 3)
+        else:
+            shape.physics.Update(shape.transform, 1 / 60)
+
+        points, normals, aabb = shape.GetPoints(), shape.GetNormals(), shape.GetAABB()
+        expected = ReferencePoints(shape)
+        tolerance = Tolerance(Magnitude(shape)) * 10
+        if any(abs(x - ex) > tolerance or abs(y - ey) > tolerance for (x, y), (ex, ey) in zip(points, expected)):
+            return f"{Describe(shape)} after change {change} at step {step}: cached points are stale"
+        # Normals taken around the origin, far from it the edges of a tiny shape are mostly rounding
+        local = TransformPoints(GenPolygon(Vec2(), 1, shape.pointCount), 0, 0, shape.transform.rotation,
+                                shape.transform.scale * shape.size)
+        if any(abs(nx - ex) > 1e-9 or abs(ny - ey) > 1e-9 for (nx, ny), (ex, ey) in zip(normals, EdgeNormals(local))):
+            return f"{Describe(shape)} after change {change} at step {step}: cached normals are stale"
+        xs, ys = [x for x, _ in expected], [y for _, y in expected]
+        if any(abs(value - ex) > tolerance for value, ex in zip(aabb, (min(xs), min(ys), max(xs), max(ys)))):
+            return f"{Describe(shape)} after change {change} at step {step}: cached AABB is stale"
+
+def FuzzSATReference(rng):
+    shapeA, shapeB = RandomPair(rng)
+    result = SATCollision(shapeA, shapeB)
+    expected = ReferenceSAT(ReferencePoints(shapeA), ReferencePoints(shapeB),
+                            shapeA.transform.position, shapeB.transform.position)
+    tolerance = Tolerance(Magnitude(shapeA, shapeB)) * 100
+
+    # Touching to within rounding may land either side of zero, anything deeper must agree
+    if (result is None) != (expected is None):
+        depth = (expected or (0, 0, 0))[2] if result is None else result[1]
+        if depth > tolerance:
+            return f"{Describe(shapeA)} vs {Describe(shapeB)}: SAT {result}, reference {expected}"
+        return None
+    if result is None:
+        return None
+
+    normal, penetration = result
+    if penetration <= 0:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: collision with non-positive penetration {penetration!r}"
+    if abs(penetration - expected[2]) > tolerance:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: penetration {penetration!r}, reference {expected[2]!r}"
+    if abs(normal.Length() - 1) > 1e-9:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: normal {normal.AsTuple()} is not unit length"
+    if not AABBCollision(shapeA, shapeB):
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: SAT hit without overlapping bounds"
+    direction = shapeB.transform.position - shapeA.transform.position
+    if direction.Dot(normal) < -tolerance:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: normal {normal.AsTuple()} points from B to A"
+
+    # The chosen axis really overlaps by the penetration, whichever of several tied axes it was
+    overlap = AxisOverlap(shapeA.GetPoints(), shapeB.GetPoints(), normal.x, normal.y)
+    if abs(overlap - penetration) > tolerance:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: overlap along the normal is {overlap!r}, not {penetration!r}"
+
+def FuzzSATSymmetry(rng):
+    shapeA, shapeB = RandomPair(rng)
+    forward, backward = SATCollision(shapeA, shapeB), SATCollision(shapeB, shapeA)
+    tolerance = Tolerance(Magnitude(shapeA, shapeB)) * 100
+    if (forward is None) != (backward is None):
+        depth = (forward or backward)[1]
+        if depth > tolerance:
+            return f"{Describe(shapeA)} vs {Describe(shapeB)}: A-B {forward}, B-A {backward}"
+        return None
+    # Ties between axes can pick different normals each way round, so only the depth has to match
+    if forward is not None and abs(forward[1] - backward[1]) > tolerance:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: penetration {forward[1]!r} one way, {backward[1]!r} the other"
+
+def FuzzSATSeparation(rng):
+    # Moving B out along the normal by the penetration has to separate the pair
+    shapeA, shapeB = RandomPair(rng)
+    result = SATCollision(shapeA, shapeB)
+    if result is None:
+        return None
+    normal, penetration = result
+    if not Separable(shapeA, shapeB, normal):
+        return None
+    tolerance = Tolerance(Magnitude(shapeA, shapeB)) * 100
+    shapeB.transform.position = shapeB.transform.position.AddScaled(normal, penetration + tolerance)
+    after = SATCollision(shapeA, shapeB)
+    if after is not None and after[1] > tolerance:
+        return (f"{Describe(shapeA)} vs {Describe(shapeB)}: still {after[1]!r} deep after moving "
+                f"{penetration!r} along {normal.AsTuple()}")
+
+def FuzzResolvePolygonCollision(rng):
+    shapeA, shapeB = RandomPair(rng)
+    result = SATCollision(shapeA, shapeB)
+    if result is None:
+        return None
+    normal, penetration = result
+    separable = Separable(shapeA, shapeB, normal)
+    before = Momentum((shapeA, shapeB))
+    scale = MomentumScale((shapeA, shapeB))
+    inverseMass = 1 / shapeA.physics.mass + 1 / shapeB.physics.mass
+    ResolvePolygonCollision(shapeA, shapeB, normal, penetration, percent=1.0)
+
+    after = Momentum((shapeA, shapeB))
+    if abs(after[0] - before[0]) > Tolerance(scale) * 10 or abs(after[1] - before[1]) > Tolerance(scale) * 10:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: momentum {before} became {after}"
+    relative = shapeB.physics.linearVelocity - shapeA.physics.linearVelocity
+    if relative.Dot(normal) < -Tolerance(scale) * 10:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: still approaching at {relative.Dot(normal)!r} after the impulse"
+
+    # Each body moves penetration / mass along the normal, so that much of the overlap has to be gone
+    if not separable:
+        return None
+    tolerance = Tolerance(Magnitude(shapeA, shapeB)) * 100
+    remaining = SATCollision(shapeA, shapeB)
+    allowed = max(0.0, penetration * (1 - inverseMass))
+    if remaining is not None and remaining[1] > allowed + tolerance:
+        return f"{Describe(shapeA)} vs {Describe(shapeB)}: {remaining[1]!r} deep after correction, at most {allowed!r}"
+
+def FuzzPolygonCircle(rng):
+    origin = RandomOrigin(rng)
+    shape = RandomShape(rng, origin, 0)
+    reach = shape.GetBoundingRadius()
+    # Now and then exactly on the center, a vertex or an edge midpoint, where the normal degenerates
+    points = shape.GetPoints()
+    choice = rng.random()
+    if choice < 0.05:
+        center = shape.transform.position.Copy()
+    elif choice < 0.1:
+        center = Vec2(*rng.choice(points))
+    elif choice < 0.15:
+        (x1, y1), (x2, y2) = points[0], points[1]
+        center = Vec2((x1 + x2) / 2, (y1 + y2) / 2)
+    else:
+        center = Vec2(origin.x + rng.uniform(-2 * reach, 2 * reach), origin.y + rng.uniform(-2 * reach, 2 * reach))
+    circle = Agar(center, rng.uniform(1, 100))
+    circle.physics.linearVelocity = Vec2(rng.uniform(-500, 500), rng.uniform(-500, 500))
+    circle.physics.mass = rng.uniform(0.25, 4)
+
+    radius = circle.transform.scale
+    closest, dist2 = ClosestPointOnPolygon(points, center.x, center.y)
+    inside = PointInConvexPolygon(points, center.x, center.y, shape.transform.position.x, shape.transform.position.y)
+    before = Momentum((shape, circle))
+    scale = MomentumScale((shape, circle))
+    start = center.Copy()
+    PolygonCircleCollision(shape, circle, correction=1.0)
+    moved = (circle.transform.position - start).Length()
+
+    tolerance = Tolerance(Magnitude(shape), radius) * 100
+    position = circle.transform.position
+    if any(value != value or abs(value) == float("inf") for value in
+           (position.x, position.y, circle.physics.linearVelocity.x, circle.physics.linearVelocity.y,
+            shape.physics.linearVelocity.x, shape.physics.linearVelocity.y, shape.physics.angularVelocity)):
+        return f"{Describe(shape)} circle at {start.AsTuple()} r={radius!r}: produced NaN or infinity"
+
+    # The bounding circle early-out must never skip a circle the edge walk would have caught
+    touching = dist2 ** 0.5 < radius
+    if touching != (moved > 0) and abs(dist2 ** 0.5 - radius) > tolerance:
+        return f"{Describe(shape)} circle at {start.AsTuple()} r={radius!r}: touching={touching} but moved {moved!r}"
+
+    after = Momentum((shape, circle))
+    if abs(after[0] - before[0]) > Tolerance(scale) * 10 or abs(after[1] - before[1]) > Tolerance(scale) * 10:
+        return f"{Describe(shape)} circle at {start.AsTuple()} r={radius!r}: momentum {before} became {after}"
+
+    # From outside, a full correction leaves the circle just touching. From inside, or with the center on the
+    # outline where the normal is rounding noise, only finite output is promised
+    if touching and not inside and dist2 ** 0.5 > tolerance:
+        _, dist2After = ClosestPointOnPolygon(shape.GetPoints(), position.x, position.y)
+        if dist2After ** 0.5 < radius - tolerance:
+            return (f"{Describe(shape)} circle at {start.AsTuple()} r={radius!r}: still "
+                    f"{radius - dist2After ** 0.5!r} deep after full correction")
+
+def FuzzSweptCircleTOI(rng):
+    origin = RandomOrigin(rng)
+    shape = RandomShape(rng, origin, 0)
+    reach = shape.GetBoundingRadius() * 3
+    radius = rng.uniform(0.5, 50)
+    start = Vec2(origin.x + rng.uniform(-reach, reach), origin.y + rng.uniform(-reach, reach))
+    end = Vec2(origin.x + rng.uniform(-reach, reach), origin.y + rng.uniform(-reach, reach))
+    points = shape.GetPoints()
+    cx, cy = shape.transform.position.x, shape.transform.position.y
+
+    def Touches(t):
+        x, y = start.x + (end.x - start.x) * t, start.y + (end.y - start.y) * t
+        return ClosestPointOnPolygon(points, x, y)[1] < radius * radius or PointInConvexPolygon(points, x, y, cx, cy)
+
+    # Dense sampling as the slow reference: nothing may touch before the reported time, and a miss never touches
+    hit = SweptCircleTOI(points, start, end, radius)
+    samples = 256
+    first = next((i / samples for i in range(samples + 1) if Touches(i / samples)), None)
+    step = 1 / samples
+    if hit is None:
+        if first is not None:
+            return f"{Describe(shape)} r={radius!r} {start.AsTuple()}->{end.AsTuple()}: missed, but touches at t={first}"
+        return None
+    t = hit[0]
+    if not 0 <= t <= 1:
+        return f"{Describe(shape)} r={radius!r} {start.AsTuple()}->{end.AsTuple()}: time of impact {t!r} outside the move"
+    if first is not None and first < t - step:
+        return f"{Describe(shape)} r={radius!r} {start.AsTuple()}->{end.AsTuple()}: impact at {t!r}, touching at {first}"
+    if t > 0:
+        x, y = start.x + (end.x - start.x) * t, start.y + (end.y - start.y) * t
+        distance = ClosestPointOnPolygon(points, x, y)[1] ** 0.5
+        if abs(distance - radius) > Tolerance(Magnitude(shape), radius) * 1e3:
+            return f"{Describe(shape)} r={radius!r} {start.AsTuple()}->{end.AsTuple()}: {distance!r} from the shape at impact"
+
+def FuzzBatchSAT(rng):
+    if LoadNumpy() is None:
+        return None
+    pairs = [RandomPair(rng) for _ in range(rng.randint(1, 32))]
+    pointsA, centersA = PackPolygons([a for a, _ in pairs])
+    pointsB, centersB = PackPolygons([b for _, b in pairs])
+    indices, normals, penetrations = BatchSATCollision(pointsA, pointsB, centersA, centersB)
+    batch = {index: (normal, penetration) for index, normal, penetration in
+             zip(indices.tolist(), normals.tolist(), penetrations.tolist())}
+
+    for index, (shapeA, shapeB) in enumerate(pairs):
+        scalar = SATCollision(shapeA, shapeB)
+        tolerance = Tolerance(Magnitude(shapeA, shapeB)) * 100
+        vector = batch.get(index)
+        if (scalar is None) != (vector is None):
+            depth = scalar[1] if scalar is not None else vector[1]
+            if depth > tolerance:
+                return f"{Describe(shapeA)} vs {Describe(shapeB)}: scalar {scalar}, batch {vector}"
+            continue
+        if scalar is not None and abs(scalar[1] - vector[1]) > tolerance:
+            return f"{Describe(shapeA)} vs {Describe(shapeB)}: penetration {scalar[1]!r} scalar, {vector[1]!r} batch"
+
+def RandomField(rng):
+    origin = RandomOrigin(rng)
+    spread = rng.choice((50, 500, 5000))
+    shapes = []
+    for _ in range(rng.randint(0, 60)):
+        shape = RandomShape(rng, origin, spread)
+        if shape.GetBoundingRadius() > spread:
+            shape.size = rng.uniform(5, 150)
+        shapes.append(shape)
+    return shapes
+
+def FuzzBroadphase(rng):
+    # Every broadphase has to report exactly the pairs whose bounds overlap
+    shapes = RandomField(rng)
+    expected = {(i, j) for i in range(len(shapes)) for j in range(i + 1, len(shapes))
+                if AABBCollision(shapes[i], shapes[j])}
+    for broadphase in (BruteForce(), SpatialHash(rng.choice((10, 50, 200, 1000))), SweepAndPrune()):
+        broadphase.Update(shapes)
+        found = {(i, j) if i < j else (j, i) for i, j in broadphase.FindPairs()
+                 if AABBCollision(shapes[i], shapes[j])}
+        if found != expected:
+            return (f"{type(broadphase).__name__} over {len(shapes)} shapes: missing {sorted(expected - found)[:5]}, "
+                    f"extra {sorted(found - expected)[:5]}")
+
+def FuzzBroadphaseQueries(rng):
+    shapes = RandomField(rng)
+    if not shapes:
+        return None
+    anchor = rng.choice(shapes).transform.position
+    x, y = anchor.x + rng.uniform(-300, 300), anchor.y + rng.uniform(-300, 300)
+    radius = rng.uniform(0, 400)
+    end = Vec2(x + rng.uniform(-800, 800), y + rng.uniform(-800, 800))
+    minX, minY = x - rng.uniform(0, 500), y - rng.uniform(0, 500)
+    maxX, maxY = minX + rng.uniform(0, 1000), minY + rng.uniform(0, 1000)
+
+    circles = [(shape.transform.position.x, shape.transform.position.y, shape.GetBoundingRadius()) for shape in shapes]
+    dx, dy = end.x - x, end.y - y
+    length2 = dx*dx + dy*dy
+
+    def SegmentDistance(cx, cy):
+        t = 0.0 if length2 < 1e-12 else max(0.0, min(1.0, ((cx - x) * dx + (cy - y) * dy) / length2))
+        return hypot(x + dx * t - cx, y + dy * t - cy)
+
+    expectedCircle = {i for i, (cx, cy, r) in enumerate(circles) if hypot(cx - x, cy - y) <= r + radius}
+    expectedSwept = {i for i, (cx, cy, r) in enumerate(circles) if SegmentDistance(cx, cy) <= r + radius}
+    expectedCount = sum(1 for cx, cy, _ in circles if minX <= cx < maxX and minY <= cy < maxY)
+    expectedTouch = any(hypot(cx - x, cy - y) < r + radius for cx, cy, r in circles)
+
+    for broadphase in (BruteForce(), SpatialHash(rng.choice((10, 50, 200, 1000))), SweepAndPrune()):
+        name = type(broadphase).__name__
+        broadphase.Update(shapes)
+        index = {id(shape): i for i, shape in enumerate(shapes)}
+        found = {index[id(shape)] for shape in broadphase.QueryCircle(Vec2(x, y), radius)}
+        # Exactly on the boundary the two distance formulas may round apart, only a clear miss counts
+        for i in found ^ expectedCircle:
+            cx, cy, r = circles[i]
+            if abs(hypot(cx - x, cy - y) - (r + radius)) > Tolerance(cx, cy, r + radius) * 100:
+                return f"{name}.QueryCircle disagrees on shape {i}: {Describe(shapes[i])}"
+        found = {index[id(shape)] for shape in broadphase.QuerySweptCircle(Vec2(x, y), end, radius)}
+        for i in found ^ expectedSwept:
+            cx, cy, r = circles[i]
+            if abs(SegmentDistance(cx, cy) - (r + radius)) > Tolerance(cx, cy, r + radius) * 100:
+                return f"{name}.QuerySweptCircle disagrees on shape {i}: {Describe(shapes[i])}"
+        count = broadphase.CountCentersIn(minX, minY, maxX, maxY)
+        if count != expectedCount:
+            return f"{name}.CountCentersIn found {count}, expected {expectedCount}"
+        if broadphase.TouchesCircle(x, y, radius) != expectedTouch:
+            return f"{name}.TouchesCircle says {not expectedTouch}, expected {expectedTouch}"
+
+def RandomPile(rng, count):
+    origin = RandomOrigin(rng)
+    shapes = []
+    for i in range(count):
+        shape = RandomShape(rng, origin, 0)
+        shape.size = rng.uniform(5, 150)
+        shape.entityId = i + 1
+        shapes.append(shape)
+    spread = sum(shape.GetBoundingRadius() for shape in shapes) / count
+    for shape in shapes:
+        shape.transform.position = Vec2(origin.x + rng.uniform(-spread, spread), origin.y + rng.uniform(-spread, spread))
+    return shapes
+
+def FuzzContactSolver(rng):
+    count = rng.randint(2, 8)
+    shapes = RandomPile(rng, count)
+    solver = ContactManager(iterations=rng.randint(1, 12), restitution=rng.uniform(0, 1),
+                            batched=rng.random() < 0.5)
+    broadphase = BruteForce()
+    before = Momentum(shapes)
+    scale = MomentumScale(shapes)
+    broadphase.Update(shapes)
+    touching, _ = solver.Step(broadphase.Pairs())
+
+    # Impulses come in equal and opposite pairs, whatever order or batching applied them
+    after = Momentum(shapes)
+    tolerance = Tolerance(scale) * 100
+    if abs(after[0] - before[0]) > tolerance or abs(after[1] - before[1]) > tolerance:
+        return f"{count} shapes, {touching} contacts: momentum {before} became {after}"
+
+    # With a single contact there is nothing to fight over, the pair must end up not approaching
+    if touching == 1:
+        contact = next(iter(solver.contacts.values()))
+        relative = contact.shapeB.physics.linearVelocity - contact.shapeA.physics.linearVelocity
+        vn = relative.x * contact.nx + relative.y * contact.ny
+        if vn < -tolerance:
+            return f"{Describe(contact.shapeA)} vs {Describe(contact.shapeB)}: still approaching at {vn!r}"
+
+def FuzzContactBatching(rng):
+    # Pairs far apart share no body, so the batched solve is the same sequence of updates as the scalar one
+    if LoadNumpy() is None:
+        return None
+    seed = rng.random()
+    results = []
+    for batched in (False, True):
+        pairRng = Random(seed)
+        shapes = []
+        for k in range(pairRng.randint(1, 12)):
+            pair = RandomPile(pairRng, 2)
+            for shape in pair:
+                shape.transform.position = shape.transform.position + Vec2(k * 1e5, 0)
+                shape.entityId += 2 * k
+            shapes.extend(pair)
+        solver = ContactManager(iterations=pairRng.randint(1, 12), batched=batched)
+        broadphase = SpatialHash(1000)
+        broadphase.Update(shapes)
+        solver.Step(broadphase.Pairs())
+        results.append([(shape.physics.linearVelocity.x, shape.physics.linearVelocity.y) for shape in shapes])
+
+    scalar, batched = results
+    for i, ((sx, sy), (bx, by)) in enumerate(zip(scalar, batched)):
+        if abs(sx - bx) > Tolerance(sx) * 100 or abs(sy - by) > Tolerance(sy) * 100:
+            return f"shape {i}: scalar velocity ({sx!r}, {sy!r}), batched ({bx!r}, {by!r})"
+
+def StateError(shapes, expected):
+    # Largest difference in position, velocity or spin, relative to the size of the expected value
+    error = 0.0
+    for shape, reference in zip(shapes, expected):
+        for actual, value in ((shape.transform.position.x, reference.transform.position.x),
+                              (shape.transform.position.y, reference.transform.position.y),
+                              (shape.transform.rotation, reference.transform.rotation),
+                              (shape.physics.linearVelocity.x, reference.physics.linearVelocity.x),
+                              (shape.physics.linearVelocity.y, reference.physics.linearVelocity.y),
+                              (shape.physics.angularVelocity, reference.physics.angularVelocity)):
+            error = max(error, abs(actual - value) / max(1.0, abs(value)))
+    return error
+
+def RandomCluster(rng, count):
+    # Game sized shapes strewn so each touches a few others. Packed any tighter, whole shapes end up inside others,
+    # where every axis of a regular polygon ties and the case has to be skipped
+    origin = RandomOrigin(rng)
+    shapes = []
+    for _ in range(count):
+        shape = RandomShape(rng, origin, 0)
+        shape.size = rng.uniform(25, 100)
+        shape.transform.scale = 1.0
+        shapes.append(shape)
+    half = sum(shape.GetBoundingRadius() for shape in shapes) / count * count ** 0.5 * rng.choice((1.5, 3.0))
+    for shape in shapes:
+        shape.transform.position = Vec2(origin.x + rng.uniform(-half, half), origin.y + rng.uniform(-half, half))
+    return shapes
+
+def TouchingPairs(shapes):
+    broadphase = BruteForce()
+    broadphase.Update(shapes)
+    return [(a, b) for a, b in broadphase.Pairs() if AABBCollision(a, b) and SATCollision(a, b) is not None]
+
+def FuzzBatchPolygonCollision(rng):
+    # Pairs far apart share no body, so the batch is the same sequence of responses as PolygonCollision
+    if LoadNumpy() is None:
+        return None
+    pairs = []
+    for k in range(rng.randint(1, 16)):
+        shapeA, shapeB = RandomPair(rng)
+        for shape in (shapeA, shapeB):
+            shape.transform.position = shape.transform.position + Vec2(k * 1e5, 0)
+        if AABBCollision(shapeA, shapeB) and SATCollision(shapeA, shapeB) is not None and TiedAxes(shapeA, shapeB):
+            continue
+        pairs.append((shapeA, shapeB))
+    scalar = [(CloneShape(a), CloneShape(b)) for a, b in pairs]
+    hits = sum(PolygonCollision(a, b) for a, b in scalar)
+    batchHits = BatchPolygonCollision(pairs)
+    if hits != batchHits:
+        return f"{len(pairs)} pairs: {hits} scalar collisions, {batchHits} batched"
+    for (a, b), (expectedA, expectedB) in zip(pairs, scalar):
+        error = StateError((a, b), (expectedA, expectedB))
+        if error > Tolerance(Magnitude(a, b)) * 1e3:
+            return f"{Describe(a)} vs {Describe(b)}: batched response differs from PolygonCollision by {error:.2e}"
+
+def FuzzPartitionedWorld(rng):
+    # One step of the worker processes against integrating and resolving every pair one at a time
+    if LoadNumpy() is None:
+        return None
+    shapes = RandomCluster(rng, rng.randint(2, 40))
+    deltaTime = rng.choice((1 / 60, 1 / 20))
+    # Contacts are found after integrating, so that is where ties have to be looked for
+    moved = [CloneShape(shape) for shape in shapes]
+    for shape in moved:
+        shape.physics.Update(shape.transform, deltaTime)
+    if any(TiedAxes(a, b) for a, b in TouchingPairs(moved)):
+        return None
+    expected = PartitionReference(shapes, deltaTime)
+    xs = [shape.transform.position.x for shape in shapes]
+    workers = rng.randint(1, 3)
+    with PartitionedWorld(len(shapes), workers, min(xs), max(xs) + 1) as world:
+        for shape in shapes:
+            world.Add(shape)
+        world.Step(deltaTime)
+        world.WriteBack(shapes)
+    error = StateError(shapes, expected)
+    if error > Tolerance(Magnitude(*expected)) * 1e3:
+        return f"{len(shapes)} shapes on {workers} workers: differs from the scalar step by {error:.2e}"
+
+def FuzzPhysicsWorld(rng):
+    # The bulk step against PhysicsComponent.Update per body, sleep included, and attached shapes must see every move
+    if LoadNumpy() is None:
+        return None
+    count = rng.randint(1, 20)
+    bodies = []
+    for _ in range(count):
+        speed = rng.choice((0.0, 1e-4, 1.0, 500.0))
+        transform = TransformComponent(Vec2(rng.uniform(-1e4, 1e4), rng.uniform(-1e4, 1e4)), rng.uniform(-720, 720))
+        physics = PhysicsComponent(Vec2(rng.uniform(-speed, speed), rng.uniform(-speed, speed)),
+                                   rng.choice((0.0, 1e-4, rng.uniform(-100, 100))), rng.uniform(0.25, 4),
+                                   rng.choice((0.999, 0.5, 0.0)))
+        bodies.append((transform, physics))
+    world = PhysicsWorld(rng.randint(1, 4))
+    attached = [world.Add(transform, physics) for transform, physics in bodies]
+    shape = RandomShape(rng, Vec2(), 100)
+    world.Attach(shape)
+
+    deltaTime = rng.choice((1 / 60, 1 / 20, 0.5))
+    kickStep = rng.randint(0, 60)
+    for step in range(rng.randint(1, 60)):
+        if step == kickStep:
+            # Wake one body the way a collision would, sleeping or not
+            index = rng.randrange(count)
+            kick = Vec2(rng.uniform(-100, 100), rng.uniform(-100, 100))
+            for physics in (bodies[index][1], attached[index].physics):
+                physics.linearVelocity = kick.Copy()
+                physics.Wake()
+        shape.GetPoints()
+        world.Step(deltaTime)
+        for transform, physics in bodies:
+            physics.Update(transform, deltaTime)
+        for index, ((transform, physics), body) in enumerate(zip(bodies, attached)):
+            for actual, value in ((body.transform.position.x, transform.position.x),
+                                  (body.transform.position.y, transform.position.y),
+                                  (body.transform.rotation, transform.rotation),
+                                  (body.physics.linearVelocity.x, physics.linearVelocity.x),
+                                  (body.physics.linearVelocity.y, physics.linearVelocity.y),
+                                  (body.physics.angularVelocity, physics.angularVelocity)):
+                if abs(actual - value) > Tolerance(value) * 10:
+                    return f"body {index} at step {step}: PhysicsWorld {actual!r}, PhysicsComponent {value!r}"
+            if body.physics.sleeping != physics.sleeping:
+                return f"body {index} at step {step}: PhysicsWorld sleeping={body.physics.sleeping}, PhysicsComponent sleeping={physics.sleeping}"
+        expected = ReferencePoints(shape)
+        tolerance = Tolerance(Magnitude(shape)) * 10
+        if any(abs(x - ex) > tolerance or abs(y - ey) > tolerance for (x, y), (ex, ey) in zip(shape.GetPoints(), expected)):
+            return f"{Describe(shape)} at step {step}: attached shape kept stale cached points"
+
+PROPERTIES = {
+    "segment": FuzzClosestPointOnSegment,
+    "polygon": FuzzClosestPointOnPolygon,
+    "cache": FuzzCachedGeometry,
+    "sat": FuzzSATReference,
+    "symmetry": FuzzSATSymmetry,
+    "separation": FuzzSATSeparation,
+    "resolve": FuzzResolvePolygonCollision,
+    "circle": FuzzPolygonCircle,
+    "swept": FuzzSweptCircleTOI,
+    "batchsat": FuzzBatchSAT,
+    "broadphase": FuzzBroadphase,
+    "queries": FuzzBroadphaseQueries,
+    "solver": FuzzContactSolver,
+    "batching": FuzzContactBatching,
+    "batchresolve": FuzzBatchPolygonCollision,
+    "partition": FuzzPartitionedWorld,
+    "physicsworld": FuzzPhysicsWorld,
+}
+
+def RunProperty(name, cases, seed, case=None):
+    Property = PROPERTIES[name]
+    failures = []
+    for index in ([case] if case is not None else range(cases)):
+        try:
+            failure = Property(Random(f"{seed}:{name}:{index}"))
+        except Exception as error:
+            failure = f"raised {type(error).__name__}: {error}"
+        if failure is not None:
+            failures.append((index, failure))
+    return failures
+
+def Main():
+    parser = argparse.ArgumentParser(description="Randomized property and differential checks for collisions.py")
+    parser.add_argument("names", nargs="*", help=f"any of {', '.join(PROPERTIES)}")
+    parser.add_argument("--cases", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--case", type=int, default=None, help="rerun a single failing case")
+    parser.add_argument("--show", type=int, default=3, help="failures printed per property")
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.names or list(PROPERTIES):
+        failures = RunProperty(name, args.cases, args.seed, args.case)
+        cases = 1 if args.case is not None else args.cases
+        print(f"{name:<12} {cases:>6} cases  {'ok' if not failures else f'{len(failures)} FAILED'}")
+        for index, failure in failures[:args.show]:
+            print(f"    --seed {args.seed} --case {index} {name}: {failure}")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    Main()
\ No newline at end of file
@@ -0,0 +1,28 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+class Interpolator:
+    def __init__(self):
+        self.previous = {}
+
+    def Capture(self, world):
+        # Keyed by entityId, so a pooled object reused for a new entity never blends from its old life
+        previous = {}
+        for entities in (world.shapes, world.bullets, world.players):
+            for entity in entities:
+                if entity.entityId is not None:
+                    transform = entity.transform
+                    previous[entity.entityId] = (transform.position.x, transform.position.y, transform.rotation)
+        self.previous = previous
+
+    def Pose(self, entity, alpha):
+        transform = entity.transform
+        position = transform.position
+        last = self.previous.get(entity.entityId)
+        if last is None:
+            return position.x, position.y, transform.rotation
+
+        x, y, rotation = last
+        return (x + (position.x - x) * alpha,
+                y + (position.y - y) * alpha,
+                rotation + (transform.rotation - rotation) * alpha)
\ No newline at end of file
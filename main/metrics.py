@@ -0,0 +1,90 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import json
+import socket
+import time
+from collections import deque
+from profiling import PhaseTimer, Percentile
+from vec2 import Vec2, CountAllocations
+
+class FileSink:
+    def __init__(self, path):
+        self.file = open(path, "a", buffering=1)
+
+    def Write(self, line):
+        self.file.write(line + "\n")
+
+    def Close(self):
+        self.file.close()
+
+class SocketSink:
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def Write(self, line):
+        # Metrics are best effort, a full buffer or a missing listener must never stall a frame
+        try:
+            self.socket.sendto(line.encode() + b"\n", self.address)
+        except OSError:
+            pass
+
+    def Close(self):
+        self.socket.close()
+
+def OpenSink(target):
+    if target.startswith("udp://"):
+        host, port = target[len("udp://"):].rsplit(":", 1)
+        return SocketSink(host, int(port))
+    return FileSink(target)
+
+class Metrics(PhaseTimer):
+    def __init__(self, window=300, sink=None):
+        super().__init__()
+        self.frameTimes = deque(maxlen=window)
+        self.sink = sink
+        self.frameIndex = 0
+        self.last = {"phases": {}, "counters": {}}
+        self.allocationStart = Vec2.allocations
+        CountAllocations(True)
+
+    def EndFrame(self, frameTime=0.0):
+        counters = self.counters
+        counters["Vec2Allocations"] = Vec2.allocations - self.allocationStart
+        self.allocationStart = Vec2.allocations
+        phases = super().EndFrame()
+
+        self.frameTimes.append(frameTime)
+        self.last = {"phases": phases, "counters": counters}
+        if self.sink is not None:
+            self.sink.Write(json.dumps({
+                "frame": self.frameIndex,
+                "time": time.time(),
+                "frameMs": frameTime * 1000,
+                "phasesMs": {name: value * 1000 for name, value in phases.items()},
+                "counters": counters,
+            }))
+        self.frameIndex += 1
+        return phases
+
+    def Percentiles(self):
+        frameTimes = list(self.frameTimes)
+        return Percentile(frameTimes, 0.5), Percentile(frameTimes, 0.99)
+
+    def HudLines(self):
+        p50, p99 = self.Percentiles()
+        lines = [f"Frame p50 {p50 * 1000:.2f}ms p99 {p99 * 1000:.2f}ms"]
+        for name in ("UpdateShapes", "UpdateBullets", "Collision", "Cleanup"):
+            lines.append(f"{name}: {self.last['phases'].get(name, 0.0) * 1000:.2f}ms")
+        for name in ("BroadphasePairs", "NarrowphaseTests", "CollisionsResolved", "Vec2Allocations",
+                     "SleepingShapes", "SleepingPairs", "ContactsCreated", "ContactsWarmStarted",
+                     "EntitiesDrawn", "EntitiesCulled"):
+            lines.append(f"{name}: {self.last['counters'].get(name, 0)}")
+        return lines
+
+    def Close(self):
+        CountAllocations(False)
+        if self.sink is not None:
+            self.sink.Close()
\ No newline at end of file
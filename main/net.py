@@ -0,0 +1,254 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import asyncio
+import struct
+from collections import deque
+from agar import Agar
+from vec2 import Vec2
+from world import PlayerInput, ApplyMovement
+
+POSITION_SCALE = 4
+ROTATION_STEPS = 65536
+NO_BASELINE = 0xFFFFFFFF
+HISTORY = 64
+
+KIND_SHAPE, KIND_BULLET, KIND_PLAYER = 0, 1, 2
+MESSAGE_INPUT, MESSAGE_SNAPSHOT = 1, 2
+FLAG_FULL, FLAG_POSITION, FLAG_ROTATION = 1, 2, 4
+UPGRADE_NAMES = ("FireRate", "Speed", "Damage")
+
+LENGTH = struct.Struct("<I")
+INPUT = struct.Struct("<BIIffffBB")
+SNAPSHOT_HEADER = struct.Struct("<BIIIIHHff")
+RECORD_HEADER = struct.Struct("<IB")
+FULL_RECORD = struct.Struct("<BBBHiiH")
+DELTA_POSITION = struct.Struct("<hh")
+DELTA_ROTATION = struct.Struct("<H")
+REMOVED = struct.Struct("<I")
+
+# 3-3-2 bit palette: one byte per entity instead of an RGB triple
+PALETTE = [((index >> 5) * 255 // 7, ((index >> 2) & 7) * 255 // 7, (index & 3) * 255 // 3) for index in range(256)]
+
+def PaletteIndex(color):
+    r, g, b = color
+    return (r >> 5) << 5 | (g >> 5) << 2 | b >> 6
+
+def QuantizeEntity(entity, kind):
+    # (kind, pointCount, palette, size, x, y, rotation), all integers so baselines compare exactly
+    position = entity.transform.position
+    if kind == KIND_SHAPE:
+        pointCount, size = entity.pointCount, int(entity.size * entity.transform.scale)
+        rotation = int(entity.transform.rotation % 360 / 360 * ROTATION_STEPS) % ROTATION_STEPS
+    else:
+        pointCount, size, rotation = 0, int(entity.transform.scale), 0
+    return (kind, pointCount, PaletteIndex(entity.color), min(size, 0xFFFF),
+            int(round(position.x * POSITION_SCALE)), int(round(position.y * POSITION_SCALE)), rotation)
+
+def DequantizeEntity(state):
+    kind, pointCount, palette, size, x, y, rotation = state
+    return (kind, pointCount, PALETTE[palette], size,
+            Vec2(x / POSITION_SCALE, y / POSITION_SCALE), rotation * 360 / ROTATION_STEPS)
+
+def CollectStates(world, center, viewX, viewY):
+    # Interest management: a client only hears about what is within its view distance
+    states = {}
+    cx, cy = center.x, center.y
+    for kind, entities in ((KIND_SHAPE, world.shapes), (KIND_BULLET, world.bullets), (KIND_PLAYER, world.players)):
+        for entity in entities:
+            position = entity.transform.position
+            if abs(position.x - cx) <= viewX and abs(position.y - cy) <= viewY:
+                states[entity.entityId] = QuantizeEntity(entity, kind)
+    return states
+
+def EncodeSnapshot(tick, baseTick, playerId, states, baseline, inputSequence=0, playerVelocity=(0.0, 0.0)):
+    parts = []
+    count = 0
+    for entityId, state in states.items():
+        old = baseline.get(entityId)
+        if old is not None and old[:4] == state[:4]:
+            dx, dy = state[4] - old[4], state[5] - old[5]
+            flags = 0
+            if dx or dy:
+                flags |= FLAG_POSITION
+            if state[6] != old[6]:
+                flags |= FLAG_ROTATION
+            if not flags:
+                continue
+            if -32768 <= dx <= 32767 and -32768 <= dy <= 32767:
+                parts.append(RECORD_HEADER.pack(entityId, flags))
+                if flags & FLAG_POSITION:
+                    parts.append(DELTA_POSITION.pack(dx, dy))
+                if flags & FLAG_ROTATION:
+                    parts.append(DELTA_ROTATION.pack(state[6]))
+                count += 1
+                continue
+
+        parts.append(RECORD_HEADER.pack(entityId, FLAG_FULL))
+        parts.append(FULL_RECORD.pack(*state))
+        count += 1
+
+    removed = [entityId for entityId in baseline if entityId not in states]
+    parts.extend(REMOVED.pack(entityId) for entityId in removed)
+    # The receiving player's exact velocity and last applied input are what prediction needs to replay from
+    header = SNAPSHOT_HEADER.pack(MESSAGE_SNAPSHOT, tick, baseTick, playerId, inputSequence,
+                                  count, len(removed), *playerVelocity)
+    return header + b"".join(parts)
+
+def DecodeSnapshot(data, baselines):
+    _, tick, baseTick, playerId, inputSequence, count, removedCount, vx, vy = SNAPSHOT_HEADER.unpack_from(data)
+    offset = SNAPSHOT_HEADER.size
+    if baseTick == NO_BASELINE:
+        states = {}
+    elif baseTick in baselines:
+        states = dict(baselines[baseTick])
+    else:
+        raise ValueError(f"Snapshot {tick} is based on unknown tick {baseTick}")
+
+    for _ in range(count):
+        entityId, flags = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if flags & FLAG_FULL:
+            states[entityId] = FULL_RECORD.unpack_from(data, offset)
+            offset += FULL_RECORD.size
+            continue
+
+        kind, pointCount, palette, size, x, y, rotation = states[entityId]
+        if flags & FLAG_POSITION:
+            dx, dy = DELTA_POSITION.unpack_from(data, offset)
+            offset += DELTA_POSITION.size
+            x, y = x + dx, y + dy
+        if flags & FLAG_ROTATION:
+            rotation, = DELTA_ROTATION.unpack_from(data, offset)
+            offset += DELTA_ROTATION.size
+        states[entityId] = (kind, pointCount, palette, size, x, y, rotation)
+
+    for _ in range(removedCount):
+        entityId, = REMOVED.unpack_from(data, offset)
+        offset += REMOVED.size
+        states.pop(entityId, None)
+    return tick, playerId, states, inputSequence, Vec2(vx, vy)
+
+class SnapshotEncoder:
+    def __init__(self, delta=True):
+        self.delta = delta
+        self.history = {}
+        self.ackedTick = None
+
+    def Acknowledge(self, tick):
+        if tick in self.history and (self.ackedTick is None or tick > self.ackedTick):
+            self.ackedTick = tick
+
+    def Encode(self, tick, playerId, states, inputSequence=0, playerVelocity=(0.0, 0.0)):
+        baseline = self.history.get(self.ackedTick) if self.delta else None
+        baseTick = self.ackedTick if baseline is not None else NO_BASELINE
+        data = EncodeSnapshot(tick, baseTick, playerId, states, baseline or {}, inputSequence, playerVelocity)
+
+        # Nothing older than the acknowledged tick can be used as a baseline again
+        self.history[tick] = states
+        for old in [old for old in self.history if old < tick - HISTORY or
+                    (self.ackedTick is not None and old < self.ackedTick)]:
+            del self.history[old]
+        return data
+
+class SnapshotDecoder:
+    def __init__(self):
+        self.history = {}
+        self.tick = None
+        self.playerId = None
+        self.states = {}
+        self.inputSequence = 0
+        self.playerVelocity = Vec2()
+
+    def Decode(self, data):
+        tick, playerId, states, inputSequence, playerVelocity = DecodeSnapshot(data, self.history)
+        self.history[tick] = states
+        for old in [old for old in self.history if old < tick - HISTORY]:
+            del self.history[old]
+        self.tick, self.playerId, self.states = tick, playerId, states
+        self.inputSequence, self.playerVelocity = inputSequence, playerVelocity
+        return states
+
+def EncodeInput(playerInput, ackTick, sequence=0):
+    upgrades = sum(1 << UPGRADE_NAMES.index(name) for name in playerInput.upgrades)
+    return INPUT.pack(MESSAGE_INPUT, NO_BASELINE if ackTick is None else ackTick, sequence,
+                      playerInput.move.x, playerInput.move.y, playerInput.aim.x, playerInput.aim.y,
+                      bool(playerInput.shooting), upgrades)
+
+def DecodeInput(data):
+    _, ackTick, sequence, moveX, moveY, aimX, aimY, shooting, upgrades = INPUT.unpack(data)
+    names = [name for bit, name in enumerate(UPGRADE_NAMES) if upgrades & (1 << bit)]
+    playerInput = PlayerInput(Vec2(moveX, moveY), Vec2(aimX, aimY), bool(shooting), names)
+    return playerInput, None if ackTick == NO_BASELINE else ackTick, sequence
+
+async def ReadMessage(reader):
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(length)
+
+def WriteMessage(writer, payload):
+    writer.write(LENGTH.pack(len(payload)) + payload)
+
+class PlayerPredictor:
+    def __init__(self, playerSpeed, tickRate):
+        self.player = Agar(Vec2(), 30)
+        self.playerSpeed = playerSpeed
+        self.dt = 1.0 / tickRate
+        self.sequence = 0
+        self.pending = deque()
+        self.correction = 0.0
+
+    def Predict(self, move):
+        # Run the same movement the server will, without waiting for it
+        self.sequence += 1
+        self.pending.append((self.sequence, move.Copy()))
+        self.Apply(move)
+        return self.sequence
+
+    def Apply(self, move):
+        ApplyMovement(self.player, move, self.playerSpeed, self.dt)
+        self.player.physics.Update(self.player.transform, self.dt)
+
+    def Reconcile(self, sequence, position, velocity):
+        # Rewind to the authoritative state and replay every input the server has not applied yet
+        predicted = self.player.transform.position.Copy()
+        while self.pending and self.pending[0][0] <= sequence:
+            self.pending.popleft()
+
+        player = self.player
+        player.transform.position = player.transform.position.Set(position.x, position.y)
+        player.physics.linearVelocity = player.physics.linearVelocity.Set(velocity.x, velocity.y)
+        player.physics.Wake()
+        for _, move in self.pending:
+            self.Apply(move)
+        self.correction = (player.transform.position - predicted).Length()
+
+class Client:
+    def __init__(self, predictor=None):
+        self.decoder = SnapshotDecoder()
+        self.predictor = predictor
+        self.reader = None
+        self.writer = None
+        self.bytesReceived = 0
+
+    async def Connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    def Send(self, playerInput):
+        sequence = self.predictor.Predict(playerInput.move) if self.predictor is not None else 0
+        WriteMessage(self.writer, EncodeInput(playerInput, self.decoder.tick, sequence))
+
+    async def Receive(self):
+        data = await ReadMessage(self.reader)
+        self.bytesReceived += LENGTH.size + len(data)
+        decoder = self.decoder
+        states = decoder.Decode(data)
+
+        state = states.get(decoder.playerId)
+        if self.predictor is not None and state is not None:
+            position = DequantizeEntity(state)[4]
+            self.predictor.Reconcile(decoder.inputSequence, position, decoder.playerVelocity)
+        return states
+
+    async def Close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
\ No newline at end of file
@@ -0,0 +1,281 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import multiprocessing
+from multiprocessing import shared_memory
+from collisions import BatchSATCollision
+from physicsworld import Integrate
+from shape import GetPolygonTemplate
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAX_POINTS = 8
+
+LAYOUT = (
+    ("positions", "f8", (2,)),
+    ("velocities", "f8", (2,)),
+    ("rotations", "f8", ()),
+    ("angularVelocities", "f8", ()),
+    ("masses", "f8", ()),
+    ("drags", "f8", ()),
+    ("sizes", "f8", ()),
+    ("pointCounts", "i4", ()),
+    ("regions", "i4", ()),
+    ("deltaPositions", "f8", (2,)),
+    ("deltaVelocities", "f8", (2,)),
+    ("deltaAngularVelocities", "f8", ()),
+)
+
+def AttachArrays(names, capacity):
+    arrays = {}
+    handles = []
+    for (name, dtype, tail), memoryName in zip(LAYOUT, names):
+        handle = shared_memory.SharedMemory(name=memoryName)
+        handles.append(handle)
+        arrays[name] = np.ndarray((capacity,) + tail, dtype=dtype, buffer=handle.buf)
+    return arrays, handles
+
+def TemplateArray():
+    # Row k holds the unit k-gon padded to MAX_POINTS by repeating its last vertex, as PackPolygons does
+    templates = np.zeros((MAX_POINTS + 1, MAX_POINTS, 2))
+    for pointCount in range(3, MAX_POINTS + 1):
+        points = list(GetPolygonTemplate(pointCount).points)
+        templates[pointCount] = points + [points[-1]] * (MAX_POINTS - pointCount)
+    return templates
+
+def WorldVertices(arrays, indices, templates):
+    local = templates[arrays["pointCounts"][indices]] * arrays["sizes"][indices][:, None, None]
+    angles = np.radians(arrays["rotations"][indices])
+    c, s = np.cos(angles)[:, None], np.sin(angles)[:, None]
+    x, y = local[..., 0], local[..., 1]
+    positions = arrays["positions"][indices]
+    return np.stack((x * c - y * s + positions[:, 0:1], x * s + y * c + positions[:, 1:2]), axis=-1)
+
+def CandidatePairs(points):
+    mins = points.min(axis=1)
+    maxs = points.max(axis=1)
+    order = np.argsort(mins[:, 0], kind="stable")
+    sortedMinX = mins[order, 0]
+
+    # Sweep and prune on x without a Python loop: every i pairs with the sorted run whose minX <= its maxX
+    ends = np.searchsorted(sortedMinX, maxs[order, 0], side="right")
+    starts = np.arange(1, len(order) + 1)
+    counts = np.maximum(ends - starts, 0)
+    first = np.repeat(np.arange(len(order)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = first + 1 + offsets
+
+    a, b = order[first], order[second]
+    overlapY = (mins[a, 1] <= maxs[b, 1]) & (mins[b, 1] <= maxs[a, 1])
+    a, b = a[overlapY], b[overlapY]
+    swap = a > b
+    return np.where(swap, b, a), np.where(swap, a, b)
+
+def IntegrateRegion(arrays, count, region, deltaTime):
+    owned = np.nonzero(arrays["regions"][:count] == region)[0]
+    positions = arrays["positions"][owned]
+    velocities = arrays["velocities"][owned]
+    rotations = arrays["rotations"][owned]
+    angularVelocities = arrays["angularVelocities"][owned]
+    Integrate(positions, velocities, rotations, angularVelocities, arrays["drags"][owned], deltaTime)
+    arrays["positions"][owned] = positions
+    arrays["velocities"][owned] = velocities
+    arrays["rotations"][owned] = rotations
+    arrays["angularVelocities"][owned] = angularVelocities
+    return len(owned)
+
+def CollideRegion(arrays, count, region, bounds, margin, templates, restitution=0.8, percent=1.0, angularFactor=0.05):
+    low, high = bounds
+    x = arrays["positions"][:count, 0]
+    ownedMask = arrays["regions"][:count] == region
+    indices = np.nonzero(ownedMask | ((x >= low - margin) & (x < high + margin)))[0]
+    owned = ownedMask[indices]
+
+    deltaPositions = np.zeros((len(indices), 2))
+    deltaVelocities = np.zeros((len(indices), 2))
+    deltaAngular = np.zeros(len(indices))
+    resolved = 0
+
+    if len(indices) > 1:
+        points = WorldVertices(arrays, indices, templates)
+        a, b = CandidatePairs(points)
+        keep = owned[a] | owned[b]
+        a, b = a[keep], b[keep]
+
+        centers = arrays["positions"][indices]
+        hits, normals, penetrations = BatchSATCollision(points[a], points[b], centers[a], centers[b])
+        a, b = a[hits], b[hits]
+        resolved = int(owned[a].sum())
+
+        masses = arrays["masses"][indices]
+        invA = np.where(masses[a] > 0, 1.0 / np.where(masses[a] > 0, masses[a], 1.0), 0.0)
+        invB = np.where(masses[b] > 0, 1.0 / np.where(masses[b] > 0, masses[b], 1.0), 0.0)
+
+        # Same response as ResolvePolygonCollision, but every body accumulates from the pre-step state
+        correction = normals * (penetrations * percent)[:, None]
+        moveA = -correction * invA[:, None]
+        moveB = correction * invB[:, None]
+
+        # Normals point from A to B, so only a positive closing speed gets an impulse
+        velocities = arrays["velocities"][indices]
+        velAlongNormal = np.einsum("nd,nd->n", velocities[a] - velocities[b], normals)
+        approaching = velAlongNormal > 0
+        invSum = invA + invB
+        j = np.where(approaching, (1 + restitution) * velAlongNormal / np.where(invSum != 0, invSum, 1.0), 0.0)
+        impulse = normals * j[:, None]
+
+        offset = ((centers[a] + moveA) - (centers[b] + moveB)) * 0.5
+        spin = np.where(approaching, (offset[:, 0] * normals[:, 1] - offset[:, 1] * normals[:, 0]) * angularFactor, 0.0)
+
+        sideA = owned[a]
+        sideB = owned[b]
+        np.add.at(deltaPositions, a[sideA], moveA[sideA])
+        np.add.at(deltaPositions, b[sideB], moveB[sideB])
+        np.add.at(deltaVelocities, a[sideA], -impulse[sideA] * invA[sideA, None])
+        np.add.at(deltaVelocities, b[sideB], impulse[sideB] * invB[sideB, None])
+        np.add.at(deltaAngular, a[sideA], spin[sideA])
+        np.add.at(deltaAngular, b[sideB], -spin[sideB])
+
+    # Each worker only ever writes the rows it owns, so no locking is needed
+    ownedIndices = indices[owned]
+    arrays["deltaPositions"][ownedIndices] = deltaPositions[owned]
+    arrays["deltaVelocities"][ownedIndices] = deltaVelocities[owned]
+    arrays["deltaAngularVelocities"][ownedIndices] = deltaAngular[owned]
+    return resolved
+
+def RegionWorker(connection, names, capacity, region):
+    arrays, handles = AttachArrays(names, capacity)
+    templates = TemplateArray()
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            command, count, deltaTime, bounds, margin = message
+            if command == "integrate":
+                connection.send(IntegrateRegion(arrays, count, region, deltaTime))
+            else:
+                connection.send(CollideRegion(arrays, count, region, bounds, margin, templates))
+    finally:
+        arrays.clear()
+        for handle in handles:
+            handle.close()
+
+class PartitionedWorld:
+    def __init__(self, capacity, workers, minX, maxX):
+        if np is None:
+            raise ImportError("PartitionedWorld requires numpy")
+
+        self.capacity = capacity
+        self.count = 0
+        self.regionCount = workers
+        self.minX = minX
+        self.stripWidth = (maxX - minX) / workers
+        self.handoffs = 0
+        self.resolved = 0
+
+        self.handles = []
+        self.arrays = {}
+        for name, dtype, tail in LAYOUT:
+            size = max(1, capacity * np.dtype(dtype).itemsize * int(np.prod(tail, dtype=int)))
+            handle = shared_memory.SharedMemory(create=True, size=size)
+            self.handles.append(handle)
+            self.arrays[name] = np.ndarray((capacity,) + tail, dtype=dtype, buffer=handle.buf)
+            self.arrays[name][:] = 0
+
+        names = [handle.name for handle in self.handles]
+        self.connections = []
+        self.processes = []
+        for region in range(workers):
+            parentConnection, childConnection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=RegionWorker,
+                                              args=(childConnection, names, capacity, region), daemon=True)
+            process.start()
+            self.connections.append(parentConnection)
+            self.processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+    def Add(self, shape):
+        if self.count == self.capacity:
+            raise ValueError("PartitionedWorld is full")
+
+        index = self.count
+        self.count += 1
+        arrays = self.arrays
+        arrays["positions"][index] = shape.transform.position.AsTuple()
+        arrays["velocities"][index] = shape.physics.linearVelocity.AsTuple()
+        arrays["rotations"][index] = shape.transform.rotation
+        arrays["angularVelocities"][index] = shape.physics.angularVelocity
+        arrays["masses"][index] = shape.physics.mass
+        arrays["drags"][index] = shape.physics.drag
+        arrays["sizes"][index] = shape.size * shape.transform.scale
+        arrays["pointCounts"][index] = shape.pointCount
+        arrays["regions"][index] = self.RegionOf(shape.transform.position.x)
+        return index
+
+    def RegionOf(self, x):
+        return min(self.regionCount - 1, max(0, int((x - self.minX) // self.stripWidth)))
+
+    def RegionBounds(self, region):
+        low = self.minX + region * self.stripWidth if region > 0 else -float("inf")
+        high = self.minX + (region + 1) * self.stripWidth if region < self.regionCount - 1 else float("inf")
+        return low, high
+
+    def AssignRegions(self):
+        regions = self.arrays["regions"][:self.count]
+        updated = np.clip(((self.arrays["positions"][:self.count, 0] - self.minX) // self.stripWidth).astype(np.int64),
+                          0, self.regionCount - 1)
+        self.handoffs += int((updated != regions).sum())
+        regions[:] = updated
+
+    def Broadcast(self, command, deltaTime, margin=0.0):
+        for region, connection in enumerate(self.connections):
+            connection.send((command, self.count, deltaTime, self.RegionBounds(region), margin))
+        return [connection.recv() for connection in self.connections]
+
+    def Step(self, deltaTime):
+        count = self.count
+        arrays = self.arrays
+        self.Broadcast("integrate", deltaTime)
+
+        # Hand bodies that crossed a border over to their new region before anyone looks for contacts
+        self.AssignRegions()
+
+        # A neighbour can only touch an owned body if its center is within two of the largest radii of the border
+        margin = 2 * float(arrays["sizes"][:count].max()) if count else 0.0
+        self.resolved = sum(self.Broadcast("collide", deltaTime, margin))
+
+        arrays["positions"][:count] += arrays["deltaPositions"][:count]
+        arrays["velocities"][:count] += arrays["deltaVelocities"][:count]
+        arrays["angularVelocities"][:count] += arrays["deltaAngularVelocities"][:count]
+
+    def WriteBack(self, shapes):
+        arrays = self.arrays
+        for index, shape in enumerate(shapes[:self.count]):
+            x, y = arrays["positions"][index]
+            vx, vy = arrays["velocities"][index]
+            shape.transform.position = shape.transform.position.Set(float(x), float(y))
+            shape.transform.rotation = float(arrays["rotations"][index])
+            shape.physics.linearVelocity = shape.physics.linearVelocity.Set(float(vx), float(vy))
+            shape.physics.angularVelocity = float(arrays["angularVelocities"][index])
+
+    def Close(self):
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+        self.arrays = {}
+        for handle in self.handles:
+            handle.close()
+            handle.unlink()
+        self.handles = []
\ No newline at end of file
@@ -0,0 +1,258 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+from components import TransformComponent, PhysicsComponent
+from vec2 import Vec2
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class Body:
+    def __init__(self, world, index):
+        self.world = world
+        self.index = index
+        self.transform = TransformView(self)
+        self.physics = PhysicsView(self)
+
+class TransformView:
+    def __init__(self, body):
+        self.body = body
+        # One Vec2 per view, refreshed when the row's version moves on, like the one a TransformComponent holds
+        self.cachedPosition = Vec2()
+        self.cachedVersion = -1
+
+    @property
+    def version(self):
+        # item() hands back a Python number directly, indexing then converting costs several times more
+        return self.body.world.versions.item(self.body.index)
+
+    @property
+    def position(self):
+        world, index = self.body.world, self.body.index
+        version = world.versions.item(index)
+        if version != self.cachedVersion:
+            positions = world.positions
+            self.cachedPosition.Set(positions.item(index, 0), positions.item(index, 1))
+            self.cachedVersion = version
+        return self.cachedPosition
+
+    @position.setter
+    def position(self, value):
+        self.body.world.positions[self.body.index] = (value.x, value.y)
+        self.body.world.versions[self.body.index] += 1
+
+    @property
+    def rotation(self):
+        return self.body.world.rotations.item(self.body.index)
+
+    @rotation.setter
+    def rotation(self, value):
+        self.body.world.rotations[self.body.index] = value
+        self.body.world.versions[self.body.index] += 1
+
+    @property
+    def scale(self):
+        return self.body.world.scales.item(self.body.index)
+
+    @scale.setter
+    def scale(self, value):
+        self.body.world.scales[self.body.index] = value
+        self.body.world.versions[self.body.index] += 1
+
+    def Reset(self, position, rotation=0, scale=1):
+        self.position = position
+        self.rotation = rotation
+        self.scale = scale
+
+class PhysicsView:
+    def __init__(self, body):
+        self.body = body
+
+    @property
+    def linearVelocity(self):
+        velocities, index = self.body.world.velocities, self.body.index
+        return Vec2(velocities.item(index, 0), velocities.item(index, 1))
+
+    @linearVelocity.setter
+    def linearVelocity(self, value):
+        self.body.world.velocities[self.body.index] = (value.x, value.y)
+
+    @property
+    def angularVelocity(self):
+        return self.body.world.angularVelocities.item(self.body.index)
+
+    @angularVelocity.setter
+    def angularVelocity(self, value):
+        self.body.world.angularVelocities[self.body.index] = value
+
+    @property
+    def mass(self):
+        return self.body.world.masses.item(self.body.index)
+
+    @mass.setter
+    def mass(self, value):
+        self.body.world.masses[self.body.index] = value
+
+    @property
+    def drag(self):
+        return self.body.world.drags.item(self.body.index)
+
+    @drag.setter
+    def drag(self, value):
+        self.body.world.drags[self.body.index] = value
+
+    @property
+    def sleeping(self):
+        return bool(self.body.world.sleeping.item(self.body.index))
+
+    @sleeping.setter
+    def sleeping(self, value):
+        self.body.world.sleeping[self.body.index] = value
+
+    @property
+    def sleepTimer(self):
+        return self.body.world.sleepTimers.item(self.body.index)
+
+    @sleepTimer.setter
+    def sleepTimer(self, value):
+        self.body.world.sleepTimers[self.body.index] = value
+
+    def Reset(self, angularVelocity=0.0, mass=1.0, drag=0.999):
+        self.linearVelocity = Vec2()
+        self.angularVelocity = angularVelocity
+        self.mass = mass
+        self.drag = drag
+        self.Wake()
+
+    def Wake(self):
+        self.sleeping = False
+        self.sleepTimer = 0
+
+    def Sleep(self):
+        self.sleeping = True
+        self.linearVelocity = Vec2()
+        self.angularVelocity = 0.0
+
+    def Update(self, transformComponent, deltaTime):
+        self.body.world.StepRange(self.body.index, self.body.index + 1, deltaTime)
+
+class PhysicsWorld:
+    def __init__(self, capacity=1024):
+        if np is None:
+            raise ImportError("PhysicsWorld requires numpy")
+
+        self.count = 0
+        self.bodies = []
+        self.positions = np.zeros((capacity, 2))
+        self.velocities = np.zeros((capacity, 2))
+        self.rotations = np.zeros(capacity)
+        self.angularVelocities = np.zeros(capacity)
+        self.scales = np.ones(capacity)
+        self.masses = np.ones(capacity)
+        self.drags = np.full(capacity, 0.999)
+        self.versions = np.zeros(capacity, dtype=np.int64)
+        self.sleeping = np.zeros(capacity, dtype=bool)
+        self.sleepTimers = np.zeros(capacity, dtype=np.int64)
+
+    def Grow(self):
+        capacity = len(self.rotations) * 2
+        for name in ("positions", "velocities", "rotations", "angularVelocities", "scales", "masses", "drags",
+                     "versions", "sleeping", "sleepTimers"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def Add(self, transform=None, physics=None):
+        transform = transform or TransformComponent()
+        physics = physics or PhysicsComponent()
+        if self.count == len(self.rotations):
+            self.Grow()
+
+        index = self.count
+        self.count += 1
+        body = Body(self, index)
+        self.bodies.append(body)
+
+        body.transform.position = transform.position
+        body.transform.rotation = transform.rotation
+        body.transform.scale = transform.scale
+        body.physics.linearVelocity = physics.linearVelocity
+        body.physics.angularVelocity = physics.angularVelocity
+        body.physics.mass = physics.mass
+        body.physics.drag = physics.drag
+        body.physics.sleeping = physics.sleeping
+        body.physics.sleepTimer = physics.sleepTimer
+        return body
+
+    def Remove(self, body):
+        index = body.index
+        last = self.count - 1
+        if index != last:
+            for array in (self.positions, self.velocities, self.rotations, self.angularVelocities,
+                          self.scales, self.masses, self.drags, self.versions, self.sleeping, self.sleepTimers):
+                array[index] = array[last]
+            moved = self.bodies[last]
+            moved.index = index
+            self.bodies[index] = moved
+        self.bodies.pop()
+        self.count = last
+        body.world = None
+
+    def Attach(self, entity):
+        body = self.Add(entity.transform, entity.physics)
+        entity.transform = body.transform
+        entity.physics = body.physics
+        return body
+
+    def Detach(self, entity):
+        body = entity.transform.body
+        entity.transform = TransformComponent(body.transform.position, body.transform.rotation, body.transform.scale)
+        entity.physics = PhysicsComponent(body.physics.linearVelocity, body.physics.angularVelocity,
+                                          body.physics.mass, body.physics.drag)
+        entity.physics.sleeping = body.physics.sleeping
+        entity.physics.sleepTimer = body.physics.sleepTimer
+        self.Remove(body)
+
+    def Step(self, deltaTime):
+        self.StepRange(0, self.count, deltaTime)
+
+    def StepRange(self, start, end, deltaTime):
+        # Sleeping bodies are left out the way PhysicsComponent.Update returns early for them. While every body
+        # is awake the rows are slices and integrate in place, otherwise the awake rows are gathered and written back
+        rows = slice(start, end)
+        if self.sleeping[rows].any():
+            rows = np.flatnonzero(~self.sleeping[rows]) + start
+        positions, velocities, rotations = self.positions[rows], self.velocities[rows], self.rotations[rows]
+        angularVelocities = self.angularVelocities[rows]
+        self.versions[rows] += (velocities != 0.0).any(axis=1) | (angularVelocities != 0.0)
+        Integrate(positions, velocities, rotations, angularVelocities, self.drags[rows], deltaTime)
+
+        limit = PhysicsComponent.SLEEP_LINEAR_SPEED
+        slow = ((np.einsum("ij,ij->i", velocities, velocities) < limit * limit) &
+                (np.abs(angularVelocities) < PhysicsComponent.SLEEP_ANGULAR_SPEED))
+        timers = np.where(slow, self.sleepTimers[rows] + 1, 0)
+        asleep = timers >= PhysicsComponent.SLEEP_TICKS
+        velocities[asleep] = 0.0
+        angularVelocities[asleep] = 0.0
+        self.sleepTimers[rows] = timers
+        self.sleeping[rows] = asleep
+        if not isinstance(rows, slice):
+            self.positions[rows] = positions
+            self.velocities[rows] = velocities
+            self.rotations[rows] = rotations
+            self.angularVelocities[rows] = angularVelocities
+
+def Integrate(positions, velocities, rotations, angularVelocities, drags, deltaTime):
+    damping = (1.0 - drags) ** deltaTime
+
+    # Resting bodies have zero velocity, so integrating them unconditionally is a no-op
+    positions += velocities * deltaTime
+    velocities *= damping[:, None]
+    velocities[np.einsum("ij,ij->i", velocities, velocities) < 0.001 * 0.001] = 0.0
+
+    rotations += angularVelocities * deltaTime
+    angularVelocities *= damping
+    angularVelocities[np.abs(angularVelocities) < 0.001] = 0.0
\ No newline at end of file
@@ -0,0 +1,38 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+class Pool:
+    def __init__(self, factory, capacity=512):
+        self.factory = factory
+        self.capacity = capacity
+        self.free = []
+        self.created = 0
+        self.reused = 0
+
+    def Acquire(self):
+        if self.free:
+            self.reused += 1
+            return self.free.pop()
+        self.created += 1
+        return self.factory()
+
+    def Release(self, item):
+        # Past capacity the item is simply dropped and left to the garbage collector
+        if len(self.free) < self.capacity:
+            self.free.append(item)
+
+def SwapRemove(items, index):
+    last = items.pop()
+    if index < len(items):
+        items[index] = last
+
+def RemoveWhere(items, predicate, pool=None):
+    i = 0
+    while i < len(items):
+        item = items[i]
+        if predicate(item):
+            SwapRemove(items, i)
+            if pool is not None:
+                pool.Release(item)
+        else:
+            i += 1
\ No newline at end of file
@@ -0,0 +1,43 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import time
+from contextlib import contextmanager, nullcontext
+
+class NullTimer:
+    def __init__(self):
+        self.context = nullcontext()
+
+    def Phase(self, name):
+        return self.context
+
+    def Count(self, name, amount=1):
+        pass
+
+class PhaseTimer:
+    def __init__(self):
+        self.frame = {}
+        self.counters = {}
+
+    def Count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def Phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.frame[name] = self.frame.get(name, 0.0) + time.perf_counter() - start
+
+    def EndFrame(self):
+        frame = self.frame
+        self.frame = {}
+        self.counters = {}
+        return frame
+
+def Percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
\ No newline at end of file
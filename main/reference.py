@@ -0,0 +1,51 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+# Slow scalar versions of the batched paths, shared by bench.py and fuzz.py to check them against
+from broadphase import SweepAndPrune
+from collisions import AABBCollision, SATCollision, ResolvePolygonCollision
+from shape import Shape
+
+def CloneShape(shape):
+    clone = Shape(shape.transform.position.Copy(), shape.pointCount, shape.size)
+    clone.transform.rotation = shape.transform.rotation
+    clone.transform.scale = shape.transform.scale
+    clone.physics.linearVelocity = shape.physics.linearVelocity.Copy()
+    clone.physics.angularVelocity = shape.physics.angularVelocity
+    clone.physics.mass = shape.physics.mass
+    clone.physics.drag = shape.physics.drag
+    return clone
+
+def PartitionReference(shapes, deltaTime):
+    # One PartitionedWorld step done the slow way: integrate every shape, then resolve each touching pair with
+    # ResolvePolygonCollision on its own copies of the integrated pair and sum the changes per shape
+    moved = [CloneShape(shape) for shape in shapes]
+    for shape in moved:
+        shape.physics.Update(shape.transform, deltaTime)
+    broadphase = SweepAndPrune()
+    broadphase.Update(moved)
+
+    deltas = {id(shape): [0.0] * 5 for shape in moved}
+    for shapeA, shapeB in broadphase.Pairs():
+        if not AABBCollision(shapeA, shapeB):
+            continue
+        result = SATCollision(shapeA, shapeB)
+        if result is None:
+            continue
+        resolvedA, resolvedB = CloneShape(shapeA), CloneShape(shapeB)
+        ResolvePolygonCollision(resolvedA, resolvedB, *result)
+        for shape, resolved in ((shapeA, resolvedA), (shapeB, resolvedB)):
+            delta = deltas[id(shape)]
+            delta[0] += resolved.transform.position.x - shape.transform.position.x
+            delta[1] += resolved.transform.position.y - shape.transform.position.y
+            delta[2] += resolved.physics.linearVelocity.x - shape.physics.linearVelocity.x
+            delta[3] += resolved.physics.linearVelocity.y - shape.physics.linearVelocity.y
+            delta[4] += resolved.physics.angularVelocity - shape.physics.angularVelocity
+
+    for shape in moved:
+        dx, dy, dvx, dvy, dw = deltas[id(shape)]
+        position, velocity = shape.transform.position, shape.physics.linearVelocity
+        shape.transform.position = position.Set(position.x + dx, position.y + dy)
+        shape.physics.linearVelocity = velocity.Set(velocity.x + dvx, velocity.y + dvy)
+        shape.physics.angularVelocity += dw
+    return moved
\ No newline at end of file
@@ -0,0 +1,135 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import pygame
+from shape import TransformPoints
+from vec2 import Vec2
+
+fonts = {}
+
+def LoadFont(size):
+    # pygame's bundled default font, so startup never waits on a system font lookup
+    font = fonts.get(size)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = fonts[size] = pygame.font.Font(None, size)
+    return font
+
+class Renderer:
+    def __init__(self, screen: pygame.Surface, font):
+        self.screen = screen
+        self.font = font
+        self.WIDTH, self.HEIGHT = screen.get_size()
+        self.interpolator = None
+        self.alpha = 1.0
+        self.drawn = 0
+        self.culled = 0
+
+    def Draw(self, world, fps, mousePos, alpha=1.0, interpolator=None):
+        # With an interpolator everything is drawn alpha of the way from the previous tick to the current one
+        self.screen.fill((0, 0, 0))
+        self.alpha = alpha
+        self.interpolator = interpolator
+
+        playerX, playerY, _ = self.Pose(world.player)
+        offset = Vec2(self.WIDTH // 2 - playerX, self.HEIGHT // 2 - playerY)
+        self.DrawEntities(world, offset)
+        self.DrawAgar(world.player, offset)
+
+        self.DrawAimIndicator(mousePos)
+        self.DrawHUD(world, fps)
+
+    def DrawEntities(self, world, offset):
+        # Camera rectangle in world space, anything whose bounds miss it is never handed to pygame
+        left, top = -offset.x, -offset.y
+        right, bottom = left + self.WIDTH, top + self.HEIGHT
+        drawn = culled = 0
+
+        for shape in world.shapes:
+            # The bounding circle needs no vertex transform, unlike the AABB of a shape that just rotated
+            x, y = shape.transform.position.x, shape.transform.position.y
+            radius = shape.GetBoundingRadius()
+            if x + radius < left or x - radius > right or y + radius < top or y - radius > bottom:
+                culled += 1
+                continue
+            self.DrawShape(shape, offset)
+            drawn += 1
+
+        for bullet in world.bullets:
+            x, y = bullet.transform.position.x, bullet.transform.position.y
+            radius = bullet.transform.scale
+            if x + radius < left or x - radius > right or y + radius < top or y - radius > bottom:
+                culled += 1
+                continue
+            self.DrawAgar(bullet, offset)
+            drawn += 1
+
+        self.drawn = drawn
+        self.culled = culled
+        world.timer.Count("EntitiesDrawn", drawn)
+        world.timer.Count("EntitiesCulled", culled)
+
+    def Pose(self, entity):
+        if self.interpolator is None:
+            transform = entity.transform
+            return transform.position.x, transform.position.y, transform.rotation
+        return self.interpolator.Pose(entity, self.alpha)
+
+    def DrawShape(self, shape, offset):
+        if self.interpolator is None:
+            points = shape.GetPoints()
+        else:
+            x, y, rotation = self.interpolator.Pose(shape, self.alpha)
+            points = TransformPoints(shape.template.points, x, y, rotation, shape.size * shape.transform.scale)
+        pygame.draw.polygon(self.screen, shape.color,
+                            [(x + offset.x, y + offset.y) for x, y in points], 3)
+
+    def DrawAgar(self, agar, offset):
+        x, y, _ = self.Pose(agar)
+        pygame.draw.circle(self.screen, agar.color,
+                           (x + offset.x, y + offset.y),
+                           agar.transform.scale, 3)
+
+    def DrawHUD(self, world, fps):
+        fpsText = self.font.render(f"FPS: {int(fps)}", True, (255, 255, 255))
+        self.screen.blit(fpsText, (10, 10))
+
+        upgrades = world.upgrades
+        maxLevel = world.MAX_UPGRADE_LEVEL
+        statsLines = [
+            f"Fragments: {world.fragments}",
+            f"Fire Rate: x{upgrades['FireRate']['Multiplier']:.1f} ({upgrades['FireRate']['Level'] if upgrades['FireRate']['Level'] < maxLevel else 'MAX'})",
+            f"Speed: x{upgrades['Speed']['Multiplier']:.1f}",
+            f"Damage: x{upgrades['Damage']['Multiplier']:.1f}"
+        ]
+
+        for i, line in enumerate(statsLines):
+            text = self.font.render(line, True, (255, 255, 255))
+            self.screen.blit(text, (self.WIDTH - 200, 10 + i * 20))
+
+        tipsLines = [
+            "Upgrades: 1-3",
+            f"1: Fire Rate (cost {world.UPGRADE_COSTS[upgrades['FireRate']['Level']] if upgrades['FireRate']['Level'] < maxLevel else 'MAX'})",
+            f"2: Speed (cost {world.UPGRADE_COSTS[upgrades['Speed']['Level']] if upgrades['Speed']['Level'] < maxLevel else 'MAX'})",
+            f"3: Damage (cost {world.UPGRADE_COSTS[upgrades['Damage']['Level']] if upgrades['Damage']['Level'] < maxLevel else 'MAX'})"
+        ]
+
+        for i, line in enumerate(tipsLines):
+            text = self.font.render(line, True, (255, 255, 0))
+            self.screen.blit(text, (10, self.HEIGHT - 80 + i * 20))
+
+    def DrawMetrics(self, lines):
+        for i, line in enumerate(lines):
+            text = self.font.render(line, True, (0, 255, 255))
+            self.screen.blit(text, (10, 30 + i * 20))
+
+    def DrawAimIndicator(self, mousePos):
+        center = Vec2(self.WIDTH // 2, self.HEIGHT // 2)
+        arrowDir = (mousePos - center).Normalized()
+
+        startPos = (self.WIDTH // 2, self.HEIGHT // 2)
+        endPos = (self.WIDTH // 2 + arrowDir.x * 50, self.HEIGHT // 2 + arrowDir.y * 50)
+
+        pygame.draw.line(self.screen, (255, 255, 0), startPos, endPos, 3)
+        pygame.draw.circle(self.screen, (255, 255, 0), (int(endPos[0]), int(endPos[1])), 5)
\ No newline at end of file
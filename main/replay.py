@@ -0,0 +1,174 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import argparse
+import struct
+import time
+import zlib
+from array import array
+from profiling import PhaseTimer
+from snapshot import SaveWorld, LoadWorld
+from vec2 import Vec2
+from world import World, PlayerInput
+
+MAGIC = b"GIOR"
+VERSION = 1
+UPGRADE_NAMES = ("FireRate", "Speed", "Damage")
+
+HEADER = struct.Struct("<4sHqiid")
+FLAGS = struct.Struct("<B")
+INPUT = struct.Struct("<ddddBB")
+CHECKSUM = struct.Struct("<I")
+FLAG_INPUT, FLAG_CHECKSUM = 1, 2
+
+def WorldChecksum(world):
+    values = array("d", (world.time, world.tick, world.fragments))
+    for entities in (world.players, world.shapes, world.bullets):
+        values.append(len(entities))
+        for entity in entities:
+            transform, physics = entity.transform, entity.physics
+            values.extend((transform.position.x, transform.position.y, transform.rotation,
+                           physics.linearVelocity.x, physics.linearVelocity.y, physics.angularVelocity))
+    for shape in world.shapes:
+        values.append(shape.hp)
+    return zlib.crc32(values.tobytes())
+
+def EncodeInput(playerInput):
+    upgrades = sum(1 << UPGRADE_NAMES.index(name) for name in playerInput.upgrades)
+    return INPUT.pack(playerInput.move.x, playerInput.move.y, playerInput.aim.x, playerInput.aim.y,
+                      bool(playerInput.shooting), upgrades)
+
+def DecodeInput(data):
+    moveX, moveY, aimX, aimY, shooting, upgrades = INPUT.unpack(data)
+    names = [name for bit, name in enumerate(UPGRADE_NAMES) if upgrades & (1 << bit)]
+    return PlayerInput(Vec2(moveX, moveY), Vec2(aimX, aimY), bool(shooting), names)
+
+class Recorder:
+    # Header, then per step a flag byte, the input only when it changed, and optionally a checksum
+    def __init__(self, path, world, dt, checksums=True):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, world.seed, world.WIDTH, world.HEIGHT, dt))
+        self.checksums = checksums
+        self.lastInput = None
+        self.steps = 0
+
+    def Step(self, world, dt, playerInput):
+        # Encode before stepping, ApplyInput consumes the upgrade presses
+        encoded = EncodeInput(playerInput)
+        world.Step(dt, playerInput)
+
+        flags = FLAG_CHECKSUM if self.checksums else 0
+        parts = []
+        if encoded != self.lastInput:
+            flags |= FLAG_INPUT
+            parts.append(encoded)
+            self.lastInput = encoded
+        if self.checksums:
+            parts.append(CHECKSUM.pack(WorldChecksum(world)))
+        self.file.write(FLAGS.pack(flags) + b"".join(parts))
+        self.steps += 1
+
+    def Close(self):
+        self.file.close()
+
+class ReplayDivergence(Exception):
+    def __init__(self, step, expected, actual):
+        super().__init__(f"Replay diverged at step {step}: checksum {actual:08x}, recorded {expected:08x}")
+        self.step = step
+
+class Replay:
+    def __init__(self, path, snapshotInterval=600):
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, self.seed, self.width, self.height, self.dt = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay")
+
+        # Inputs are kept encoded and decoded per step, upgrades are consumed when applied
+        self.inputs = []
+        self.checksums = []
+        encoded = EncodeInput(PlayerInput())
+        offset = HEADER.size
+        while offset < len(data):
+            flags, = FLAGS.unpack_from(data, offset)
+            offset += FLAGS.size
+            if flags & FLAG_INPUT:
+                encoded = data[offset:offset + INPUT.size]
+                offset += INPUT.size
+            checksum = None
+            if flags & FLAG_CHECKSUM:
+                checksum, = CHECKSUM.unpack_from(data, offset)
+                offset += CHECKSUM.size
+            self.inputs.append(encoded)
+            self.checksums.append(checksum)
+
+        self.snapshotInterval = snapshotInterval
+        self.snapshots = {}
+        self.world = None
+        self.step = 0
+        self.Restart()
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def Restart(self):
+        self.world = World(self.width, self.height, self.seed)
+        self.step = 0
+
+    def Advance(self, steps=None, verify=True):
+        world = self.world
+        end = len(self.inputs) if steps is None else min(len(self.inputs), self.step + steps)
+        while self.step < end:
+            if self.snapshotInterval and self.step % self.snapshotInterval == 0 and self.step not in self.snapshots:
+                self.snapshots[self.step] = self.Snapshot()
+
+            world.Step(self.dt, DecodeInput(self.inputs[self.step]))
+            expected = self.checksums[self.step]
+            if verify and expected is not None:
+                actual = WorldChecksum(world)
+                if actual != expected:
+                    raise ReplayDivergence(self.step, expected, actual)
+            self.step += 1
+
+    def Snapshot(self):
+        return SaveWorld(self.world)
+
+    def Seek(self, step, verify=True):
+        # Restore the closest snapshot at or before the step and simulate the rest, unless simply
+        # carrying on from the current step gets there sooner
+        start = max((taken for taken in self.snapshots if taken <= step), default=None)
+        if not (self.step <= step and (start is None or start <= self.step)):
+            timer = self.world.timer
+            if start is None:
+                self.Restart()
+            else:
+                self.world = LoadWorld(self.snapshots[start])
+                self.step = start
+            self.world.timer = timer
+        self.Advance(step - self.step, verify)
+
+def Main():
+    parser = argparse.ArgumentParser(description="Re-simulate a recorded session headless")
+    parser.add_argument("path")
+    parser.add_argument("--seek", type=int, default=None, help="stop at this step instead of the end")
+    parser.add_argument("--no-verify", action="store_true", help="skip the per-step checksum comparison")
+    args = parser.parse_args()
+
+    replay = Replay(args.path)
+    timer = replay.world.timer = PhaseTimer()
+    phases = {}
+    start = time.perf_counter()
+    target = len(replay) if args.seek is None else args.seek
+    while replay.step < target:
+        replay.Advance(1, not args.no_verify)
+        for name, value in timer.EndFrame().items():
+            phases[name] = phases.get(name, 0.0) + value
+    elapsed = time.perf_counter() - start
+
+    verified = "not verified" if args.no_verify else "checksums ok"
+    print(f"{replay.step} steps in {elapsed:.2f}s ({replay.step / max(elapsed, 1e-9):.0f} steps/s), {verified}")
+    for name, total in sorted(phases.items(), key=lambda item: -item[1]):
+        print(f"  {name:<14} {total * 1000:9.1f}ms  {total / max(replay.step, 1) * 1000:7.3f}ms/step")
+
+if __name__ == "__main__":
+    Main()
\ No newline at end of file
@@ -0,0 +1,142 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import argparse
+import asyncio
+import time
+from collections import deque
+from net import SnapshotEncoder, CollectStates, DecodeInput, ReadMessage, WriteMessage
+from world import World, PlayerInput
+
+# About a second of inputs at the default tick rate, a client further ahead than this loses its oldest
+MAX_QUEUED_INPUTS = 32
+# Snapshots a client has not read pile up in its transport, past this it is disconnected instead
+MAX_WRITE_BUFFER = 256 * 1024
+
+class ClientConnection:
+    def __init__(self, reader, writer, player, delta=True):
+        self.reader = reader
+        self.writer = writer
+        self.player = player
+        self.input = PlayerInput()
+        self.inputs = deque()
+        self.inputSequence = 0
+        self.receivedSequence = 0
+        self.handler = None
+        self.stalled = False
+        self.encoder = SnapshotEncoder(delta)
+        self.bytesSent = 0
+        self.snapshotsSent = 0
+        self.encodeTime = 0.0
+
+    def Queue(self, playerInput, sequence):
+        self.receivedSequence = sequence
+        self.inputs.append((sequence, playerInput))
+        if len(self.inputs) > MAX_QUEUED_INPUTS:
+            # Upgrades are presses, a dropped input hands its presses on to the next one
+            _, dropped = self.inputs.popleft()
+            self.inputs[0][1].upgrades = dropped.upgrades + self.inputs[0][1].upgrades
+
+    def NextInput(self):
+        # Every input is one tick, the same step the client predicted it with, and is acknowledged when applied.
+        # With nothing queued the held keys carry on and the acknowledgement stays where it was
+        if self.inputs:
+            self.inputSequence, self.input = self.inputs.popleft()
+        return self.input
+
+class Server:
+    def __init__(self, world=None, tickRate=30, viewDistance=(700, 500), delta=True):
+        self.world = world or World()
+        # The server has no local player, every player belongs to a connection
+        self.world.RemovePlayer(self.world.player)
+        self.tickRate = tickRate
+        self.dt = 1.0 / tickRate
+        self.viewX, self.viewY = viewDistance
+        self.delta = delta
+        self.clients = []
+        self.handlers = set()
+        self.server = None
+
+    async def Start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.HandleClient, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def HandleClient(self, reader, writer):
+        client = ClientConnection(reader, writer, self.world.AddPlayer(), self.delta)
+        self.clients.append(client)
+        handler = client.handler = asyncio.current_task()
+        self.handlers.add(handler)
+        try:
+            while True:
+                playerInput, ackTick, sequence = DecodeInput(await ReadMessage(reader))
+                client.Queue(playerInput, sequence)
+                if ackTick is not None:
+                    client.encoder.Acknowledge(ackTick)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # Close and a stalled Broadcast cancel handlers, ending normally keeps asyncio's stream callback from logging it
+            pass
+        finally:
+            self.handlers.discard(handler)
+            self.clients.remove(client)
+            self.world.RemovePlayer(client.player)
+            writer.close()
+
+    def Tick(self):
+        world = self.world
+        world.Step(self.dt, {client.player: client.NextInput() for client in self.clients})
+        self.Broadcast()
+
+    def Broadcast(self):
+        world = self.world
+        for client in self.clients:
+            if client.stalled:
+                continue
+            if client.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                client.stalled = True
+                client.handler.cancel()
+                continue
+            start = time.perf_counter()
+            states = CollectStates(world, client.player.transform.position, self.viewX, self.viewY)
+            payload = client.encoder.Encode(world.tick, client.player.entityId, states,
+                                            client.inputSequence, client.player.physics.linearVelocity.AsTuple())
+            client.encodeTime += time.perf_counter() - start
+
+            WriteMessage(client.writer, payload)
+            client.bytesSent += len(payload) + 4
+            client.snapshotsSent += 1
+
+    async def Run(self, ticks=None):
+        nextTick = time.perf_counter()
+        while ticks is None or self.world.tick < ticks:
+            self.Tick()
+            nextTick += self.dt
+            await asyncio.sleep(max(0.0, nextTick - time.perf_counter()))
+
+    async def Close(self):
+        handlers = list(self.handlers)
+        for handler in handlers:
+            handler.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+async def Serve(host, port, tickRate, seed):
+    server = Server(World(seed=seed), tickRate)
+    port = await server.Start(host, port)
+    print(f"Serving on {host}:{port} at {tickRate}Hz")
+    await server.Run()
+
+def Main():
+    parser = argparse.ArgumentParser(description="Headless authoritative Geometry.io server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--tick-rate", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(Serve(args.host, args.port, args.tick_rate, args.seed))
+
+if __name__ == "__main__":
+    Main()
\ No newline at end of file
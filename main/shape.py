@@ -2,47 +2,121 @@
 # License: GPL-3.0 
 
 from components import PhysicsComponent, TransformComponent
-from math import cos, sin, pi, radians
+from math import cos, sin, pi, radians, hypot
 from vec2 import Vec2
-import pygame
 
 def GenPolygon(c, s, r):
     return [(c.x + cos(2*pi*i/r) * s,
              c.y + sin(2*pi*i/r) * s)
             for i in range(r)]
 
-def ApplyTransform(points, transform: TransformComponent):
+def ApplyTransform(points, transform: TransformComponent, size=1):
+    return TransformPoints(points, transform.position.x, transform.position.y, transform.rotation, transform.scale * size)
+
+def TransformPoints(points, px, py, rotation, scale):
     result = []
-    
-    c, s = cos(radians(transform.rotation)), sin(radians(transform.rotation))
+
+    c, s = cos(radians(rotation)), sin(radians(rotation))
     for x, y in points:
-        x, y = x * transform.scale, y * transform.scale
-        tx, ty = x * c - y * s, x * s + y * c
-        tx += transform.position.x
-        ty += transform.position.y
-        result.append((tx, ty))
+        x, y = x * scale, y * scale
+        result.append((x * c - y * s + px, x * s + y * c + py))
     return result
 
+def RotateNormals(normals, rotation):
+    c, s = cos(radians(rotation)), sin(radians(rotation))
+    return [(x * c - y * s, x * s + y * c) for x, y in normals]
+
+
+cacheStats = {"Hits": 0, "Misses": 0}
+
+def CacheHitRate():
+    total = cacheStats["Hits"] + cacheStats["Misses"]
+    return cacheStats["Hits"] / total if total else 0.0
+
+def ResetCacheStats():
+    cacheStats["Hits"] = 0
+    cacheStats["Misses"] = 0
+
+def EdgeNormals(points):
+    normals = []
+    n = len(points)
+    for i in range(n):
+        x1, y1 = points[i]
+        x2, y2 = points[(i + 1) % n]
+        nx, ny = y1 - y2, x2 - x1
+        length = hypot(nx, ny)
+        normals.append((nx / length, ny / length) if length != 0 else (0.0, 0.0))
+    return normals
+
+class PolygonTemplate:
+    def __init__(self, pointCount):
+        self.pointCount = pointCount
+        self.points = tuple(GenPolygon(Vec2(), 1, pointCount))
+        self.normals = tuple(EdgeNormals(self.points))
+        self.boundingRadius = max(hypot(x, y) for x, y in self.points)
+
+polygonTemplates = {}
+
+def GetPolygonTemplate(pointCount):
+    template = polygonTemplates.get(pointCount)
+    if template is None:
+        template = polygonTemplates[pointCount] = PolygonTemplate(pointCount)
+    return template
 
 class Shape():
-    def __init__(self, position=Vec2(), pointCount=3, size=50, color=(255, 0, 0)):
+    def __init__(self, position=None, pointCount=3, size=50, color=(255, 0, 0)):
         super().__init__()
         self.physics = PhysicsComponent()
-        self.transform = TransformComponent(position)
+        self.transform = TransformComponent(position if position is not None else Vec2())
+        self.pointCount = pointCount
+        self.color = color
+        self.size = size
+        self.template = GetPolygonTemplate(pointCount)
+        self.hp = pointCount * 25
+        self.entityId = None
+        self.cacheTransform = None
+        self.cacheVersion = -1
+
+    def Reset(self, position, pointCount, size, color):
+        self.physics.Reset()
+        self.transform.Reset(position)
+        self.template = GetPolygonTemplate(pointCount)
         self.pointCount = pointCount
         self.color = color
         self.size = size
-        self.points = GenPolygon(Vec2(), size, pointCount)
         self.hp = pointCount * 25
+        return self
+
+    def UpdateCache(self):
+        transform = self.transform
+        if self.cacheTransform is transform and self.cacheVersion == transform.version:
+            cacheStats["Hits"] += 1
+            return
+
+        cacheStats["Misses"] += 1
+        # Rotation and uniform scale keep edge directions, so the template normals only need rotating
+        points = ApplyTransform(self.template.points, transform, self.size)
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        self.worldPoints = points
+        self.worldNormals = RotateNormals(self.template.normals, transform.rotation)
+        self.aabb = (min(xs), min(ys), max(xs), max(ys))
+        self.cacheTransform = transform
+        self.cacheVersion = transform.version
+
+    def GetPoints(self):
+        self.UpdateCache()
+        return self.worldPoints
+
+    def GetNormals(self):
+        self.UpdateCache()
+        return self.worldNormals
 
-    def Draw(self, surface: pygame.Surface, deltaTime=0.016, offset=Vec2()):
-        if (self.points != None):
-            self.transform.position += offset
-            self.physics.Update(self.transform, deltaTime)
-            pygame.draw.polygon(surface, self.color, ApplyTransform(self.points, self.transform), 3)
-            self.transform.position -= offset
+    def GetAABB(self):
+        self.UpdateCache()
+        return self.aabb
 
-    def GetPoints(self): return ApplyTransform(self.points, self.transform)   
+    def GetBoundingRadius(self): return self.template.boundingRadius * self.size * abs(self.transform.scale)
 
     
     def Copy(self):
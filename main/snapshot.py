@@ -0,0 +1,248 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+import gc
+import struct
+from array import array
+from agar import Agar
+from chunks import SHAPE_FIELDS, Number, PackShapes, RestorePhysics, UnpackShapes
+from contact import Contact, ContactKey
+from vec2 import Vec2
+from world import World
+
+MAGIC = b"GIOS"
+VERSION = 5
+
+HEADER = struct.Struct("<4sHqiidqqiq")
+RANDOM_STATE = struct.Struct("<iBd")
+SETTINGS = struct.Struct("<iidddiiiidddiidH")
+SECTION = struct.Struct("<IH")
+UPGRADE = struct.Struct("<H")
+CHUNK_COUNT = struct.Struct("<I")
+CHUNK_KEY = struct.Struct("<ii")
+
+# Every entity is one fixed-stride row of float64s, so a whole section is a single array write
+AGAR_FIELDS = ("entityId", "x", "y", "rotation", "radius", "r", "g", "b", "vx", "vy", "angularVelocity",
+               "mass", "drag", "sleeping", "sleepTimer", "extra")
+
+def PackAgars(agars, Extra):
+    rows = []
+    for agar in agars:
+        transform, physics = agar.transform, agar.physics
+        r, g, b = agar.color
+        rows += (-1 if agar.entityId is None else agar.entityId,
+                 transform.position.x, transform.position.y, transform.rotation, transform.scale,
+                 r, g, b, physics.linearVelocity.x, physics.linearVelocity.y, physics.angularVelocity,
+                 physics.mass, physics.drag, physics.sleeping, physics.sleepTimer, Extra(agar))
+    return array("d", rows)
+
+def WriteSection(parts, values, stride):
+    parts.append(SECTION.pack(len(values) // stride, stride))
+    parts.append(values.tobytes())
+
+def ReadSection(data, offset, stride):
+    count, fileStride = SECTION.unpack_from(data, offset)
+    if fileStride != stride:
+        raise ValueError(f"Snapshot section has {fileStride} fields per entity, expected {stride}")
+    offset += SECTION.size
+    values = array("d")
+    values.frombytes(data[offset:offset + count * stride * values.itemsize])
+    return values, count, offset + count * stride * values.itemsize
+
+def SaveWorld(world):
+    randomVersion, randomState, gauss = world.random.getstate()
+    playerIndex = world.players.index(world.player) if world.player in world.players else -1
+    parts = [HEADER.pack(MAGIC, VERSION, world.seed, world.WIDTH, world.HEIGHT, world.time,
+                         world.tick, world.nextEntityId, playerIndex, world.spawnTick),
+             RANDOM_STATE.pack(randomVersion, gauss is not None, gauss or 0.0),
+             array("I", randomState).tobytes(),
+             SETTINGS.pack(world.MAX_SHAPES, world.MAX_UPGRADE_LEVEL, world.PLAYER_SPEED, world.BULLET_SPEED,
+                           world.BASE_FIRE_RATE, world.SHAPES_PER_CELL, world.SPAWN_CELL_SIZE,
+                           world.SPAWNS_PER_STEP, world.SPAWN_ATTEMPTS, world.SPAWN_MARGIN, *world.SPAWN_RADII,
+                           world.CHUNK_SIZE, world.ACTIVE_CHUNKS, world.STARTING_FRAGMENTS,
+                           len(world.UPGRADE_COSTS)),
+             array("d", world.UPGRADE_COSTS).tobytes()]
+
+    players = world.players
+    WriteSection(parts, PackAgars(players, lambda player: player.lastShotTime), len(AGAR_FIELDS))
+    WriteSection(parts, PackShapes(world.shapes), len(SHAPE_FIELDS))
+    owners = {id(player): index for index, player in enumerate(players)}
+    WriteSection(parts, PackAgars(world.bullets, lambda bullet: owners.get(id(getattr(bullet, "owner", None)), -1)),
+                 len(AGAR_FIELDS))
+    WriteSection(parts, array("d", (getattr(bullet, "damage", 0.0) for bullet in world.bullets)), 1)
+    # Spawning reads last step's broadphase, so its circles are part of what decides the next step
+    WriteSection(parts, array("d", (value for circle in world.broadphase.circles for value in circle)), 3)
+    WriteSection(parts, array("d", (value for circle in world.spawned for value in circle)), 3)
+    # Warm starting carries impulses from one step into the next, so the contact cache is state too
+    shapeIndices = {id(shape): index for index, shape in enumerate(world.shapes)}
+    contacts = array("d")
+    for contact in world.contacts.contacts.values():
+        indexA, indexB = shapeIndices.get(id(contact.shapeA)), shapeIndices.get(id(contact.shapeB))
+        if indexA is not None and indexB is not None:
+            contacts.extend((indexA, indexB, contact.nx, contact.ny, contact.impulse))
+    WriteSection(parts, contacts, 5)
+
+    # Parked chunks are as much a part of the world as the shapes being simulated
+    WriteSection(parts, array("d", (value for key in sorted(world.loadedChunks) for value in key)), 2)
+    keys = world.chunks.Keys()
+    parts.append(CHUNK_COUNT.pack(len(keys)))
+    for key in keys:
+        parts.append(CHUNK_KEY.pack(*key))
+        WriteSection(parts, world.chunks.Peek(key), len(SHAPE_FIELDS))
+
+    # Every player has their own purse and upgrades, one row each in the same order as the players section
+    names = list(world.player.upgrades)
+    parts.append(UPGRADE.pack(len(names)))
+    for name in names:
+        encoded = name.encode()
+        parts.append(UPGRADE.pack(len(encoded)) + encoded)
+    upgrades = array("d")
+    for player in players:
+        upgrades.append(player.fragments)
+        for name in names:
+            upgrades.extend((player.upgrades[name]["Level"], player.upgrades[name]["Multiplier"]))
+    WriteSection(parts, upgrades, 1 + 2 * len(names))
+    return b"".join(parts)
+
+def RestoreAgar(agar, row):
+    (entityId, x, y, rotation, radius, r, g, b, vx, vy, angularVelocity,
+     mass, drag, sleeping, sleepTimer, _) = row
+    agar.Reset(Vec2(x, y), radius, (int(r), int(g), int(b)))
+    agar.entityId = None if entityId < 0 else int(entityId)
+    agar.transform.rotation = rotation
+    RestorePhysics(agar.physics, vx, vy, angularVelocity, mass, drag, sleeping, sleepTimer)
+    return agar
+
+def LoadWorld(data, world=None):
+    # Every object a restore allocates stays alive, so the cyclic collector would only keep rescanning
+    # the world as it grows, which cost a third of a 100k entity load
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return RestoreWorld(data, world)
+    finally:
+        if enabled:
+            gc.enable()
+
+def RestoreWorld(data, world):
+    (magic, version, seed, width, height, time, tick,
+     nextEntityId, playerIndex, spawnTick) = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} world snapshot")
+    offset = HEADER.size
+
+    if world is None:
+        world = World(width, height, seed)
+    world.seed, world.time, world.tick = seed, time, tick
+    world.nextEntityId = nextEntityId
+    world.spawnTick = spawnTick
+
+    randomVersion, hasGauss, gauss = RANDOM_STATE.unpack_from(data, offset)
+    offset += RANDOM_STATE.size
+    randomState = array("I")
+    randomState.frombytes(data[offset:offset + 625 * randomState.itemsize])
+    offset += 625 * randomState.itemsize
+    world.random.setstate((randomVersion, tuple(randomState), gauss if hasGauss else None))
+
+    (maxShapes, maxUpgradeLevel, playerSpeed, bulletSpeed, baseFireRate, shapesPerCell, spawnCellSize,
+     spawnsPerStep, spawnAttempts, spawnMargin, innerRadius, outerRadius,
+     chunkSize, activeChunks, startingFragments, costCount) = SETTINGS.unpack_from(data, offset)
+    offset += SETTINGS.size
+    costs = array("d")
+    costs.frombytes(data[offset:offset + costCount * costs.itemsize])
+    offset += costCount * costs.itemsize
+    world.MAX_SHAPES, world.MAX_UPGRADE_LEVEL = maxShapes, maxUpgradeLevel
+    world.PLAYER_SPEED, world.BULLET_SPEED = Number(playerSpeed), Number(bulletSpeed)
+    world.BASE_FIRE_RATE = baseFireRate
+    world.SHAPES_PER_CELL, world.SPAWN_CELL_SIZE = shapesPerCell, spawnCellSize
+    world.SPAWNS_PER_STEP, world.SPAWN_ATTEMPTS = spawnsPerStep, spawnAttempts
+    world.SPAWN_MARGIN = Number(spawnMargin)
+    world.SPAWN_RADII = (Number(innerRadius), Number(outerRadius))
+    world.CHUNK_SIZE, world.ACTIVE_CHUNKS = chunkSize, activeChunks
+    world.STARTING_FRAGMENTS = Number(startingFragments)
+    world.UPGRADE_COSTS = [Number(cost) for cost in costs]
+
+    stride = len(AGAR_FIELDS)
+    values, count, offset = ReadSection(data, offset, stride)
+    players = []
+    for i in range(count):
+        row = values[i * stride:(i + 1) * stride]
+        player = RestoreAgar(Agar(), row)
+        player.lastShotTime = row[-1]
+        players.append(player)
+    world.players = players
+    if playerIndex >= 0:
+        world.player = players[playerIndex]
+
+    world.DetachShapes(world.shapes)
+    for shape in world.shapes:
+        world.shapePool.Release(shape)
+    stride = len(SHAPE_FIELDS)
+    values, count, offset = ReadSection(data, offset, stride)
+    shapes = world.shapes = UnpackShapes(values, world.shapePool.Acquire)
+    world.AttachShapes(shapes)
+
+    for bullet in world.bullets:
+        world.bulletPool.Release(bullet)
+    stride = len(AGAR_FIELDS)
+    values, count, offset = ReadSection(data, offset, stride)
+    damages, _, offset = ReadSection(data, offset, 1)
+    bullets = []
+    for i in range(count):
+        row = values[i * stride:(i + 1) * stride]
+        # A bullet whose owner was not saved has nobody to credit for a kill, it is not restored
+        if row[-1] < 0:
+            continue
+        bullet = RestoreAgar(world.bulletPool.Acquire(), row)
+        bullet.owner = players[int(row[-1])]
+        bullet.damage = damages[i]
+        bullets.append(bullet)
+    world.bullets = bullets
+
+    values, count, offset = ReadSection(data, offset, 3)
+    world.broadphase.UpdateCircles(zip(values[0::3], values[1::3], values[2::3]))
+    values, count, offset = ReadSection(data, offset, 3)
+    world.spawned = list(zip(values[0::3], values[1::3], values[2::3]))
+    values, count, offset = ReadSection(data, offset, 5)
+    contacts = {}
+    for i in range(count):
+        indexA, indexB, nx, ny, impulse = values[i * 5:i * 5 + 5]
+        contact = Contact(shapes[int(indexA)], shapes[int(indexB)])
+        contact.nx, contact.ny, contact.impulse = nx, ny, impulse
+        contacts[ContactKey(contact.shapeA, contact.shapeB)] = contact
+    world.contacts.contacts = contacts
+
+    values, count, offset = ReadSection(data, offset, 2)
+    world.loadedChunks = {(int(values[i * 2]), int(values[i * 2 + 1])) for i in range(count)}
+    world.chunks.Clear()
+    chunkCount, = CHUNK_COUNT.unpack_from(data, offset)
+    offset += CHUNK_COUNT.size
+    for _ in range(chunkCount):
+        key = CHUNK_KEY.unpack_from(data, offset)
+        values, _, offset = ReadSection(data, offset + CHUNK_KEY.size, len(SHAPE_FIELDS))
+        world.chunks.Park(key, values)
+
+    upgradeCount, = UPGRADE.unpack_from(data, offset)
+    offset += UPGRADE.size
+    names = []
+    for _ in range(upgradeCount):
+        length, = UPGRADE.unpack_from(data, offset)
+        offset += UPGRADE.size
+        names.append(data[offset:offset + length].decode())
+        offset += length
+    stride = 1 + 2 * len(names)
+    values, count, offset = ReadSection(data, offset, stride)
+    for i, player in enumerate(players):
+        row = values[i * stride:(i + 1) * stride]
+        player.fragments = Number(row[0])
+        player.upgrades = {name: {"Level": int(row[1 + 2 * j]), "Multiplier": Number(row[2 + 2 * j])}
+                           for j, name in enumerate(names)}
+    return world
+
+def SaveFile(world, path):
+    with open(path, "wb") as file:
+        file.write(SaveWorld(world))
+
+def LoadFile(path, world=None):
+    with open(path, "rb") as file:
+        return LoadWorld(file.read(), world)
\ No newline at end of file
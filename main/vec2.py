@@ -4,6 +4,9 @@
 import math
 
 class Vec2:
+    __slots__ = ("x", "y")
+    allocations = 0
+
     def __init__(self, x=0.0, y=0.0):
         self.x = x
         self.y = y
@@ -13,18 +16,24 @@ class Vec2:
     def __eq__(self, other):
         return self.x == other.x and self.y == other.y 
     
+    # Length comparisons against a scalar, done on squared lengths to skip the sqrt
     def __lt__(self, value: float):
-        return self.Length() < value
+        return value > 0 and self.x*self.x + self.y*self.y < value*value
 
     def __gt__(self, value: float):
-        return self.Length() > value
+        return value < 0 or self.x*self.x + self.y*self.y > value*value
 
     def __neg__(self):
-        return Vec2() - self
+        return Vec2(-self.x, -self.y)
 
     def __add__(self, other):
         return Vec2(self.x + other.x, self.y + other.y)
 
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
+
     def __sub__(self, other):
         return Vec2(self.x - other.x, self.y - other.y)
 
@@ -36,12 +45,40 @@ class Vec2:
     def __mul__(self, scalar):
         return Vec2(self.x * scalar, self.y * scalar)
 
+    def __imul__(self, scalar):
+        self.x *= scalar
+        self.y *= scalar
+        return self
+
     def __truediv__(self, scalar):
         return Vec2(self.x / scalar, self.y / scalar)
 
+    def __itruediv__(self, scalar):
+        self.x /= scalar
+        self.y /= scalar
+        return self
+
     def Length(self):
         return math.hypot(self.x, self.y)
 
+    def LengthSquared(self):
+        return self.x*self.x + self.y*self.y
+
+    def DistanceSquared(self, other):
+        dx = self.x - other.x
+        dy = self.y - other.y
+        return dx*dx + dy*dy
+
+    def AddScaled(self, other, scalar):
+        self.x += other.x * scalar
+        self.y += other.y * scalar
+        return self
+
+    def Set(self, x, y):
+        self.x = x
+        self.y = y
+        return self
+
     def Dot(self, other):
         return self.x*other.x+self.y*other.y
 
@@ -56,3 +93,14 @@ class Vec2:
 
     def Tuple(self):
         return (self.x, self.y)
+
+def CountingInit(self, x=0.0, y=0.0):
+    Vec2.allocations += 1
+    self.x = x
+    self.y = y
+
+PlainInit = Vec2.__init__
+
+def CountAllocations(enabled):
+    # Swapping __init__ keeps the counter free when nobody is watching
+    Vec2.__init__ = CountingInit if enabled else PlainInit
\ No newline at end of file
@@ -0,0 +1,448 @@
+# Copyright (c) Catsgold
+# License: GPL-3.0
+
+from math import cos, sin, pi, sqrt
+from random import Random
+from collisions import PolygonCircleCollision, SweptCircleTOI, SweptPolygonCircleCollision
+from broadphase import SpatialHash
+from chunks import ChunkStore, ChunkOf, PackShapes, UnpackShapes
+from contact import ContactManager
+from profiling import NullTimer
+from pool import Pool, RemoveWhere
+from shape import Shape
+from agar import Agar
+from vec2 import Vec2
+
+class PlayerInput:
+    def __init__(self, move=None, aim=None, shooting=False, upgrades=None):
+        self.move = move or Vec2()
+        self.aim = aim or Vec2(1, 0)
+        self.shooting = shooting
+        self.upgrades = upgrades or []
+
+def NewUpgrades():
+    return {
+        "FireRate": {"Level": 0, "Multiplier": 1},
+        "Speed": {"Level": 0, "Multiplier": 1},
+        "Damage": {"Level": 0, "Multiplier": 1}
+    }
+
+def ApplyMovement(player, move, speed, dt):
+    if move.Length() > 0:
+        player.physics.linearVelocity += move.Normalized() * speed * dt
+        player.physics.Wake()
+
+class World:
+    def __init__(self, width=800, height=600, seed=None, poolCapacity=512, chunkDirectory=None, physicsWorld=None):
+        self.WIDTH, self.HEIGHT = width, height
+        # An unseeded world still draws a seed of its own so the session can be recorded and replayed
+        self.seed = seed if seed is not None else Random().getrandbits(62)
+        self.random = Random(self.seed)
+        self.timer = NullTimer()
+
+        self.MAX_UPGRADE_LEVEL = 5
+        self.UPGRADE_COSTS = [50, 100, 200, 400, 800]
+        self.STARTING_FRAGMENTS = 9999
+        self.PLAYER_SPEED = 2000
+        self.BULLET_SPEED = 1500
+        self.BASE_FIRE_RATE = 2.0
+        # Spawning fills each cell up to a target density, MAX_SHAPES per player is only a ceiling
+        self.MAX_SHAPES = 40
+        self.SHAPES_PER_CELL = 1
+        self.SPAWN_CELL_SIZE = 400
+        self.SPAWNS_PER_STEP = 4
+        self.SPAWN_ATTEMPTS = 8
+        self.SPAWN_MARGIN = 10
+        self.SPAWN_RADII = (200, max(self.WIDTH, self.HEIGHT))
+        # Shapes within ACTIVE_CHUNKS chunks of a player are simulated, the rest are parked until one comes back
+        self.CHUNK_SIZE = 1000
+        self.ACTIVE_CHUNKS = 1
+
+        self.nextEntityId = 0
+        self.players = []
+        self.player = self.AddPlayer()
+        self.shapes = []
+        self.bullets = []
+        self.shapePool = Pool(Shape, poolCapacity)
+        self.bulletPool = Pool(Agar, poolCapacity)
+        self.broadphase = SpatialHash()
+        self.contacts = ContactManager()
+        self.chunks = ChunkStore(chunkDirectory)
+        # Given a PhysicsWorld, shapes are attached to it while they are in the world and integrate in one Step
+        self.physicsWorld = physicsWorld
+        self.loadedChunks = set()
+        self.spawned = []
+        self.spawnTick = -1
+        self.time = 0.0
+        self.tick = 0
+
+    # Fragments and upgrades belong to each player, these are the local player's for the HUD and single player code
+    @property
+    def fragments(self):
+        return self.player.fragments
+
+    @property
+    def upgrades(self):
+        return self.player.upgrades
+
+    def NextEntityId(self):
+        self.nextEntityId += 1
+        return self.nextEntityId
+
+    def AddPlayer(self, position=None):
+        player = Agar(position if position is not None else Vec2(self.WIDTH // 2, self.HEIGHT // 2), 30, (0, 255, 0))
+        player.entityId = self.NextEntityId()
+        player.lastShotTime = -float("inf")
+        player.fragments = self.STARTING_FRAGMENTS
+        player.upgrades = NewUpgrades()
+        self.players.append(player)
+        return player
+
+    def RemovePlayer(self, player):
+        self.players.remove(player)
+        # A kill credits the bullet's owner, so a player's bullets leave with them
+        RemoveWhere(self.bullets, lambda bullet: bullet.owner is player, self.bulletPool)
+
+    def AttachShapes(self, shapes):
+        if self.physicsWorld is not None:
+            for shape in shapes:
+                self.physicsWorld.Attach(shape)
+
+    def DetachShapes(self, shapes):
+        # Pooled and parked shapes get their own components back, their rows are swap-removed
+        if self.physicsWorld is not None:
+            for shape in shapes:
+                self.physicsWorld.Detach(shape)
+
+    def Step(self, dt, playerInput):
+        # A single PlayerInput drives the local player, a {player: PlayerInput} dict drives several at once
+        timer = self.timer
+        with timer.Phase("Input"):
+            if isinstance(playerInput, dict):
+                for player, inputs in playerInput.items():
+                    self.ApplyInput(inputs, dt, player)
+            else:
+                self.ApplyInput(playerInput, dt)
+        with timer.Phase("Spawn"):
+            self.SpawnShapes()
+        with timer.Phase("Physics"):
+            self.UpdateEntities(dt)
+        with timer.Phase("Collision"):
+            self.HandleCollisions()
+        with timer.Phase("Cleanup"):
+            self.CleanupEntities()
+        self.time += dt
+        self.tick += 1
+
+    def ApplyInput(self, playerInput, dt, player=None):
+        player = player or self.player
+        self.HandleMovement(playerInput.move, dt, player)
+
+        # Upgrades are key presses, not held state, so they only apply on the first step that sees them
+        for upgradeName in playerInput.upgrades:
+            self.TryUpgrade(upgradeName, player)
+        playerInput.upgrades = []
+
+        if playerInput.shooting:
+            self.HandleShooting(playerInput.aim, player)
+
+    def HandleMovement(self, move, dt, player=None):
+        ApplyMovement(player or self.player, move, self.PLAYER_SPEED, dt)
+
+    def TryUpgrade(self, upgradeName, player=None):
+        player = player or self.player
+        upgrade = player.upgrades[upgradeName]
+        if upgrade["Level"] >= self.MAX_UPGRADE_LEVEL:
+            return
+
+        cost = self.UPGRADE_COSTS[upgrade["Level"]]
+        if player.fragments >= cost:
+            player.fragments -= cost
+            upgrade["Level"] += 1
+            upgrade["Multiplier"] = 1 + 0.2 * upgrade["Level"]
+
+    def HandleShooting(self, aim, player=None):
+        player = player or self.player
+        effectiveFireRate = self.BASE_FIRE_RATE * player.upgrades["FireRate"]["Multiplier"]
+        effectiveCooldown = 1.0 / effectiveFireRate
+
+        if self.time - player.lastShotTime >= effectiveCooldown:
+            player.lastShotTime = self.time
+            self.SpawnBullet(aim, player)
+
+    def SpawnBullet(self, aim, player=None):
+        player = player or self.player
+        direction = aim.Normalized()
+
+        bullet = self.bulletPool.Acquire().Reset(player.transform.position, 15, (255, 0, 0))
+        bullet.entityId = self.NextEntityId()
+        bullet.owner = player
+        bullet.physics.linearVelocity = bullet.physics.linearVelocity.AddScaled(
+            direction, self.BULLET_SPEED * player.upgrades["Speed"]["Multiplier"])
+        bullet.damage = 25 * player.upgrades["Damage"]["Multiplier"]
+
+        self.bullets.append(bullet)
+
+    def SpawnShapes(self):
+        if not self.players:
+            return
+        # The broadphase was built last step, shapes spawned since then are tracked here until it catches up
+        if self.spawnTick != self.tick:
+            self.spawned = []
+            self.spawnTick = self.tick
+
+        # A bounded number of bounded searches per step, so spawning costs the same however big the world gets
+        limit = self.MAX_SHAPES * len(self.players)
+        for _ in range(self.SPAWNS_PER_STEP):
+            if len(self.shapes) >= limit:
+                return
+            angleCount = self.random.randint(3, 8)
+            size = self.random.randint(25, 100)
+            position = self.FindSpawnPosition(size)
+            if position is None:
+                return
+            color = (self.random.randint(50, 255), self.random.randint(50, 255), self.random.randint(50, 255))
+
+            shape = self.shapePool.Acquire().Reset(position, angleCount, size, color)
+            shape.entityId = self.NextEntityId()
+            self.AttachShapes((shape,))
+            self.shapes.append(shape)
+            self.spawned.append((position.x, position.y, shape.GetBoundingRadius()))
+
+    def FindSpawnPosition(self, radius=0):
+        # Only draw a player when there is a choice, so single player worlds keep their random sequence
+        players = self.players
+        center = players[self.random.randrange(len(players))] if len(players) > 1 else players[0]
+        centerX, centerY = center.transform.position.x, center.transform.position.y
+        innerRadius, outerRadius = self.SPAWN_RADII
+        for _ in range(self.SPAWN_ATTEMPTS):
+            # Uniform over the annulus area directly instead of rejecting points inside the inner circle
+            angle = self.random.random() * 2 * pi
+            distance = sqrt(innerRadius * innerRadius + self.random.random() * (outerRadius * outerRadius - innerRadius * innerRadius))
+            spawnX, spawnY = centerX + cos(angle) * distance, centerY + sin(angle) * distance
+            if not self.CellFull(spawnX, spawnY) and not self.SpawnOverlaps(spawnX, spawnY, radius):
+                return Vec2(spawnX, spawnY)
+        return None
+
+    def CellFull(self, x, y):
+        size = self.SPAWN_CELL_SIZE
+        minX, minY = x // size * size, y // size * size
+        maxX, maxY = minX + size, minY + size
+        count = self.broadphase.CountCentersIn(minX, minY, maxX, maxY)
+        count += sum(1 for sx, sy, _ in self.spawned if minX <= sx < maxX and minY <= sy < maxY)
+        return count >= self.SHAPES_PER_CELL
+
+    def SpawnOverlaps(self, x, y, radius):
+        radius += self.SPAWN_MARGIN
+        if self.broadphase.TouchesCircle(x, y, radius):
+            return True
+        for sx, sy, r in self.spawned:
+            reach = r + radius
+            if (sx - x) ** 2 + (sy - y) ** 2 < reach * reach:
+                return True
+        return False
+
+    def UpdateEntities(self, dt):
+        with self.timer.Phase("UpdateShapes"):
+            self.UpdateShapes(dt)
+        with self.timer.Phase("UpdateBullets"):
+            self.UpdateBullets(dt)
+        for player in self.players:
+            player.physics.Update(player.transform, dt)
+
+    def UpdateShapes(self, dt):
+        resolved = 0
+        sleeping = 0
+        tests = 0
+        physicsWorld = self.physicsWorld
+        for shape in self.shapes:
+            for player in self.players:
+                tests += 1
+                if PolygonCircleCollision(shape, player):
+                    resolved += 1
+            if physicsWorld is None:
+                shape.physics.Update(shape.transform, dt)
+            sleeping += shape.physics.sleeping
+        if physicsWorld is not None:
+            physicsWorld.Step(dt)
+        self.timer.Count("NarrowphaseTests", tests)
+        self.timer.Count("CollisionsResolved", resolved)
+        self.timer.Count("SleepingShapes", sleeping)
+
+    def UpdateBullets(self, dt):
+        for bullet in self.bullets:
+            position = bullet.transform.position
+            bullet.previousPosition = bullet.previousPosition.Set(position.x, position.y)
+            bullet.transform.position += bullet.physics.linearVelocity * dt
+            bullet.physics.Update(bullet.transform, dt)
+
+    def HandleCollisions(self):
+        shapesToRemove = set()
+        bulletsToRemove = set()
+        shapesToAdd = []
+
+        self.broadphase.Update(self.shapes)
+        tests = 0
+        resolved = 0
+
+        for bullet in self.bullets:
+            hit = False
+            start, end = bullet.previousPosition, bullet.transform.position
+            radius = bullet.transform.scale
+
+            # Sweep the whole move so a bullet faster than its own radius cannot step over a shape
+            shape, firstImpact = None, None
+            for candidate in self.broadphase.QuerySweptCircle(start, end, radius):
+                tests += 1
+                impact = SweptCircleTOI(candidate.GetPoints(), start, end, radius)
+                if impact is not None and (firstImpact is None or impact[0] < firstImpact):
+                    shape, firstImpact = candidate, impact[0]
+
+            if shape is not None:
+                SweptPolygonCircleCollision(shape, bullet, start)
+                resolved += 1
+                shape.hp -= bullet.damage
+                bulletsToRemove.add(bullet)
+
+                if shape.hp <= 0:
+                    shapesToRemove.add(shape)
+                    bullet.owner.fragments += shape.pointCount
+
+                    if shape.pointCount > 3:
+                        direction = shape.transform.position - bullet.owner.transform.position
+                        childColor = (self.random.randint(50, 255), self.random.randint(50, 255), self.random.randint(50, 255))
+                        child = self.shapePool.Acquire().Reset(shape.transform.position + direction,
+                                                               shape.pointCount - 1,
+                                                               self.random.randint(25, 100),
+                                                               childColor)
+                        child.entityId = self.NextEntityId()
+                        child.physics.linearVelocity = child.physics.linearVelocity.AddScaled(direction, 10)
+                        child.physics.angularVelocity = self.random.randint(-50, 50)
+                        shapesToAdd.append(child)
+                hit = True
+
+            if not hit and bullet.physics.linearVelocity < 2.0:
+                bulletsToRemove.add(bullet)
+
+        pairs = self.broadphase.Pairs()
+        # Two resting shapes cannot push each other, only an awake one can wake them
+        touching, sleepingPairs = self.contacts.Step(pairs)
+        resolved += touching
+
+        self.timer.Count("BroadphasePairs", len(pairs))
+        self.timer.Count("NarrowphaseTests", tests + len(pairs) - sleepingPairs)
+        self.timer.Count("SleepingPairs", sleepingPairs)
+        self.timer.Count("CollisionsResolved", resolved)
+        self.timer.Count("ContactsCreated", self.contacts.created)
+        self.timer.Count("ContactsWarmStarted", self.contacts.warmStarted)
+
+        if shapesToRemove:
+            self.DetachShapes(shapesToRemove)
+            RemoveWhere(self.shapes, shapesToRemove.__contains__, self.shapePool)
+        self.AttachShapes(shapesToAdd)
+        self.shapes.extend(shapesToAdd)
+        if bulletsToRemove:
+            RemoveWhere(self.bullets, bulletsToRemove.__contains__, self.bulletPool)
+
+    def CleanupEntities(self):
+        if not self.players:
+            return
+        playerPositions = [player.transform.position for player in self.players]
+        maxX, maxY = self.WIDTH + 200, self.HEIGHT + 200
+
+        # Bullets are gone for good once every player has left them behind
+        def OutOfRange(entity):
+            position = entity.transform.position
+            return all(abs(position.x - playerPos.x) > maxX or abs(position.y - playerPos.y) > maxY
+                       for playerPos in playerPositions)
+
+        RemoveWhere(self.bullets, OutOfRange, self.bulletPool)
+        self.StreamChunks()
+
+    def StreamChunks(self):
+        # Shapes are never dropped for being far away, their chunk is parked and comes back with a player
+        size, ring = self.CHUNK_SIZE, self.ACTIVE_CHUNKS
+        centers = sorted({ChunkOf(player.transform.position, size) for player in self.players})
+
+        restored = 0
+        for centerX, centerY in centers:
+            for cx in range(centerX - ring, centerX + ring + 1):
+                for cy in range(centerY - ring, centerY + ring + 1):
+                    if (cx, cy) in self.loadedChunks:
+                        continue
+                    self.loadedChunks.add((cx, cy))
+                    values = self.chunks.Take((cx, cy))
+                    if values is not None:
+                        shapes = UnpackShapes(values, self.shapePool.Acquire)
+                        self.AttachShapes(shapes)
+                        self.shapes.extend(shapes)
+                        restored += len(shapes)
+
+        # One chunk of slack before parking, so walking along a chunk border does not park and restore every step
+        self.loadedChunks = {key for key in self.loadedChunks
+                             if any(abs(key[0] - cx) <= ring + 1 and abs(key[1] - cy) <= ring + 1 for cx, cy in centers)}
+        parked = {}
+        loadedChunks = self.loadedChunks
+
+        def Park(shape):
+            key = ChunkOf(shape.transform.position, size)
+            if key in loadedChunks:
+                return False
+            parked.setdefault(key, []).append(shape)
+            return True
+
+        RemoveWhere(self.shapes, Park)
+        for key in sorted(parked):
+            self.chunks.Park(key, PackShapes(parked[key]))
+            self.DetachShapes(parked[key])
+            for shape in parked[key]:
+                self.shapePool.Release(shape)
+
+        # Spawning reads the broadphase before it is rebuilt, it has to see restored shapes already
+        if restored:
+            self.broadphase.Update(self.shapes)
+        self.timer.Count("ShapesRestored", restored)
+        self.timer.Count("ShapesParked", sum(len(shapes) for shapes in parked.values()))
+
+class Simulation:
+    def __init__(self, world, tickRate=60, substeps=1, maxTicksPerAdvance=5):
+        self.world = world
+        self.tickRate = tickRate
+        self.dt = 1.0 / tickRate
+        self.substeps = substeps
+        self.maxTicksPerAdvance = maxTicksPerAdvance
+        self.accumulator = 0.0
+        self.interpolator = None
+        self.recorder = None
+
+    @property
+    def alpha(self):
+        return self.accumulator / self.dt
+
+    def Tick(self, playerInput):
+        if self.interpolator is not None:
+            self.interpolator.Capture(self.world)
+        stepDt = self.dt / self.substeps
+        for _ in range(self.substeps):
+            if self.recorder is not None:
+                self.recorder.Step(self.world, stepDt, playerInput)
+            else:
+                self.world.Step(stepDt, playerInput)
+
+    def Advance(self, frameTime, playerInput):
+        self.accumulator += frameTime
+        ticks = 0
+        while self.accumulator >= self.dt and ticks < self.maxTicksPerAdvance:
+            self.Tick(playerInput)
+            self.accumulator -= self.dt
+            ticks += 1
+
+        # Drop whatever backlog is left rather than spiralling further behind on the next frame
+        if ticks == self.maxTicksPerAdvance:
+            self.accumulator %= self.dt
+        return ticks
+
+    def Run(self, ticks, playerInput=None):
+        playerInput = playerInput or PlayerInput()
+        for _ in range(ticks):
+            self.Tick(playerInput)
\ No newline at end of file